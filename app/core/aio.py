@@ -0,0 +1,106 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import threading
+
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from . import instrumentation
+
+
+class AsyncExecutor:
+    """
+    Runs handler coroutines on an event loop in a background thread.
+
+    Every extension gets its own concurrency limit and timeout (waiting for a free slot included),
+    so a slow upstream can't occupy the capacity of the others.
+    """
+
+    def __init__(
+            self,
+            concurrency: Optional[Dict[str, int]] = None,
+            timeouts: Optional[Dict[str, float]] = None,
+            default_concurrency: int = 4,
+            default_timeout: float = 15.0
+    ) -> None:
+        self.concurrency = concurrency or {}
+        self.timeouts = timeouts or {}
+        self.default_concurrency = default_concurrency
+        self.default_timeout = default_timeout
+
+        self._loop = asyncio.new_event_loop()
+        self._thread: Optional[threading.Thread] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._session: Any = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop.run_forever, name='async-executor',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close_session(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """ Schedules coroutine from any thread without waiting for its result """
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)  # type: ignore
+        future.add_done_callback(self._log_error)
+        return future
+
+    async def session(self) -> Any:
+        """ Shared aiohttp session, created on first use inside the loop """
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def call(self, name: str, fn: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """ Awaits `fn(*args, **kwargs)` within concurrency limit and timeout of `name` """
+        async def limited():
+            async with self._semaphore(name):
+                return await fn(*args, **kwargs)
+
+        with instrumentation.timed('external', name):
+            return await asyncio.wait_for(limited(), self.timeouts.get(name, self.default_timeout))
+
+    async def try_call(self, name: str, fn: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """ Same as `call`, but timeout or failure of the extension is logged and gives None """
+        try:
+            return await self.call(name, fn, *args, **kwargs)
+        except asyncio.TimeoutError:
+            logging.warning(f'Extension {name} timed out')
+        except Exception as err:
+            logging.error(f'Extension {name} failed: {err!r}')
+        return None
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """ Runs blocking function (e.g. Telegram API call) in the loop thread pool """
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(context.run, fn, *args, **kwargs)
+        )
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        if name not in self._semaphores:
+            limit = self.concurrency.get(name, self.default_concurrency)
+            self._semaphores[name] = asyncio.Semaphore(limit)
+        return self._semaphores[name]
+
+    async def _close_session(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @staticmethod
+    def _log_error(future: concurrent.futures.Future) -> None:
+        if not future.cancelled() and future.exception():
+            logging.error(f'Async handler failed: {future.exception()!r}')
@@ -0,0 +1,70 @@
+"""
+Registry of bot commands: parsing, dictionary based routing and per-command options.
+"""
+import re
+
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+# `/command[@botname] args`, Telegram commands are case-insensitive
+COMMAND_PATTERN = re.compile(r'/(\w+)(?:@(\w+))?')
+
+
+class Command(NamedTuple):
+    name: str
+    handler: Callable
+    hidden: bool = False  # not listed by /help
+    stats: bool = True  # usages are counted in statistics
+    always: bool = False  # handled while the bot is paused
+    admin: bool = False  # available only to admins, unknown for everybody else
+    rate: Optional[str] = 'default'  # rate limit class, None is not limited
+    order: Optional[int] = None  # position in /help, None is after ordered commands
+
+
+class ParsedCommand(NamedTuple):
+    name: str
+    args: List[str]
+    command: Optional[Command]  # None for unknown command
+
+
+class CommandRegistry:
+    """ Commands by name, every message is parsed once and routed by a dictionary lookup """
+
+    def __init__(self) -> None:
+        self._commands: Dict[str, Command] = {}
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._commands
+
+    def add(self, name: str, handler: Callable, **options) -> Command:
+        name = name.lower()
+        assert name not in self._commands, f"Command {name} is already registered!"
+        command = self._commands[name] = Command(name, handler, **options)
+        return command
+
+    def remove(self, name: str) -> None:
+        self._commands.pop(name.lower(), None)
+
+    def get(self, name: str) -> Optional[Command]:
+        return self._commands.get(name.lower())
+
+    def visible(self) -> List[str]:
+        """ Names of commands listed by /help, by `order` and then in order of registration """
+        commands = [command for command in self._commands.values() if not command.hidden]
+        commands.sort(key=lambda command: (command.order is None, command.order or 0))
+        return [command.name for command in commands]
+
+    def parse(self, text: str, username: Optional[str] = None) -> Optional[ParsedCommand]:
+        """
+        Command and arguments of message `text`, None if it's not a command or if it's addressed
+        to another bot (`/command@otherbot` in groups).
+        """
+        match = COMMAND_PATTERN.match(text)
+        if match is None:
+            return None
+        name, addressee = match.group(1).lower(), match.group(2)
+        if addressee is not None and (not username or addressee.lower() != username.lower()):
+            return None
+        return ParsedCommand(name, text[match.end():].split(), self._commands.get(name))
@@ -0,0 +1,221 @@
+"""
+Per-command latency breakdown: total handler time, database, external APIs and Telegram calls.
+"""
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from .metrics import REGISTRY, Labels, Registry
+
+NO_COMMAND = '-'
+
+HANDLER_TIME = REGISTRY.histogram('bot_handler_seconds', 'Time spent in command handlers')
+HANDLER_ERRORS = REGISTRY.counter('bot_handler_errors_total', 'Command handlers which failed')
+DB_TIME = REGISTRY.histogram('bot_handler_db_seconds', 'Database time per handler call')
+EXTERNAL_TIME = REGISTRY.histogram('bot_handler_external_seconds',
+                                   'External API time per handler call')
+TELEGRAM_TIME = REGISTRY.histogram('bot_handler_telegram_seconds',
+                                   'Telegram Bot API time per handler call')
+QUERY_TIME = REGISTRY.histogram('bot_db_query_seconds', 'Time of single database queries')
+SLOW_QUERIES = REGISTRY.counter('bot_db_slow_queries_total', 'Queries slower than threshold')
+
+KINDS = {'db': DB_TIME, 'external': EXTERNAL_TIME, 'telegram': TELEGRAM_TIME}
+KIND_LABELS = {'external': 'extension', 'telegram': 'method'}
+
+slow_query_logger = logging.getLogger('bot.slow_query')
+
+
+class Span:
+    """ Time accumulated by one handler call, grouped by (kind, name) """
+
+    def __init__(self, command: str) -> None:
+        self.command = command
+        self.timings: Dict[Tuple[str, str], float] = {}
+
+    def add(self, kind: str, name: str, seconds: float) -> None:
+        key = (kind, name)
+        self.timings[key] = self.timings.get(key, 0.0) + seconds
+
+
+_span: ContextVar[Optional[Span]] = ContextVar('span', default=None)
+
+
+def current_command() -> str:
+    span = _span.get()
+    return span.command if span else NO_COMMAND
+
+
+@contextmanager
+def track(command: str, stage: str = 'handler') -> Iterator[Span]:
+    """
+    Measures handler call of `command`, time reported by `timed` within it is attributed to it.
+
+    Work which continues in background (jobs, coroutines) is tracked as separate `stage`.
+    """
+    span = Span(command)
+    token = _span.set(span)
+    started = time.perf_counter()
+    try:
+        yield span
+    except Exception:
+        HANDLER_ERRORS.inc(command=command, stage=stage)
+        raise
+    finally:
+        _span.reset(token)
+        HANDLER_TIME.observe(time.perf_counter() - started, command=command, stage=stage)
+        DB_TIME.observe(span.timings.pop(('db', ''), 0.0), command=command)
+        for (kind, name), seconds in span.timings.items():
+            KINDS[kind].observe(seconds, command=command, **{KIND_LABELS[kind]: name})
+
+
+async def track_async(command: str, stage: str, coro: Awaitable) -> Any:
+    """ Tracks coroutine, which runs in event loop context instead of the handler one """
+    with track(command, stage):
+        return await coro
+
+
+def record(kind: str, seconds: float, name: str = '') -> None:
+    span = _span.get()
+    if span is not None:
+        span.add(kind, name, seconds)
+    elif kind != 'db':
+        KINDS[kind].observe(seconds, command=NO_COMMAND, **{KIND_LABELS[kind]: name})
+
+
+@contextmanager
+def timed(kind: str, name: str = '') -> Iterator[None]:
+    """ Reports time of the block as `kind` ('external' or 'telegram') call of `name` """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, time.perf_counter() - started, name)
+
+
+def instrument_engine(engine: Any, slow_query_ms: float = 100.0) -> None:
+    """ Measures every query of SQLAlchemy `engine` and logs the slow ones """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        QUERY_TIME.observe(elapsed, kind=statement_kind(statement))
+        record('db', elapsed)
+        if slow_query_ms and elapsed * 1000 >= slow_query_ms:
+            SLOW_QUERIES.inc()
+            slow_query_logger.warning(
+                f'Slow query ({elapsed * 1000:.1f} ms, command {current_command()}): '
+                f'{" ".join(statement.split())[:500]}'
+            )
+
+
+def statement_kind(statement: str) -> str:
+    """ First keyword of SQL statement, tells reads and writes (insert/update/delete) apart """
+    words = statement.lstrip()[:16].split(None, 1)
+    return words[0].lower() if words else ''
+
+
+def register_stats(
+        prefix: str,
+        label: str,
+        sources: Dict[str, Callable[[], Mapping[str, float]]],
+        registry: Registry = REGISTRY
+) -> None:
+    """
+    Exposes counters of components (e.g. `cache_info()` of caches) as gauges, collected on scrape.
+
+    Every key of source dicts becomes `<prefix>_<key>` gauge, labelled `<label>="<source name>"`.
+    """
+    keys: List[str] = []
+    for stats in sources.values():
+        keys.extend(key for key in stats() if key not in keys)
+
+    def collect(key: str) -> Callable[[], Dict[Labels, float]]:
+        def values() -> Dict[Labels, float]:
+            result: Dict[Labels, float] = {}
+            for name, stats in sources.items():
+                value = stats().get(key)
+                if value is not None:
+                    result[((label, name),)] = float(value)
+            return result
+        return values
+
+    for key in keys:
+        registry.gauge(f'{prefix}_{key}', f'{key} of {label}', callback=collect(key))
+
+
+def summary() -> List[Dict[str, Any]]:
+    """ Per command and stage: calls, p50/p99 latency and average time per kind, in ms """
+    rows = []
+    for labels in HANDLER_TIME.labels():
+        params = dict(labels)
+        command = params['command']
+        rows.append({
+            'command': command,
+            'stage': params['stage'],
+            'calls': HANDLER_TIME.count(**params),
+            'p50_ms': HANDLER_TIME.quantile(0.5, **params) * 1000,
+            'p99_ms': HANDLER_TIME.quantile(0.99, **params) * 1000,
+            'db_ms': _average_ms(DB_TIME, command),
+            'external_ms': _average_ms(EXTERNAL_TIME, command),
+            'telegram_ms': _average_ms(TELEGRAM_TIME, command),
+        })
+    return rows
+
+
+def _average_ms(histogram, command: str) -> float:
+    """ Average time per tracked call of `command`, summed over all other labels """
+    total = sum(
+        histogram.total(**dict(labels)) for labels in histogram.labels()
+        if dict(labels).get('command') == command
+    )
+    return total / max(DB_TIME.count(command=command), 1) * 1000
+
+
+class MetricsServer:
+    """ Serves `registry` in Prometheus text format on `GET /metrics` """
+
+    def __init__(self, port: int, host: str = '0.0.0.0', registry: Registry = REGISTRY) -> None:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
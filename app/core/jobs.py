@@ -0,0 +1,222 @@
+"""
+Scheduler which runs heavy handlers on dedicated worker pools.
+"""
+import itertools
+import logging
+import threading
+import time
+
+from collections import deque, OrderedDict
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+from .metrics import REGISTRY
+
+QUEUE_DEPTH = REGISTRY.gauge('bot_jobs_queue_depth', 'Jobs waiting for a worker')
+WAIT_TIME = REGISTRY.histogram('bot_jobs_wait_seconds', 'Time jobs spent in queue')
+EXECUTION_TIME = REGISTRY.histogram('bot_jobs_execution_seconds', 'Time jobs spent running')
+EXPIRED = REGISTRY.counter('bot_jobs_expired_total', 'Jobs dropped after their deadline')
+REJECTED = REGISTRY.counter('bot_jobs_rejected_total', 'Jobs rejected because queue was full')
+
+
+class Job(NamedTuple):
+    user_id: int
+    fn: Callable[[], Any]
+    submitted_at: float
+    deadline: float
+    on_expired: Optional[Callable[[], Any]]
+
+
+class Lane:
+    """
+    Worker pool of one kind of jobs with a per-user fairness queue.
+
+    Every user has own FIFO queue, workers take jobs from users in round-robin order, so a user
+    who sent a dozen commands doesn't delay everybody else. Lane can be resized while it runs,
+    surplus workers quit once they finish their current job.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int) -> None:
+        assert workers > 0, "Lane must have at least one worker!"
+        self.name = name
+        self.max_queue = max_queue
+        self._queues: OrderedDict = OrderedDict()  # user id -> deque of jobs
+        self._size = 0
+        self._running = 0
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._workers = 0
+        self._threads: List[threading.Thread] = []
+        self._numbers = itertools.count()
+        self.resize(workers)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    @property
+    def busy(self) -> bool:
+        """ Whether a job put now would wait for a worker """
+        with self._condition:
+            return self._size + self._running >= self._workers
+
+    def resize(self, workers: int) -> None:
+        assert workers > 0, "Lane must have at least one worker!"
+        with self._condition:
+            self._workers = workers
+            while len(self._threads) < workers:
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name=f'jobs-{self.name}-{next(self._numbers)}')
+                self._threads.append(thread)
+                thread.start()
+            self._condition.notify_all()
+
+    def put(self, job: Job) -> bool:
+        with self._condition:
+            if self._stopped or self._size >= self.max_queue:
+                return False
+            queue: Deque[Job] = self._queues.setdefault(job.user_id, deque())
+            queue.append(job)
+            self._size += 1
+            QUEUE_DEPTH.set(self._size, lane=self.name)
+            self._condition.notify()
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _take(self) -> Optional[Job]:
+        with self._condition:
+            while not self._size and not self._stopped and not self._surplus():
+                self._condition.wait()
+            if self._surplus():
+                self._threads.remove(threading.current_thread())
+                return None
+            if not self._size:
+                return None
+            user_id, queue = self._queues.popitem(last=False)
+            job = queue.popleft()
+            if queue:
+                self._queues[user_id] = queue  # back to the end of round-robin
+            self._size -= 1
+            self._running += 1
+            QUEUE_DEPTH.set(self._size, lane=self.name)
+            return job
+
+    def _surplus(self) -> bool:
+        """ Whether the lane was shrunk and has more workers than it should """
+        return len(self._threads) > self._workers
+
+    def _work(self) -> None:
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            finally:
+                with self._condition:
+                    self._running -= 1
+
+    def _run(self, job: Job) -> None:
+        started = time.monotonic()
+        WAIT_TIME.observe(started - job.submitted_at, lane=self.name)
+        if started > job.deadline:
+            EXPIRED.inc(lane=self.name)
+            if job.on_expired:
+                self._call(job.on_expired)
+            return
+        self._call(job.fn)
+        EXECUTION_TIME.observe(time.monotonic() - started, lane=self.name)
+
+    def _call(self, fn: Callable[[], Any]) -> None:
+        try:
+            fn()
+        except Exception as err:
+            logging.exception(f'Job in lane {self.name} failed: {err}')
+
+
+class JobScheduler:
+    """
+    Routes heavy jobs to per-command lanes with own concurrency limit.
+
+    Jobs which waited longer than `deadline` seconds are dropped without running (a running job
+    can't be interrupted, its network calls are bounded by client timeouts).
+    """
+
+    def __init__(
+            self,
+            concurrency: Optional[Dict[str, int]] = None,
+            default_concurrency: int = 2,
+            max_queue: int = 100,
+            deadline: float = 60.0
+    ) -> None:
+        self.concurrency = concurrency or {}
+        self.default_concurrency = default_concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self._lanes: Dict[str, Lane] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+            self,
+            lane: str,
+            user_id: int,
+            fn: Callable[[], Any],
+            on_expired: Optional[Callable[[], Any]] = None,
+            deadline: Optional[float] = None
+    ) -> bool:
+        """ Queues job, returns False if lane queue is full """
+        now = time.monotonic()
+        job = Job(
+            user_id=user_id,
+            fn=fn,
+            submitted_at=now,
+            deadline=now + (self.deadline if deadline is None else deadline),
+            on_expired=on_expired,
+        )
+        if self._lane(lane).put(job):
+            return True
+        REJECTED.inc(lane=lane)
+        return False
+
+    def busy(self, lane: str) -> bool:
+        """ Whether a job submitted to `lane` now would wait in its queue """
+        return self._lane(lane).busy
+
+    def set_concurrency(self, lane: str, workers: int) -> None:
+        """ Changes concurrency of the lane, resizes it if it is running already """
+        with self._lock:
+            self.concurrency[lane] = workers
+            running = self._lanes.get(lane)
+        if running is not None and running.workers != workers:
+            logging.info(f'Lane {lane} is resized from {running.workers} to {workers} workers')
+            running.resize(workers)
+
+    def lanes(self) -> List[Lane]:
+        return list(self._lanes.values())
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        for lane in self.lanes():
+            lane.stop(timeout)
+
+    def _lane(self, name: str) -> Lane:
+        lane = self._lanes.get(name)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(name)
+                if lane is None:
+                    workers = self.concurrency.get(name, self.default_concurrency)
+                    lane = self._lanes[name] = Lane(name, workers, self.max_queue)
+        return lane
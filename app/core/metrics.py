@@ -0,0 +1,194 @@
+"""
+Minimal in-process metrics (counters, gauges, histograms) rendered in Prometheus text format.
+"""
+import bisect
+import threading
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(name: str, labels: Labels, value: float) -> str:
+    if labels:
+        pairs = ','.join(f'{k}="{v}"' for k, v in labels)
+        return f'{name}{{{pairs}}} {value:g}'
+    return f'{name} {value:g}'
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str = '') -> None:
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        return lines + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str = '') -> None:
+        super().__init__(name, documentation)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels(labels), 0)
+
+    def _samples(self) -> List[str]:
+        # copied under the lock, as handler threads may add label sets while metrics are scraped
+        with self._lock:
+            items = sorted(self._values.items())
+        return [_format(self.name, k, v) for k, v in items]
+
+
+class Gauge(Counter):
+    """ Gauge is set directly or computed by `callback` at collection time """
+    type = 'gauge'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str = '',
+            callback: Optional[Callable[[], Dict[Labels, float]]] = None
+    ) -> None:
+        super().__init__(name, documentation)
+        self._callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            return [_format(self.name, k, v) for k, v in sorted(self._callback().items())]
+        return super()._samples()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str = '',
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            data[index] += 1
+            data[-1] += value
+
+    def count(self, **labels) -> int:
+        data = self._values.get(_labels(labels))
+        return int(sum(data[:-1])) if data else 0
+
+    def total(self, **labels) -> float:
+        data = self._values.get(_labels(labels))
+        return data[-1] if data else 0.0
+
+    def quantile(self, q: float, **labels) -> float:
+        """ Upper bound of the bucket where `q` quantile falls into """
+        data = self._values.get(_labels(labels))
+        if not data:
+            return 0.0
+        rank = q * sum(data[:-1])
+        seen = 0.0
+        for bound, count in zip(self.buckets + (float('inf'),), data[:-1]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def labels(self) -> List[Labels]:
+        with self._lock:
+            return sorted(self._values)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(data)) for key, data in self._values.items())
+        lines = []
+        for key, data in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float('inf'),), data[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(_format(f'{self.name}_bucket', key + (('le', le),), cumulative))
+            lines.append(_format(f'{self.name}_sum', key, data[-1]))
+            lines.append(_format(f'{self.name}_count', key, cumulative))
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str = '') -> Counter:
+        return self._register(Counter(name, documentation))  # type: ignore
+
+    def gauge(
+            self,
+            name: str,
+            documentation: str = '',
+            callback: Optional[Callable[[], Dict[Labels, float]]] = None
+    ) -> Gauge:
+        return self._register(Gauge(name, documentation, callback))  # type: ignore
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str = '',
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))  # type: ignore
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines: List[str] = []
+        for _, metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric: Metric) -> Metric:
+        """ Metrics are registered once, later registrations return the existing one """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+
+REGISTRY = Registry()
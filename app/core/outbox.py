@@ -0,0 +1,171 @@
+"""
+Outgoing Bot API messages, delivered within flood limits without blocking handlers.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+from .ratelimit import SendLimiter
+
+THROTTLED = REGISTRY.counter('bot_send_throttled_total', 'Bot API sends delayed by send limits')
+THROTTLE_TIME = REGISTRY.histogram('bot_send_throttle_seconds', 'Time sends waited for limits')
+DROPPED = REGISTRY.counter('bot_send_dropped_total', 'Sends dropped because chat queue was full')
+
+
+class _Send:
+    __slots__ = ('call', 'future', 'queued_at')
+
+    def __init__(self, call: Callable[[], Any], future: Future, queued_at: float) -> None:
+        self.call = call
+        self.future = future
+        self.queued_at = queued_at
+
+
+class Outbox:
+    """
+    Queue of outgoing messages per chat, delivered by a sender thread.
+
+    A send goes out right away in the caller's thread if its chat has nothing queued and limits
+    allow it. Otherwise it is queued behind earlier messages of the chat and `send` returns at
+    once; the sender thread delivers every queue as soon as its chat's budget allows. So a chat
+    over its limit never holds up handlers, or messages to other chats.
+    """
+
+    def __init__(self, limiter: SendLimiter, max_queue: int = 100) -> None:
+        assert max_queue > 0, "Chat queue must hold at least one message!"
+        self.limiter = limiter
+        self.max_queue = max_queue
+        self._queues: Dict[Any, Deque[_Send]] = {}
+        # (deliver at, order, chat id) of chats whose next message isn't being delivered
+        self._ready: List[Tuple[float, int, Any]] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._deadline = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def send(self, chat_id: Any, call: Callable[[], Any]) -> Future:
+        """ Makes `call` (a Bot API request to `chat_id`) now or later, its future tells which """
+        future: Future = Future()
+        with self._condition:
+            queue = self._queues.get(chat_id)
+            wait = 0.0 if queue is not None else self.limiter.try_acquire(chat_id)
+            if queue is not None or wait:
+                self._enqueue(chat_id, _Send(call, future, time.monotonic()), wait)
+                return future
+        _deliver(call, future)
+        return future
+
+    def send_now(self, chat_id: Any, call: Callable[[], Any]) -> Optional[Future]:
+        """
+        Makes `call` only if it can go out right away, returns None instead of queueing it,
+        e.g. for a status message which is useless once it arrives late
+        """
+        with self._condition:
+            if chat_id in self._queues or self.limiter.try_acquire(chat_id):
+                return None
+        future: Future = Future()
+        _deliver(call, future)
+        return future
+
+    def info(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                'queued_chats': len(self._queues),
+                'queued': sum(len(queue) for queue in self._queues.values()),
+            }
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """ Delivers queued messages for at most `timeout` seconds, the rest are cancelled """
+        with self._condition:
+            self._stopped = True
+            self._deadline = time.monotonic() + timeout
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        with self._condition:
+            for queue in self._queues.values():
+                for send in queue:
+                    send.future.cancel()
+            self._queues.clear()
+            self._ready.clear()
+            self._thread = None
+
+    def _enqueue(self, chat_id: Any, send: _Send, wait: float) -> None:
+        scope = self.limiter.scope(chat_id)
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+            self._schedule(chat_id, send.queued_at + wait)
+        if len(queue) >= self.max_queue:
+            # like a queued one, dropped message isn't returned to the caller
+            DROPPED.inc(scope=scope)
+            logging.warning(f'Message to chat {chat_id} is dropped, its queue is full')
+            send.future.set_result(None)
+            return
+        THROTTLED.inc(scope=scope)
+        queue.append(send)
+        self._start()
+
+    def _start(self) -> None:
+        """ Sender thread starts with the first queued message """
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name='outbox-sender', daemon=True)
+            self._thread.start()
+
+    def _schedule(self, chat_id: Any, at: float) -> None:
+        heapq.heappush(self._ready, (at, next(self._order), chat_id))
+        self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                send, chat_id = self._next()
+                if send is None:
+                    return
+            _deliver(send.call, send.future)
+            if send.future.exception() is not None:
+                logging.error(f'Failed to send queued message: {send.future.exception()}')
+            THROTTLE_TIME.observe(time.monotonic() - send.queued_at,
+                                  scope=self.limiter.scope(chat_id))
+            with self._condition:
+                # removed only after delivery, so later messages of the chat can't overtake it
+                queue = self._queues[chat_id]
+                queue.popleft()
+                if queue:
+                    self._schedule(chat_id, time.monotonic())
+                else:
+                    del self._queues[chat_id]
+
+    def _next(self) -> Tuple[Any, Any]:
+        """ Waits for the next message allowed by limits, (None, None) once stopped """
+        while True:
+            now = time.monotonic()
+            if self._stopped and (not self._queues or now >= self._deadline):
+                return None, None
+            if self._ready and self._ready[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._ready)
+                wait = self.limiter.try_acquire(chat_id)
+                if not wait:
+                    return self._queues[chat_id][0], chat_id
+                self._schedule(chat_id, now + wait)
+                continue
+            timeout = self._ready[0][0] - now if self._ready else None
+            if self._stopped:
+                timeout = min(timeout or self._deadline - now, self._deadline - now)
+            self._condition.wait(timeout)
+
+
+def _deliver(call: Callable[[], Any], future: Future) -> None:
+    try:
+        future.set_result(call())
+    except Exception as err:
+        future.set_exception(err)
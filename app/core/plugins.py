@@ -0,0 +1,162 @@
+"""
+Command plugins: discovery, lazy loading and hot reload.
+
+A plugin is a module with `handle(update, context, resources)` function. Its command is
+the module name (or the name of the entry point in `bot.plugins` group, whose value is the
+module). Module may declare literal dicts:
+
+- `OPTIONS` - options of the command (see `core.commands.Command`), read from the source
+  without importing the module, e.g. `OPTIONS = {'rate': 'expensive', 'hidden': True}`
+- `RESOURCES` - what plugin needs, e.g. `{'http': 'https://random.dog', 'concurrency': 2,
+  'cache': {'maxsize': 100, 'ttl': 60}}`, resources are built by the bot on first invocation
+
+Module is imported on first invocation of its command, so the bot doesn't pay for
+dependencies of commands which are not used.
+"""
+import ast
+import importlib
+import importlib.util
+import logging
+import os
+import pkgutil
+import sys
+import threading
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from .commands import Command
+
+try:
+    from importlib.metadata import entry_points
+except ImportError:  # Python 3.7
+    entry_points = None  # type: ignore
+
+PLUGIN_GROUP = 'bot.plugins'
+OPTION_NAMES = frozenset(Command._fields) - {'name', 'handler'}
+
+
+class Resources(NamedTuple):
+    """ Resources of a plugin, passed to its `handle` """
+    gettext: Callable[[str], str]
+    http: Any = None  # keep-alive session of declared `http` base url
+    cache: Any = None  # LRU cache of declared size and ttl
+    lane: Optional[str] = None  # job lane, which limits declared `concurrency`
+
+
+class Plugin:
+    def __init__(self, name: str, module: str, options: Dict[str, Any]) -> None:
+        self.name = name
+        self.module_name = module
+        self.options = options
+        self.module: Any = None
+        self.resources: Any = None
+        self.stale = False  # module was imported before and must be reloaded
+
+    @property
+    def loaded(self) -> bool:
+        return self.module is not None
+
+
+class PluginManager:
+    """
+    Finds plugins in `package` and in entry points, imports each of them on first use.
+
+    `resources` builds resources of a plugin from its `RESOURCES` declaration.
+    """
+
+    def __init__(
+            self,
+            package: str,
+            resources: Callable[[Plugin, Dict[str, Any]], Any],
+            group: str = PLUGIN_GROUP
+    ) -> None:
+        self.package = package
+        self.group = group
+        self._resources = resources
+        self._plugins: Dict[str, Plugin] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._plugins)
+
+    def plugins(self) -> List[Plugin]:
+        return list(self._plugins.values())
+
+    def get(self, name: str) -> Optional[Plugin]:
+        return self._plugins.get(name)
+
+    def discover(self) -> List[Plugin]:
+        """ Finds plugins (without importing them), known ones are marked to be reloaded """
+        found: Dict[str, Plugin] = {}
+        # new modules were possibly added since the last scan
+        importlib.invalidate_caches()
+        for name, module in self._modules().items():
+            try:
+                plugin = Plugin(name, module, read_options(module))
+            except Exception as err:
+                logging.error(f'Plugin {name} is skipped: {err}')
+                continue
+            previous = self._plugins.get(name)
+            plugin.stale = previous is not None and (previous.loaded or previous.stale)
+            found[name] = plugin
+        with self._lock:
+            self._plugins = found
+        return self.plugins()
+
+    def load(self, name: str) -> Plugin:
+        """ Imports plugin module (reloads it after `discover`) and builds its resources """
+        plugin = self._plugins[name]
+        if plugin.loaded:
+            return plugin
+        with self._lock:
+            if not plugin.loaded:
+                if plugin.stale and plugin.module_name in sys.modules:
+                    module = importlib.reload(sys.modules[plugin.module_name])
+                else:
+                    module = importlib.import_module(plugin.module_name)
+                plugin.resources = self._resources(plugin, getattr(module, 'RESOURCES', {}))
+                plugin.module = module
+                logging.info(f'Plugin {name} loaded from {plugin.module_name}')
+        return plugin
+
+    def call(self, name: str, update: Any, context: Any) -> Any:
+        plugin = self.load(name)
+        return plugin.module.handle(update, context, plugin.resources)
+
+    def info(self) -> Dict[str, int]:
+        plugins = self.plugins()
+        return {'discovered': len(plugins), 'loaded': sum(p.loaded for p in plugins)}
+
+    def _modules(self) -> Dict[str, str]:
+        """ Command name -> module of every plugin, entry points override package modules """
+        modules = {}
+        package = importlib.import_module(self.package)
+        for info in pkgutil.iter_modules(package.__path__):
+            if not info.name.startswith('_'):
+                modules[info.name] = f'{self.package}.{info.name}'
+        if entry_points is not None:
+            # `select` appeared in Python 3.10, earlier versions return dict of groups
+            found: Any = entry_points()
+            group = found.select(group=self.group) if hasattr(found, 'select') \
+                else found.get(self.group, [])
+            for entry_point in group:
+                modules[entry_point.name] = entry_point.value.split(':')[0]
+        return modules
+
+
+def read_options(module: str) -> Dict[str, Any]:
+    """ Literal `OPTIONS` dict of `module`, parsed from its source """
+    spec = importlib.util.find_spec(module)
+    if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+        raise ImportError(f'No source of module {module}')
+    with open(spec.origin, 'rb') as source:
+        tree = ast.parse(source.read(), spec.origin)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == 'OPTIONS' for target in node.targets
+        ):
+            options = ast.literal_eval(node.value)
+            unknown = set(options) - OPTION_NAMES
+            assert not unknown, f"Unknown options {', '.join(sorted(unknown))}!"
+            return options
+    return {}
@@ -0,0 +1,173 @@
+"""
+Token bucket rate limits of incoming commands and of outgoing Bot API messages.
+"""
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional
+
+from .metrics import REGISTRY
+
+REJECTED = REGISTRY.counter('bot_ratelimit_rejected_total', 'Commands rejected by rate limit')
+
+
+class Limit(NamedTuple):
+    rate: float  # tokens per second
+    burst: float  # bucket capacity
+
+
+def parse_limit(value: str) -> Limit:
+    """ `<count>/<seconds>[:<burst>]`, e.g. `5/60:3`, burst defaults to count """
+    rate, _, burst = value.partition(':')
+    count, _, seconds = rate.partition('/')
+    assert float(seconds or 1) > 0, f"Invalid limit {value}!"
+    return Limit(float(count) / float(seconds or 1), float(burst or count))
+
+
+class TokenBucket:
+    """ Bucket refilled by `rate` tokens per second up to `burst`, starts full """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated_at', 'notified')
+
+    def __init__(self, limit: Limit, now: float) -> None:
+        self.rate, self.burst = limit
+        self.tokens = self.burst
+        self.updated_at = now
+        self.notified = False
+
+    def take(self, now: float, amount: float = 1) -> float:
+        """ Takes `amount` tokens, returns 0 or seconds until they are available (nothing taken) """
+        wait = self.wait(now, amount)
+        if not wait:
+            self.tokens -= amount
+        return wait
+
+    def wait(self, now: float, amount: float = 1) -> float:
+        """ Seconds until `amount` tokens are available, nothing is taken """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate else float('inf')
+
+
+class RateLimiter:
+    """
+    Token bucket per key (e.g. user and class of command), every check is O(1).
+
+    Memory is bounded by `max_buckets`: least recently used buckets are evicted. A bucket idle for
+    `burst / rate` seconds is full anyway, so eviction only forgives users active that recently.
+    """
+
+    def __init__(self, limits: Dict[str, Limit], max_buckets: int = 10000) -> None:
+        assert max_buckets > 0, "Rate limiter must keep at least one bucket!"
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self.evictions = 0
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, key: Hashable, kind: str = 'default') -> bool:
+        """ Takes a token of `key`, kinds without configured limit are not limited """
+        limit = self.limits.get(kind)
+        if limit is None:
+            return True
+        with self._lock:
+            bucket = self._bucket((kind, key), limit)
+            allowed = not bucket.take(time.monotonic())
+            if allowed:
+                bucket.notified = False
+        if not allowed:
+            REJECTED.inc(kind=kind)
+        return allowed
+
+    def should_notify(self, key: Hashable, kind: str = 'default') -> bool:
+        """ True for the first rejection of `key` since its last allowed call """
+        with self._lock:
+            bucket = self._buckets.get((kind, key))
+            if bucket is None or bucket.notified:
+                return False
+            bucket.notified = True
+            return True
+
+    def info(self) -> Dict[str, int]:
+        return {'size': len(self._buckets), 'evictions': self.evictions}
+
+    def _bucket(self, key: Hashable, limit: Limit) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(limit, time.monotonic())
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+
+class SendLimiter:
+    """
+    Bot API flood limits of outgoing messages, never blocks (see `core.outbox.Outbox`).
+
+    Every send takes a token from the chat bucket (groups have a lower limit) and from the global
+    bucket.
+    """
+
+    def __init__(
+            self,
+            chat: Limit = Limit(1.0, 3.0),
+            group: Limit = Limit(20 / 60, 5.0),
+            total: Limit = Limit(30.0, 30.0),
+            max_chats: int = 10000
+    ) -> None:
+        self.chat = chat
+        self.group = group
+        self.max_chats = max_chats
+        self.evictions = 0
+        self._total = TokenBucket(total, time.monotonic())
+        self._chats: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, chat_id: Any) -> float:
+        """
+        Takes tokens for a message to `chat_id` if both limits allow it now and returns 0,
+        otherwise returns seconds until they will (nothing is taken)
+        """
+        with self._lock:
+            now = time.monotonic()
+            chat = self._chat(chat_id, now)
+            wait = max(chat.wait(now), self._total.wait(now))
+            if not wait:
+                chat.take(now)
+                self._total.take(now)
+        return wait
+
+    def scope(self, chat_id: Any) -> str:
+        """ Label of the limit applied to `chat_id` """
+        return 'group' if self._is_group(chat_id) else 'chat'
+
+    def info(self) -> Dict[str, int]:
+        return {'size': len(self._chats), 'evictions': self.evictions}
+
+    def _chat(self, chat_id: Any, now: float) -> TokenBucket:
+        bucket: Optional[TokenBucket] = self._chats.get(chat_id)
+        if bucket is None:
+            limit = self.group if self._is_group(chat_id) else self.chat
+            bucket = self._chats[chat_id] = TokenBucket(limit, now)
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    @staticmethod
+    def _is_group(chat_id: Any) -> bool:
+        # ids of groups and channels are negative, @channelusername is a channel as well
+        if isinstance(chat_id, str) and not chat_id.lstrip('-').isdigit():
+            return True
+        return int(chat_id) < 0
@@ -0,0 +1,111 @@
+"""
+Distribution of updates between worker processes.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import REGISTRY
+
+ROUTED = REGISTRY.counter('bot_shard_updates_total', 'Updates routed to worker processes')
+RESTARTS = REGISTRY.counter('bot_shard_restarts_total', 'Worker processes restarted')
+
+CHAT_UPDATES = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+
+
+def shard_key(update: Dict[str, Any]) -> int:
+    """ Chat id of the update, so all updates of a chat go to the same worker """
+    for field in CHAT_UPDATES:
+        if field in update:
+            return update[field]['chat']['id']
+    for value in update.values():
+        if isinstance(value, dict):
+            message = value.get('message')
+            if isinstance(message, dict) and 'chat' in message:
+                return message['chat']['id']
+            if 'from' in value:
+                return value['from']['id']
+    return update.get('update_id', 0)
+
+
+class ShardRouter:
+    """
+    Routes updates to `workers` processes by chat id, so updates of one chat are handled
+    in order by the same process while different chats use all CPU cores.
+
+    Every worker runs `target(index, queue)` and reads updates from its own bounded queue
+    until it gets None. `put` blocks while the queue of the shard is full.
+    """
+
+    def __init__(
+            self,
+            target: Callable[[int, Any], None],
+            workers: int,
+            max_queue: int = 1000
+    ) -> None:
+        assert workers > 0, "Router must have at least one worker!"
+        self.target = target
+        self.workers = workers
+        self.max_queue = max_queue
+        # fresh interpreters, so workers don't inherit threads and connections of ingress
+        self._context = multiprocessing.get_context('spawn')
+        self._queues: List[Any] = []
+        self._processes: List[Any] = []
+
+    def start(self) -> None:
+        self._queues = [self._context.Queue(self.max_queue) for _ in range(self.workers)]
+        self._processes = [self._spawn(index) for index in range(self.workers)]
+
+    def put(self, update: Dict[str, Any], timeout: Optional[float] = None) -> bool:
+        """ Queues update for its shard, returns False if it wasn't queued within `timeout` """
+        index = shard_key(update) % self.workers
+        if not self._processes[index].is_alive():
+            logging.error(f'Worker {index} exited with code {self._processes[index].exitcode}')
+            RESTARTS.inc(worker=index)
+            self._processes[index] = self._spawn(index)
+        try:
+            self._queues[index].put(update, timeout=timeout)
+        except queue.Full:
+            return False
+        ROUTED.inc(worker=index)
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """ Lets workers handle queued updates and exit, kills the ones which didn't in time """
+        for worker_queue in self._queues:
+            worker_queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._processes = []
+        self._queues = []
+
+    def _spawn(self, index: int) -> Any:
+        process = self._context.Process(target=self.target, args=(index, self._queues[index]),
+                                        name=f'bot-worker-{index}')
+        process.start()
+        return process
+
+
+def consume(updates: Any, handle: Callable[[Dict[str, Any]], None]) -> None:
+    """ Worker loop, returns on None or when the ingress process is gone """
+    parent = os.getppid()
+    while True:
+        try:
+            update = updates.get(timeout=1)
+        except queue.Empty:
+            if os.getppid() != parent:
+                logging.error('Ingress process is gone, worker exits')
+                return
+            continue
+        if update is None:
+            return
+        try:
+            handle(update)
+        except Exception as err:
+            logging.exception(f'Failed to handle update: {err}')
@@ -0,0 +1,116 @@
+"""
+Coalescing of identical concurrent calls (single-flight).
+"""
+import asyncio
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from .metrics import REGISTRY
+
+CALLS = REGISTRY.counter('bot_singleflight_calls_total', 'Calls which were actually executed')
+DEDUPLICATED = REGISTRY.counter('bot_singleflight_deduplicated_total',
+                                'Calls which received result of another call')
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Any = None
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time, concurrent callers with the same key wait for its result.
+
+    Result (or error) is also shared with callers arriving within `window` seconds after the call
+    finished. Threads and coroutines (of a single event loop) are coalesced separately.
+    """
+
+    def __init__(self, name: str, window: float = 0.0) -> None:
+        self.name = name
+        self.window = window
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        # key -> (expires at, call), ordered by expiration
+        self._recent: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """ Result of `fn` and whether it was shared by another caller """
+        with self._lock:
+            shared = self._recent_call(key) or self._calls.get(key)
+            if shared is None:
+                call = self._calls[key] = _Call()
+        if shared is not None:
+            DEDUPLICATED.inc(flight=self.name)
+            shared.done.wait()
+            return self._result(shared), True
+
+        CALLS.inc(flight=self.name)
+        try:
+            call.result = fn()
+        except Exception as err:
+            call.error = err
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self._remember(key, call)
+            call.done.set()
+        return self._result(call), False
+
+    async def do_async(self, key: Hashable, coro_fn: Callable[[], Awaitable]) -> Tuple[Any, bool]:
+        """ Coroutine variant of `do`, `coro_fn` creates the coroutine of the leader """
+        with self._lock:
+            call = self._recent_call(key)
+        if call is not None:
+            DEDUPLICATED.inc(flight=self.name)
+            return self._result(call), True
+        task = self._tasks.get(key)
+        if task is not None:
+            DEDUPLICATED.inc(flight=self.name)
+            # waiter being cancelled must not cancel the call of the others
+            return await asyncio.shield(task), True
+
+        CALLS.inc(flight=self.name)
+        task = self._tasks[key] = asyncio.ensure_future(coro_fn())
+        try:
+            return await asyncio.shield(task), False
+        finally:
+            del self._tasks[key]
+            if task.done() and not task.cancelled():
+                call = _Call()
+                call.error = task.exception()
+                if call.error is None:
+                    call.result = task.result()
+                with self._lock:
+                    self._remember(key, call)
+
+    def __len__(self) -> int:
+        return len(self._calls) + len(self._tasks)
+
+    def _recent_call(self, key: Hashable) -> Optional[_Call]:
+        now = time.monotonic()
+        while self._recent:
+            oldest = next(iter(self._recent))
+            if self._recent[oldest][0] > now:
+                break
+            del self._recent[oldest]
+        item = self._recent.get(key)
+        return item[1] if item else None
+
+    def _remember(self, key: Hashable, call: _Call) -> None:
+        if self.window > 0:
+            self._recent.pop(key, None)
+            self._recent[key] = (time.monotonic() + self.window, call)
+
+    @staticmethod
+    def _result(call: _Call) -> Any:
+        if call.error is not None:
+            raise call.error
+        return call.result
@@ -0,0 +1,99 @@
+"""
+Cold start helpers: lazily imported modules, background warmup and report of startup phases.
+"""
+import importlib
+import logging
+import threading
+import time
+import types
+
+from typing import Any, Callable, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+STARTUP_TIME = REGISTRY.gauge('bot_startup_seconds', 'Time spent in startup phases')
+WARMUP_TIME = REGISTRY.gauge('bot_warmup_seconds', 'Time spent in background warmup tasks')
+
+
+class LazyModule(types.ModuleType):
+    """ Proxy which imports module `name` on first attribute access, e.g. first use of a command """
+
+    def __getattr__(self, attr: str) -> Any:
+        # import lock makes concurrent first accesses safe, later ones hit sys.modules
+        return getattr(importlib.import_module(self.__name__), attr)
+
+
+def lazy_import(name: str) -> Any:
+    return LazyModule(name)
+
+
+class StartupReport:
+    """ Splits time from process start (import of this module) until bot is ready into phases """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self._last = self.started
+        self._reported = False
+
+    def mark(self, phase: str) -> None:
+        """ Records time since previous mark as `phase` """
+        now = time.perf_counter()
+        if not self._reported:
+            self.phases.append((phase, now - self._last))
+            STARTUP_TIME.set(now - self._last, phase=phase)
+        self._last = now
+
+    def report(self) -> None:
+        """ Logs the breakdown once, when the bot starts to receive updates """
+        if self._reported:
+            return
+        self._reported = True
+        total = self._last - self.started
+        STARTUP_TIME.set(total, phase='total')
+        phases = ', '.join(f'{phase} {seconds * 1000:.0f} ms' for phase, seconds in self.phases)
+        logging.info(f'Started in {total * 1000:.0f} ms: {phases}')
+
+
+REPORT = StartupReport()
+
+
+class Warmup:
+    """
+    Runs tasks (connections, clients, caches) in a background thread after `delay` seconds,
+    so they don't compete for CPU with updates queued while the bot was down.
+    """
+
+    def __init__(self, delay: float = 1.0) -> None:
+        self.delay = delay
+        self._tasks: List[Tuple[str, Callable[[], Any]]] = []
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, name: str, task: Callable[[], Any]) -> None:
+        self._tasks.append((name, task))
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        if self._stopped.wait(self.delay):
+            return
+        for name, task in self._tasks:
+            if self._stopped.is_set():
+                return
+            started = time.perf_counter()
+            try:
+                task()
+            except Exception as err:
+                logging.warning(f'Warmup of {name} failed: {err}')
+            WARMUP_TIME.set(time.perf_counter() - started, task=name)
+        logging.info('Warmup finished')
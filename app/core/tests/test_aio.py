@@ -0,0 +1,68 @@
+"""
+Unittests for async executor.
+"""
+import asyncio
+from unittest import TestCase
+
+from app.core.aio import AsyncExecutor
+
+
+class TestAsyncExecutor(TestCase):
+    """ Unit tests for Async Executor"""
+
+    def setUp(self):
+        self.executor = AsyncExecutor(
+            concurrency={'slow': 2},
+            timeouts={'slow': 0.2},
+            default_timeout=1.0,
+        )
+        self.executor.start()
+        self.running = 0
+        self.max_running = 0
+
+    def tearDown(self):
+        self.executor.stop()
+
+    async def _work(self, delay):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(delay)
+        self.running -= 1
+        return delay
+
+    def test_concurrency_limit(self):
+        """ Tests extension never runs more calls than its limit """
+        futures = [
+            self.executor.submit(self.executor.call('slow', self._work, 0.05))
+            for _ in range(6)
+        ]
+        self.assertEqual([0.05] * 6, [f.result(timeout=1) for f in futures])
+        self.assertEqual(2, self.max_running)
+
+    def test_timeout(self):
+        """ Tests slow extension is cancelled without affecting others """
+        slow = self.executor.submit(self.executor.call('slow', self._work, 5))
+        fast = self.executor.submit(self.executor.call('fast', self._work, 0.01))
+
+        self.assertEqual(0.01, fast.result(timeout=1))
+        with self.assertRaises(asyncio.TimeoutError):
+            slow.result(timeout=1)
+
+    def test_try_call(self):
+        """ Tests timeout or failure of extension gives None instead of exception """
+        async def fail():
+            raise ValueError('bad json')
+
+        with self.assertLogs(level='WARNING'):
+            slow = self.executor.submit(self.executor.try_call('slow', self._work, 5))
+            self.assertIsNone(slow.result(timeout=1))
+        with self.assertLogs(level='ERROR'):
+            failed = self.executor.submit(self.executor.try_call('broken', fail))
+            self.assertIsNone(failed.result(timeout=1))
+        fast = self.executor.submit(self.executor.try_call('fast', self._work, 0.01))
+        self.assertEqual(0.01, fast.result(timeout=1))
+
+    def test_run_blocking(self):
+        """ Tests blocking function runs in thread pool """
+        future = self.executor.submit(self.executor.run_blocking(sum, [1, 2, 3]))
+        self.assertEqual(6, future.result(timeout=1))
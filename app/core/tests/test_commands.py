@@ -0,0 +1,51 @@
+"""
+Unittests for command registry.
+"""
+from unittest import TestCase
+
+from app.core.commands import CommandRegistry
+
+
+class TestCommandRegistry(TestCase):
+    """ Unit tests for command registry"""
+
+    def setUp(self):
+        self.commands = CommandRegistry()
+        self.ping = self.commands.add('ping', print)
+        self.shot = self.commands.add('Shot', print, rate='expensive')
+        self.bye = self.commands.add('bye', print, hidden=True, always=True)
+
+    def test_parse(self):
+        """ Tests command and arguments are parsed, names are case-insensitive """
+        parsed = self.commands.parse('/ping')
+        self.assertEqual(('ping', [], self.ping), parsed)
+
+        parsed = self.commands.parse('/SHOT  https://example.com/a/b ')
+        self.assertEqual(('shot', ['https://example.com/a/b'], self.shot), parsed)
+        self.assertEqual('expensive', self.shot.rate)
+
+        parsed = self.commands.parse('/nope 1')
+        self.assertEqual(('nope', ['1'], None), parsed)
+        self.assertIsNone(self.commands.parse('ping'))
+
+    def test_addressee(self):
+        """ Tests commands addressed to other bots are ignored """
+        self.assertEqual(('ping', [], self.ping), self.commands.parse('/ping@Bot', 'bot'))
+        self.assertEqual(('ping', ['1'], self.ping), self.commands.parse('/ping@bot 1', 'bot'))
+        self.assertIsNone(self.commands.parse('/ping@other_bot', 'bot'))
+        self.assertIsNone(self.commands.parse('/ping@bot'))
+
+    def test_registration(self):
+        """ Tests visible commands keep order of registration and names are unique """
+        self.assertEqual(['ping', 'shot'], self.commands.visible())
+        self.assertTrue('PING' in self.commands)
+        self.assertEqual(self.bye, self.commands.get('BYE'))
+        with self.assertRaises(AssertionError):
+            self.commands.add('Ping', print)
+
+    def test_help_order(self):
+        """ Tests explicit order of commands in /help goes before order of registration """
+        self.commands.add('say', print, order=2)
+        self.commands.add('help', print, order=1)
+
+        self.assertEqual(['help', 'say', 'ping', 'shot'], self.commands.visible())
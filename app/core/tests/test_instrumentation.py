@@ -0,0 +1,105 @@
+"""
+Unittests for handler instrumentation.
+"""
+import time
+import urllib.request
+
+from unittest import TestCase
+
+from sqlalchemy import create_engine, text
+
+from app.core import instrumentation
+from app.core.instrumentation import MetricsServer
+from app.core.metrics import Registry
+
+
+class TestTrack(TestCase):
+    """ Unit tests for per-command timings"""
+
+    def test_breakdown(self):
+        """ Tests time of external and telegram calls is attributed to the command """
+        with instrumentation.track('test_breakdown'):
+            self.assertEqual('test_breakdown', instrumentation.current_command())
+            with instrumentation.timed('external', 'dog_photo'):
+                time.sleep(0.01)
+            with instrumentation.timed('telegram', 'sendPhoto'):
+                pass
+
+        self.assertEqual('-', instrumentation.current_command())
+        self.assertEqual(
+            1, instrumentation.HANDLER_TIME.count(command='test_breakdown', stage='handler')
+        )
+        self.assertEqual(1, instrumentation.DB_TIME.count(command='test_breakdown'))
+        self.assertGreaterEqual(
+            instrumentation.EXTERNAL_TIME.total(command='test_breakdown', extension='dog_photo'),
+            0.01
+        )
+        self.assertEqual(
+            1, instrumentation.TELEGRAM_TIME.count(command='test_breakdown', method='sendPhoto')
+        )
+
+        row = [r for r in instrumentation.summary() if r['command'] == 'test_breakdown'][0]
+        self.assertEqual(1, row['calls'])
+        self.assertGreaterEqual(row['external_ms'], 10)
+
+    def test_errors(self):
+        """ Tests failed handlers are counted and still timed """
+        with self.assertRaises(ValueError):
+            with instrumentation.track('test_errors', 'job'):
+                raise ValueError()
+
+        self.assertEqual(
+            1, instrumentation.HANDLER_ERRORS.value(command='test_errors', stage='job')
+        )
+        self.assertEqual(1, instrumentation.HANDLER_TIME.count(command='test_errors', stage='job'))
+
+
+class TestInstrumentEngine(TestCase):
+    """ Unit tests for query instrumentation"""
+
+    def test_slow_queries(self):
+        """ Tests queries are timed per command and slow ones are logged """
+        engine = create_engine('sqlite:///:memory:')
+        instrumentation.instrument_engine(engine, slow_query_ms=0.000001)
+        slow = instrumentation.SLOW_QUERIES.value()
+        selects = instrumentation.QUERY_TIME.count(kind='select')
+
+        with self.assertLogs('bot.slow_query') as logs:
+            with instrumentation.track('test_slow_queries'):
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT 1'))
+
+        self.assertIn('command test_slow_queries', logs.output[0])
+        self.assertIn('SELECT 1', logs.output[0])
+        self.assertGreater(instrumentation.SLOW_QUERIES.value(), slow)
+        self.assertGreater(instrumentation.DB_TIME.total(command='test_slow_queries'), 0)
+        self.assertEqual(selects + 1, instrumentation.QUERY_TIME.count(kind='select'))
+        self.assertEqual('insert', instrumentation.statement_kind('\n  INSERT INTO users'))
+
+
+class TestMetricsServer(TestCase):
+    """ Unit tests for metrics endpoint"""
+
+    def test_scrape(self):
+        """ Tests registry with component stats is served on /metrics """
+        registry = Registry()
+        stats = {'hits': 3, 'misses': 1}
+        instrumentation.register_stats('cache', 'cache', {
+            'users': lambda: stats,
+            'audio': lambda: {'hits': 5, 'bytes': 10},
+        }, registry=registry)
+        stats['hits'] = 4
+
+        server = MetricsServer(0, host='127.0.0.1', registry=registry)
+        server.start()
+        try:
+            url = f'http://127.0.0.1:{server.port}/metrics'
+            with urllib.request.urlopen(url) as response:
+                body = response.read().decode('utf-8')
+        finally:
+            server.stop()
+
+        self.assertIn('cache_hits{cache="users"} 4', body)
+        self.assertIn('cache_hits{cache="audio"} 5', body)
+        self.assertIn('cache_bytes{cache="audio"} 10', body)
+        self.assertNotIn('cache_bytes{cache="users"}', body)
@@ -0,0 +1,99 @@
+"""
+Unittests for job scheduler.
+"""
+import threading
+import time
+from functools import partial
+from unittest import TestCase
+
+from app.core.jobs import JobScheduler, EXPIRED
+
+
+class TestJobScheduler(TestCase):
+    """ Unit tests for Job Scheduler"""
+
+    def setUp(self):
+        self.scheduler = JobScheduler(concurrency={'say': 1}, max_queue=10, deadline=5)
+        self.done = []
+        self.gate = threading.Event()
+
+    def tearDown(self):
+        self.gate.set()
+        self.scheduler.stop(timeout=1)
+
+    def _block(self):
+        self.scheduler.submit('say', 0, self.gate.wait)
+        time.sleep(0.05)  # let the only worker pick it up
+
+    def _wait(self, count):
+        deadline = time.monotonic() + 2
+        while len(self.done) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_fairness(self):
+        """ Tests users are served in round-robin order """
+        self._block()
+        for n in range(3):
+            self.scheduler.submit('say', 1, partial(self.done.append, ('spammer', n)))
+        self.scheduler.submit('say', 2, lambda: self.done.append(('user', 0)))
+
+        self.gate.set()
+        self._wait(4)
+        self.assertEqual(
+            [('spammer', 0), ('user', 0), ('spammer', 1), ('spammer', 2)],
+            self.done
+        )
+
+    def test_queue_limit(self):
+        """ Tests jobs over queue size are rejected """
+        self._block()
+        results = [self.scheduler.submit('say', 1, lambda: None) for _ in range(11)]
+
+        self.assertEqual([True] * 10 + [False], results)
+
+    def test_busy(self):
+        """ Tests lane is busy only while a new job would wait for a worker """
+        self.assertFalse(self.scheduler.busy('say'))
+        self._block()
+        self.assertTrue(self.scheduler.busy('say'))
+        self.assertFalse(self.scheduler.busy('screenshot'))
+
+        self.gate.set()
+        time.sleep(0.05)
+        self.assertFalse(self.scheduler.busy('say'))
+
+    def test_deadline(self):
+        """ Tests expired jobs are not executed """
+        expired_before = EXPIRED.value(lane='say')
+        self._block()
+        self.scheduler.submit('say', 1, lambda: self.done.append('run'),
+                              on_expired=lambda: self.done.append('expired'), deadline=0.01)
+        time.sleep(0.05)
+
+        self.gate.set()
+        self._wait(1)
+        self.assertEqual(['expired'], self.done)
+        self.assertEqual(expired_before + 1, EXPIRED.value(lane='say'))
+
+    def test_lanes_are_independent(self):
+        """ Tests busy lane doesn't block others """
+        self._block()
+        self.scheduler.submit('screenshot', 1, lambda: self.done.append('shot'))
+
+        self._wait(1)
+        self.assertEqual(['shot'], self.done)
+
+    def test_set_concurrency(self):
+        """ Tests running lane is resized """
+        self._block()
+        self.scheduler.set_concurrency('say', 2)
+        self.scheduler.submit('say', 1, lambda: self.done.append('more'))
+        self._wait(1)
+        self.assertEqual(['more'], self.done)
+
+        self.scheduler.set_concurrency('say', 1)
+        self.gate.set()
+        time.sleep(0.05)
+        lane = self.scheduler.lanes()[0]
+        self.assertEqual(1, lane.workers)
+        self.assertEqual(1, len(lane._threads))
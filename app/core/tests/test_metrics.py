@@ -0,0 +1,62 @@
+"""
+Unittests for metrics registry.
+"""
+import threading
+from unittest import TestCase
+
+from app.core.metrics import Registry
+
+
+class TestMetrics(TestCase):
+    """ Unit tests for metrics"""
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter('calls_total', 'Calls')
+        counter.inc(cmd='ping')
+        counter.inc(2, cmd='ping')
+
+        self.assertEqual(3, counter.value(cmd='ping'))
+        self.assertIs(counter, self.registry.counter('calls_total'))
+        self.assertIn('calls_total{cmd="ping"} 3', self.registry.render())
+
+    def test_gauge_callback(self):
+        self.registry.gauge('depth', 'Depth', callback=lambda: {(('queue', 'dog'),): 7})
+
+        self.assertIn('depth{queue="dog"} 7', self.registry.render())
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, cmd='ping')
+
+        self.assertEqual(4, histogram.count(cmd='ping'))
+        self.assertEqual(5.65, histogram.total(cmd='ping'))
+        self.assertEqual(0.1, histogram.quantile(0.5, cmd='ping'))
+        self.assertEqual(float('inf'), histogram.quantile(0.99, cmd='ping'))
+
+        rendered = self.registry.render()
+        self.assertIn('latency_seconds_bucket{cmd="ping",le="0.1"} 2', rendered)
+        self.assertIn('latency_seconds_bucket{cmd="ping",le="1"} 3', rendered)
+        self.assertIn('latency_seconds_bucket{cmd="ping",le="+Inf"} 4', rendered)
+        self.assertIn('latency_seconds_count{cmd="ping"} 4', rendered)
+
+    def test_render_while_adding_labels(self):
+        """ Tests scrape doesn't fail while other threads add new label sets """
+        counter = self.registry.counter('calls_total', 'Calls')
+        histogram = self.registry.histogram('latency_seconds', 'Latency')
+
+        def add():
+            for n in range(5000):
+                counter.inc(user=n)
+                histogram.observe(0.01, user=n)
+
+        thread = threading.Thread(target=add)
+        thread.start()
+        while thread.is_alive():
+            self.registry.render()
+        thread.join()
+
+        self.assertIn('calls_total{user="4999"} 1', self.registry.render())
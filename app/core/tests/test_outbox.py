@@ -0,0 +1,78 @@
+"""
+Unittests for outgoing messages queue.
+"""
+import threading
+import time
+
+from unittest import TestCase
+
+from app.core import outbox
+from app.core.outbox import Outbox
+from app.core.ratelimit import Limit, SendLimiter
+
+
+class TestOutbox(TestCase):
+    """ Unit tests for outbox"""
+
+    def setUp(self):
+        self.outbox = Outbox(SendLimiter(chat=Limit(20, 1), total=Limit(1000, 1000)), max_queue=2)
+        self.sent = []
+        self.threads = []
+
+    def tearDown(self):
+        self.outbox.stop()
+
+    def _call(self, chat_id, text):
+        def call():
+            self.sent.append((chat_id, text))
+            self.threads.append(threading.current_thread())
+            return text
+        return call
+
+    def test_send_now(self):
+        """ Tests sends within limits go out in the caller's thread """
+        future = self.outbox.send(1, self._call(1, 'a'))
+        self.assertEqual('a', future.result(0))
+        self.assertEqual([threading.current_thread()], self.threads)
+
+    def test_send_now_saturated(self):
+        """ Tests `send_now` skips message instead of queueing it while chat is over limits """
+        self.outbox.send(1, self._call(1, 'a'))
+        queued = self.outbox.send(1, self._call(1, 'b'))
+
+        self.assertIsNone(self.outbox.send_now(1, self._call(1, 'placeholder')))
+        self.assertEqual({'queued_chats': 1, 'queued': 1}, self.outbox.info())
+        other = self.outbox.send_now(2, self._call(2, 'x'))
+        self.assertIsNotNone(other)
+        if other:
+            self.assertEqual('x', other.result(0))
+
+        self.assertEqual('b', queued.result(2))
+        self.assertNotIn((1, 'placeholder'), self.sent)
+
+    def test_queue_per_chat(self):
+        """ Tests chat over its limit is queued in order, other chats are not held up """
+        self.outbox.send(1, self._call(1, 'a'))
+        started = time.monotonic()
+        second = self.outbox.send(1, self._call(1, 'b'))
+        third = self.outbox.send(1, self._call(1, 'c'))
+        other = self.outbox.send(2, self._call(2, 'x'))
+        self.assertLess(time.monotonic() - started, 0.04)
+        self.assertFalse(second.done())
+        self.assertEqual('x', other.result(0))
+
+        self.assertEqual('c', third.result(1))
+        self.assertEqual('b', second.result(0))
+        self.assertEqual([(1, 'a'), (2, 'x'), (1, 'b'), (1, 'c')], self.sent)
+        self.assertEqual({'queued_chats': 0, 'queued': 0}, self.outbox.info())
+
+    def test_full_queue(self):
+        """ Tests sends to a chat with full queue are dropped """
+        dropped = outbox.DROPPED.value(scope='chat')
+        for text in 'abc':
+            self.outbox.send(1, self._call(1, text))
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(self.outbox.send(1, self._call(1, 'd')).result(0))
+        self.assertEqual(dropped + 1, outbox.DROPPED.value(scope='chat'))
+        self.outbox.stop()
+        self.assertNotIn((1, 'd'), self.sent)
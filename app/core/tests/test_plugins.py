@@ -0,0 +1,83 @@
+"""
+Unittests for command plugins.
+"""
+import os
+import sys
+import tempfile
+
+from unittest import TestCase
+
+from app.core.plugins import PluginManager, read_options
+
+PLUGIN = '''
+OPTIONS = {'rate': 'expensive', 'hidden': True}
+RESOURCES = {'concurrency': 2}
+VERSION = %d
+
+
+def handle(update, context, resources):
+    return VERSION, resources
+'''
+
+
+class TestPluginManager(TestCase):
+    """ Unit tests for plugin manager"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.package = os.path.join(self.directory.name, 'test_plugins_package')
+        os.mkdir(self.package)
+        open(os.path.join(self.package, '__init__.py'), 'w').close()
+        self._write('echo', PLUGIN % 1)
+        sys.path.insert(0, self.directory.name)
+        self.declared = []
+        self.manager = PluginManager('test_plugins_package', self._resources)
+
+    def tearDown(self):
+        sys.path.remove(self.directory.name)
+        for name in [name for name in sys.modules if name.startswith('test_plugins_package')]:
+            del sys.modules[name]
+        self.directory.cleanup()
+
+    def _write(self, name, source):
+        with open(os.path.join(self.package, f'{name}.py'), 'w') as file:
+            file.write(source)
+
+    def _resources(self, plugin, declared):
+        self.declared.append((plugin.name, declared))
+        return 'resources'
+
+    def test_lazy_load(self):
+        """ Tests plugins are discovered without import and imported on first call """
+        plugins = self.manager.discover()
+        self.assertEqual(['echo'], [plugin.name for plugin in plugins])
+        self.assertEqual({'rate': 'expensive', 'hidden': True}, plugins[0].options)
+        self.assertNotIn('test_plugins_package.echo', sys.modules)
+        self.assertEqual({'discovered': 1, 'loaded': 0}, self.manager.info())
+
+        self.assertEqual((1, 'resources'), self.manager.call('echo', None, None))
+        self.assertEqual((1, 'resources'), self.manager.call('echo', None, None))
+        self.assertEqual([('echo', {'concurrency': 2})], self.declared)
+        self.assertEqual({'discovered': 1, 'loaded': 1}, self.manager.info())
+
+    def test_reload(self):
+        """ Tests changed plugins are reloaded, added and removed ones are picked up """
+        self.manager.discover()
+        self.manager.call('echo', None, None)
+
+        self._write('echo', PLUGIN % 22)
+        self._write('ping', 'def handle(update, context, resources):\n    return "pong"\n')
+        self.assertEqual(['echo', 'ping'], sorted(p.name for p in self.manager.discover()))
+        self.assertEqual((22, 'resources'), self.manager.call('echo', None, None))
+        self.assertEqual('pong', self.manager.call('ping', None, None))
+
+        os.remove(os.path.join(self.package, 'ping.py'))
+        self.assertEqual(['echo'], [p.name for p in self.manager.discover()])
+
+    def test_invalid_options(self):
+        """ Tests plugin with unknown options is skipped """
+        self._write('broken', "OPTIONS = {'colour': 'red'}\n")
+        with self.assertRaises(AssertionError):
+            read_options('test_plugins_package.broken')
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(['echo'], [p.name for p in self.manager.discover()])
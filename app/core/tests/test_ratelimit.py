@@ -0,0 +1,84 @@
+"""
+Unittests for rate limits.
+"""
+from unittest import TestCase
+
+from app.core import ratelimit
+from app.core.ratelimit import Limit, RateLimiter, SendLimiter, TokenBucket, parse_limit
+
+
+class TestTokenBucket(TestCase):
+    """ Unit tests for token bucket"""
+
+    def test_take(self):
+        """ Tests burst is allowed and tokens are refilled by rate """
+        bucket = TokenBucket(Limit(rate=1, burst=2), now=0)
+        self.assertEqual(0, bucket.take(0))
+        self.assertEqual(0, bucket.take(0))
+        self.assertAlmostEqual(1, bucket.take(0))
+        self.assertAlmostEqual(0.5, bucket.take(0.5))
+        self.assertEqual(0, bucket.take(1))
+        # refill is capped by burst
+        self.assertEqual(0, bucket.take(100))
+        self.assertEqual(0, bucket.take(100))
+        self.assertGreater(bucket.take(100), 0)
+
+    def test_wait(self):
+        """ Tests waiting time is computed without taking tokens """
+        bucket = TokenBucket(Limit(rate=1, burst=1), now=0)
+        self.assertEqual(0, bucket.wait(0))
+        self.assertEqual(0, bucket.take(0))
+        self.assertAlmostEqual(1, bucket.wait(0))
+        self.assertAlmostEqual(0.5, bucket.wait(0.5))
+
+    def test_parse_limit(self):
+        """ Tests limit format """
+        self.assertEqual(Limit(5 / 60, 3), parse_limit('5/60:3'))
+        self.assertEqual(Limit(5 / 60, 5), parse_limit('5/60'))
+        self.assertEqual(Limit(30, 30), parse_limit('30'))
+
+
+class TestRateLimiter(TestCase):
+    """ Unit tests for per-user rate limiter"""
+
+    def test_allow(self):
+        """ Tests users and kinds have separate buckets, rejections are counted """
+        limiter = RateLimiter({'expensive': Limit(rate=0.001, burst=2)})
+        rejected = ratelimit.REJECTED.value(kind='expensive')
+        self.assertTrue(limiter.allow(1, 'expensive'))
+        self.assertTrue(limiter.allow(1, 'expensive'))
+        self.assertFalse(limiter.allow(1, 'expensive'))
+        self.assertTrue(limiter.allow(2, 'expensive'))
+        self.assertTrue(limiter.allow(1, 'default'))
+        self.assertEqual(rejected + 1, ratelimit.REJECTED.value(kind='expensive'))
+
+    def test_should_notify(self):
+        """ Tests user is notified once per series of rejections """
+        limiter = RateLimiter({'default': Limit(rate=0.001, burst=1)})
+        self.assertTrue(limiter.allow(1))
+        self.assertFalse(limiter.allow(1))
+        self.assertTrue(limiter.should_notify(1))
+        self.assertFalse(limiter.allow(1))
+        self.assertFalse(limiter.should_notify(1))
+
+    def test_eviction(self):
+        """ Tests number of buckets is bounded """
+        limiter = RateLimiter({'default': Limit(rate=1, burst=1)}, max_buckets=10)
+        for user_id in range(100):
+            limiter.allow(user_id)
+        self.assertEqual({'size': 10, 'evictions': 90}, limiter.info())
+
+
+class TestSendLimiter(TestCase):
+    """ Unit tests for outgoing messages limiter"""
+
+    def test_try_acquire(self):
+        """ Tests sends are checked against chat and global limits without blocking """
+        limiter = SendLimiter(chat=Limit(1, 1), group=Limit(0.1, 1), total=Limit(100, 2))
+        self.assertEqual(0, limiter.try_acquire(1))
+        self.assertGreater(limiter.try_acquire(1), 0.9)
+        self.assertEqual(0, limiter.try_acquire(-100))
+        self.assertGreater(limiter.try_acquire(-100), 9)
+        # global bucket is empty now, rejected sends took nothing
+        self.assertGreater(limiter.try_acquire(2), 0)
+        self.assertEqual('group', limiter.scope('@channel'))
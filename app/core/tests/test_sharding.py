@@ -0,0 +1,54 @@
+"""
+Unittests for update sharding.
+"""
+import multiprocessing
+from functools import partial
+from unittest import TestCase
+
+from app.core.sharding import ShardRouter, consume, shard_key
+
+
+def record(results, index, updates):
+    consume(updates, lambda update: results.put((index, shard_key(update), update['update_id'])))
+
+
+def message(update_id, chat_id):
+    return {'update_id': update_id, 'message': {'chat': {'id': chat_id}, 'text': '/ping'}}
+
+
+class TestShardKey(TestCase):
+    """ Unit tests for shard key"""
+
+    def test_shard_key(self):
+        """ Tests updates are keyed by chat, then by user """
+        self.assertEqual(3, shard_key(message(1, 3)))
+        self.assertEqual(3, shard_key({
+            'update_id': 1,
+            'callback_query': {'from': {'id': 9}, 'message': {'chat': {'id': 3}}},
+        }))
+        self.assertEqual(9, shard_key({'update_id': 1, 'inline_query': {'from': {'id': 9}}}))
+        self.assertEqual(1, shard_key({'update_id': 1}))
+
+
+class TestShardRouter(TestCase):
+    """ Unit tests for Shard Router"""
+
+    def test_routing(self):
+        """ Tests updates of a chat are handled in order by the same worker """
+        results = multiprocessing.get_context('spawn').Queue()
+        router = ShardRouter(partial(record, results), workers=2)
+        router.start()
+        for update_id in range(20):
+            self.assertTrue(router.put(message(update_id, update_id % 4), timeout=5))
+        router.stop(timeout=30)
+
+        handled = [results.get(timeout=5) for _ in range(20)]
+        workers: dict = {}
+        for index, chat_id, _ in handled:
+            workers.setdefault(chat_id, set()).add(index)
+        self.assertEqual({0: {0}, 1: {1}, 2: {0}, 3: {1}}, workers)
+        for chat_id in range(4):
+            self.assertEqual(
+                list(range(chat_id, 20, 4)),
+                [update_id for _, chat, update_id in handled if chat == chat_id]
+            )
@@ -0,0 +1,82 @@
+"""
+Unittests for single-flight calls.
+"""
+import asyncio
+import threading
+import time
+
+from unittest import TestCase
+
+from app.core import singleflight
+from app.core.singleflight import SingleFlight
+
+
+class TestSingleFlight(TestCase):
+    """ Unit tests for coalescing of identical calls"""
+
+    def test_concurrent_calls(self):
+        """ Tests concurrent callers with the same key share one call """
+        flight = SingleFlight('test_concurrent')
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'file_id'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+            for _ in range(3)
+        ]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([('file_id', False)] + [('file_id', True)] * 3, results)
+        self.assertEqual(3, singleflight.DEDUPLICATED.value(flight='test_concurrent'))
+        self.assertEqual(0, len(flight))
+
+    def test_window(self):
+        """ Tests result is shared within window after the call and errors are shared too """
+        flight = SingleFlight('test_window', window=60)
+        self.assertEqual((1, False), flight.do('key', lambda: 1))
+        self.assertEqual((1, True), flight.do('key', lambda: 2))
+        self.assertEqual((3, False), flight.do('other', lambda: 3))
+
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            flight.do('error', fail)
+        with self.assertRaises(ValueError):
+            flight.do('error', lambda: 4)
+
+        self.assertEqual((1, False), SingleFlight('test_no_window').do('key', lambda: 1))
+
+    def test_async(self):
+        """ Tests concurrent coroutines with the same key share one call """
+        flight = SingleFlight('test_async')
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'file_id'
+
+        async def main():
+            return await asyncio.gather(*(flight.do_async('key', slow) for _ in range(4)))
+
+        results = asyncio.run(main())
+        self.assertEqual(1, len(calls))
+        self.assertEqual([('file_id', False)] + [('file_id', True)] * 3, results)
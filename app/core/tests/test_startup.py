@@ -0,0 +1,73 @@
+"""
+Unittests for startup helpers.
+"""
+import sys
+import threading
+
+from unittest import TestCase
+
+from app.core import startup
+
+
+class TestLazyImport(TestCase):
+    """ Unit tests for lazily imported modules"""
+
+    def test_import_on_access(self):
+        """ Tests module is imported on first attribute access only """
+        sys.modules.pop('colorsys', None)
+        module = startup.lazy_import('colorsys')
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertEqual((1, 1, 1), module.hsv_to_rgb(0, 0, 1))
+        self.assertIn('colorsys', sys.modules)
+
+
+class TestWarmup(TestCase):
+    """ Unit tests for background warmup"""
+
+    def test_tasks(self):
+        """ Tests tasks run in order and failed task doesn't stop the others """
+        done = threading.Event()
+        calls = []
+
+        def fail():
+            calls.append('fail')
+            raise ValueError('boom')
+
+        def ok():
+            calls.append('ok')
+            done.set()
+
+        warmup = startup.Warmup(delay=0)
+        warmup.add('fail', fail)
+        warmup.add('ok', ok)
+        warmup.start()
+        self.assertTrue(done.wait(5))
+        warmup.stop()
+        self.assertEqual(['fail', 'ok'], calls)
+        self.assertGreater(startup.WARMUP_TIME.value(task='ok'), 0)
+
+    def test_stop_before_delay(self):
+        """ Tests tasks are skipped when warmup is stopped during the delay """
+        calls = []
+        warmup = startup.Warmup(delay=60)
+        warmup.add('task', lambda: calls.append('task'))
+        warmup.start()
+        warmup.stop()
+        self.assertEqual([], calls)
+
+
+class TestStartupReport(TestCase):
+    """ Unit tests for startup phases"""
+
+    def test_report(self):
+        """ Tests phases are recorded until the report """
+        report = startup.StartupReport()
+        report.mark('imports')
+        report.mark('database')
+        with self.assertLogs(level='INFO') as logs:
+            report.report()
+            report.report()
+        self.assertEqual(1, len(logs.output))
+        self.assertIn('imports', logs.output[0])
+        report.mark('later')
+        self.assertEqual(['imports', 'database'], [phase for phase, _ in report.phases])
@@ -0,0 +1,71 @@
+"""
+Unittests for webhook server.
+"""
+import threading
+from unittest import TestCase
+
+import requests
+
+from app.core.webhook import SECRET_HEADER, WebhookServer
+
+
+class TestWebhookServer(TestCase):
+    """ Unit tests for Webhook Server"""
+
+    def setUp(self):
+        self.updates = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.server = WebhookServer(self._handle, port=0, secret_token='secret', max_queue=1)
+        self.server.start()
+        self.url = f'http://127.0.0.1:{self.server.port}/telegram'
+
+    def tearDown(self):
+        self.release.set()
+        self.server.stop(timeout=1)
+
+    def _handle(self, update):
+        self.started.set()
+        self.release.wait(1)
+        self.updates.append(update['update_id'])
+
+    def _post(self, update_id, secret='secret'):
+        return requests.post(self.url, json={'update_id': update_id},
+                             headers={SECRET_HEADER: secret}, timeout=1)
+
+    def test_updates_are_handled(self):
+        """ Tests queued updates are passed to handler in order """
+        for update_id in range(3):
+            self.started.clear()
+            self.assertEqual(200, self._post(update_id).status_code)
+            self.started.wait(1)
+
+        self.server.stop(timeout=1)
+        self.assertEqual([0, 1, 2], self.updates)
+
+    def test_secret_token(self):
+        """ Tests requests without valid secret token are rejected """
+        self.assertEqual(403, self._post(1, secret='wrong').status_code)
+        self.assertEqual(403, requests.post(self.url, json={}, timeout=1).status_code)
+
+        self.server.stop(timeout=1)
+        self.assertEqual([], self.updates)
+
+    def test_invalid_update(self):
+        """ Tests body which is not a JSON object is rejected """
+        response = requests.post(self.url, data=b'[1, 2]', headers={SECRET_HEADER: 'secret'},
+                                 timeout=1)
+        self.assertEqual(400, response.status_code)
+
+    def test_backpressure(self):
+        """ Tests server responds with 503 once the queue is full """
+        self.release.clear()
+        self.assertEqual(200, self._post(1).status_code)
+        self.assertTrue(self.started.wait(1))
+        self.assertEqual(200, self._post(2).status_code)
+        self.assertEqual(503, self._post(3).status_code)
+
+        self.release.set()
+        self.server.stop(timeout=1)
+        self.assertEqual([1, 2], self.updates)
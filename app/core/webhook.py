@@ -0,0 +1,135 @@
+"""
+Embedded HTTP server which receives Telegram updates pushed to the bot webhook.
+"""
+import asyncio
+import hmac
+import logging
+import queue
+import threading
+import time
+
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import REGISTRY
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+REQUESTS = REGISTRY.counter('bot_webhook_requests_total', 'Webhook requests by response status')
+QUEUE_DEPTH = REGISTRY.gauge('bot_webhook_queue_depth', 'Updates waiting for a worker')
+LATENCY = REGISTRY.histogram('bot_webhook_update_seconds', 'Time from receiving to handled update')
+
+
+class WebhookServer:
+    """
+    Accepts updates over HTTP and hands them over to `handle` on worker threads.
+
+    Requests are answered as soon as update is queued. When the queue is full the server
+    responds with 503, so Telegram redelivers the update later instead of the bot buffering
+    without a limit. Requests without valid `secret_token` header are rejected with 403.
+    """
+
+    def __init__(
+            self,
+            handle: Callable[[Dict[str, Any]], None],
+            host: str = '127.0.0.1',
+            port: int = 8443,
+            path: str = '/telegram',
+            secret_token: Optional[str] = None,
+            max_queue: int = 1000,
+            workers: int = 1
+    ) -> None:
+        assert workers > 0, "Webhook must have at least one worker!"
+        self._handle = handle
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._loop = asyncio.new_event_loop()
+        self._runner: Any = None
+        self._thread: Optional[threading.Thread] = None
+        self._workers: List[threading.Thread] = []
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        """ Starts listening, returns once the socket is bound """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop.run_forever, name='webhook-server',
+                                        daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f'webhook-worker-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """ Stops accepting updates and waits until queued ones are handled """
+        if self._thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    async def _serve(self) -> None:
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_post(self.path, self._receive)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logging.info(f'Webhook is listening on {self.host}:{self.port}{self.path}')
+
+    async def _receive(self, request) -> Any:
+        from aiohttp import web
+
+        status = 200
+        if self.secret_token and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, ''), self.secret_token):
+            status = 403
+        else:
+            try:
+                update = await request.json()
+            except ValueError:
+                update = None
+            if not isinstance(update, dict):
+                status = 400
+            else:
+                try:
+                    self._queue.put_nowait((time.monotonic(), update))
+                    QUEUE_DEPTH.set(self._queue.qsize())
+                except queue.Full:
+                    status = 503
+        REQUESTS.inc(status=status)
+        return web.Response(status=status)
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            received_at, update = item
+            QUEUE_DEPTH.set(self._queue.qsize())
+            try:
+                self._handle(update)
+            except Exception as err:
+                logging.exception(f'Failed to handle update: {err}')
+            LATENCY.observe(time.monotonic() - received_at)
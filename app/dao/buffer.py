@@ -0,0 +1,160 @@
+import logging
+import threading
+
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from .db import StatisticsDao
+from .journal import UpdateJournal
+
+
+class StatisticsBuffer:
+    """
+    Write-behind buffer for command statistics.
+
+    Usages are aggregated in memory and periodically (or when `flush_size` distinct usages are
+    pending) written to the database by a background thread in one transaction.
+
+    With `journal` every usage is journaled together with its update first. The database
+    stores position of the journal in the same transaction as usages, so after a crash
+    `recover` puts back exactly the usages which were not stored yet, and re-delivered
+    updates are never counted twice.
+    """
+
+    def __init__(
+            self,
+            statistic_dao: StatisticsDao,
+            flush_interval: float = 5.0,
+            flush_size: int = 500,
+            journal: Optional[UpdateJournal] = None,
+            journal_name: str = 'statistics'
+    ) -> None:
+        assert statistic_dao, "Statistics DAO must be not null!"
+        self._dao = statistic_dao
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.journal = journal
+        self.journal_name = journal_name
+        self._position = 0  # sequence number of the last journaled usage
+
+        self._lock = threading.Lock()
+        self._users: Dict[int, Dict[str, Optional[str]]] = {}
+        self._usages: Counter = Counter()
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._usages)
+
+    def add(
+            self,
+            user_id: int,
+            command: str,
+            username: Optional[str] = None,
+            first_name: Optional[str] = None,
+            last_name: Optional[str] = None,
+            update_id: Optional[int] = None
+    ) -> None:
+        """ Registers one usage of `command` by user, never touches the database """
+        with self._lock:
+            if self.journal is not None and update_id is not None:
+                self._position = self.journal.append(
+                    update_id, s=[user_id, command, username, first_name, last_name]
+                )
+            self._count(user_id, command, username, first_name, last_name)
+            pending = len(self._usages)
+
+        if pending >= self.flush_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """ Writes pending usages to the database, returns number of flushed usages """
+        with self._lock:
+            users, self._users = self._users, {}
+            usages, self._usages = self._usages, Counter()
+            position = self._position
+
+        if not usages:
+            return 0
+
+        try:
+            if self.journal is None:
+                self._dao.record(users, dict(usages))
+            else:
+                # usages must be on disk before the database has them, or a crash right after
+                # the flush would lose their updates and let them be counted again
+                self.journal.sync()
+                self._dao.record(users, dict(usages), (self.journal_name, position))
+                self.journal.compact(position)
+        except Exception as err:
+            logging.error(f'Failed to flush statistics: {err}')
+            self._restore(users, usages)
+            return 0
+        return sum(usages.values())
+
+    def recover(self) -> int:
+        """ Opens journal and puts back usages missing in the database, returns their number """
+        if self.journal is None:
+            return 0
+        applied = self._dao.journal_position(self.journal_name)
+        replayed = 0
+        with self._lock:
+            for record in self.journal.recover(applied):
+                if 's' in record and record['n'] > applied:
+                    self._count(*record['s'])
+                    replayed += 1
+            self._position = self.journal.sequence
+        if replayed:
+            logging.info(f'Replayed {replayed} usages from journal {self.journal.path}')
+        return replayed
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='statistics-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stops background thread and flushes everything left """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _count(
+            self,
+            user_id: int,
+            command: str,
+            username: Optional[str],
+            first_name: Optional[str],
+            last_name: Optional[str]
+    ) -> None:
+        if user_id not in self._users:
+            self._users[user_id] = {
+                'username': username,
+                'first_name': first_name,
+                'last_name': last_name,
+            }
+        self._usages[(user_id, command)] += 1
+
+    def _restore(
+            self,
+            users: Dict[int, Dict[str, Optional[str]]],
+            usages: Dict[Tuple[int, str], int]
+    ) -> None:
+        with self._lock:
+            for user_id, profile in users.items():
+                self._users.setdefault(user_id, profile)
+            self._usages.update(usages)
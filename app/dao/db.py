@@ -1,24 +1,81 @@
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import Table, create_engine, func, select
+from sqlalchemy.exc import IntegrityError
+from collections import Counter, namedtuple
 from contextlib import contextmanager
+from functools import lru_cache
+import importlib
+from itertools import groupby
+from operator import itemgetter
+import threading
+import time
 from sqlalchemy.orm import sessionmaker
 
-from .models import Base, User, Command
-from typing import Any, Dict, List, Optional
+from .cache import LRUCache
+from .profiles import engine_options, run_on_connect
+from .models import Base, User, Command, Setting, Statistics, UserTotals, CommandTotals
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+
+def _dialect_insert(dialect: str) -> Any:
+    """ `insert` of `dialect`, imported on first use as other dialects are never loaded """
+    def insert(table: Any) -> Any:
+        return importlib.import_module(f'sqlalchemy.dialects.{dialect}').insert(table)
+    return insert
+
+
+UPSERT_INSERTS: Dict[str, Any] = {
+    'sqlite': _dialect_insert('sqlite'),
+    'postgresql': _dialect_insert('postgresql'),
+}
+
+# setting with the last statistics journal record stored in the database
+JOURNAL_SETTING = 'journal:{}'
+
+
+@lru_cache(maxsize=None)
+def table_columns(entity: Any) -> Tuple[Any, ...]:
+    """ Columns of mapped `entity` class, computed once instead of inspecting every object """
+    return tuple(entity.__table__.columns)
+
+
+@lru_cache(maxsize=None)
+def primary_key(entity: Any) -> Any:
+    return list(entity.__table__.primary_key.columns)[0]
+
+
+@lru_cache(maxsize=None)
+def row_type(entity: Any) -> Any:
+    """ Named tuple with columns of `entity`, lighter alternative to dicts for big results """
+    return namedtuple(f'{entity.__name__}Row', [c.key for c in table_columns(entity)])
 
 
 class DataBaseConnector:
+    """
+    Engine is tuned by `profile` (see `profiles.engine_options`, `settings` are passed there).
+    Schema is created if missing, mapped classes come from declared models without reflection.
+    """
+
     def __init__(
             self,
-            url: str
+            url: str,
+            echo: bool = False,
+            profile: str = 'auto',
+            **settings: Any
     ) -> None:
         assert url, "DataBase URL must be not None"
 
-        self._engine = create_engine(url, echo=True)
+        options, pragmas = engine_options(url, profile, **settings)
+        self._engine = create_engine(url, echo=echo, **options)
+        run_on_connect(self._engine, pragmas)
         self.Session = sessionmaker(bind=self._engine)
 
         self.base = Base
         self.base.metadata.create_all(self._engine)
-        self.base.prepare(self._engine, reflect=True)
+        self.base.prepare()
+
+    @property
+    def engine(self):
+        return self._engine
 
     @contextmanager
     def session_scope(self):
@@ -35,7 +92,7 @@ class DataBaseConnector:
 
 
 class BaseDao:
-    def __init__(self, connector: DataBaseConnector = None) -> None:
+    def __init__(self, connector: Optional[DataBaseConnector] = None) -> None:
         assert connector, "Connection must be not null!"
         self.conn = connector
 
@@ -43,17 +100,38 @@ class BaseDao:
     def entity_clazz(self):
         raise Exception("Entity clazz must be not null!")
 
+    # reads select plain columns, so rows are not loaded into ORM identities
+
     def get_all(self) -> List[Dict[str, Any]]:
         with self.conn.session_scope() as session:
-            objects = session.query(self.entity_clazz).all()
-            return [self._asdict(obj) for obj in objects]
+            rows = session.execute(select(*table_columns(self.entity_clazz))).mappings()
+            return [dict(row) for row in rows]
+
+    def get_all_rows(self) -> List[Any]:
+        """ Same as `get_all`, but as named tuples (see `row_type`) """
+        make = row_type(self.entity_clazz)._make
+        with self.conn.session_scope() as session:
+            return [make(row) for row in session.execute(select(*table_columns(self.entity_clazz)))]
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Streams all entities ordered by primary key, fetching `batch_size` rows at a time
+        (server side cursor where dialect supports it). Session is open until iteration ends.
+        """
+        query = select(*table_columns(self.entity_clazz)) \
+            .order_by(primary_key(self.entity_clazz)) \
+            .execution_options(yield_per=batch_size)
+        with self.conn.session_scope() as session:
+            for row in session.execute(query).mappings():
+                yield dict(row)
 
     def get_by_id(self, id: int) -> Optional[Dict[str, Any]]:
         with self.conn.session_scope() as session:
-            obj = session.query(self.entity_clazz).get(id)
-            if obj:
-                return self._asdict(obj)
-        return None
+            row = session.execute(
+                select(*table_columns(self.entity_clazz))
+                .where(primary_key(self.entity_clazz) == id)
+            ).mappings().first()
+            return dict(row) if row else None
 
     def delete(self, id: int) -> None:
         with self.conn.session_scope() as session:
@@ -61,17 +139,36 @@ class BaseDao:
                 .filter(self.entity_clazz.id == id) \
                 .first()
             session.delete(obj)
+        self._invalidate(id)
+
+    def cache_info(self) -> Dict[str, int]:
+        return {'hits': 0, 'misses': 0, 'size': 0}
 
-    def _asdict(self, obj) -> Dict:
-        return {
-            c.key: getattr(obj, c.key)
-            for c in inspect(obj).mapper.column_attrs
-        }
+    def _invalidate(self, id: int) -> None:
+        pass
 
 
 class UserDao(BaseDao):
     entity_clazz = User
 
+    def __init__(
+            self,
+            connector: Optional[DataBaseConnector] = None,
+            cache_size: int = 1024,
+            cache_ttl: float = 300.0
+    ) -> None:
+        super().__init__(connector)
+        self._cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def get_by_id(self, id: int) -> Optional[Dict[str, Any]]:
+        user = self._cache.get(id)
+        if user is None:
+            user = super().get_by_id(id)
+            if user is None:
+                return None
+            self._cache.set(id, user)
+        return dict(user)
+
     def add(
             self,
             id: int,
@@ -82,6 +179,7 @@ class UserDao(BaseDao):
         with self.conn.session_scope() as session:
             user = User(id=id, username=username, first_name=first_name, last_name=last_name)
             session.add(user)
+        self._invalidate(id)
 
     def update(
             self,
@@ -98,11 +196,35 @@ class UserDao(BaseDao):
                 user.last_name = last_name if last_name is not None else user.last_name
             else:
                 self.add(id=id, username=username, first_name=first_name, last_name=last_name)
+        self._invalidate(id)
+
+    def cache_info(self) -> Dict[str, int]:
+        return self._cache.info()
+
+    def _invalidate(self, id: int) -> None:
+        self._cache.invalidate(id)
 
 
 class CommandDao(BaseDao):
+    """
+    Commands are rarely changed, so whole table is kept in memory as name to command map.
+    The map is reloaded on writes and after `cache_ttl` seconds to catch up manual changes.
+    """
     entity_clazz = Command
 
+    def __init__(
+            self,
+            connector: Optional[DataBaseConnector] = None,
+            cache_ttl: float = 60.0
+    ) -> None:
+        super().__init__(connector)
+        self.cache_ttl = cache_ttl
+        self.hits = 0
+        self.misses = 0
+        self._by_name: Optional[Dict[str, Dict]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
     def add(
             self,
             id: int,
@@ -111,59 +233,334 @@ class CommandDao(BaseDao):
         with self.conn.session_scope() as session:
             obj = self.entity_clazz(id=id, name=name)
             session.add(obj)
+        self._invalidate(id)
 
     def get_by_name(
             self,
             name: str
     ) -> Optional[Dict]:
+        command = self._commands().get(name)
+        if command is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(command)
+
+    def cache_info(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._by_name or {})}
+
+    def _invalidate(self, id: int) -> None:
+        with self._lock:
+            self._by_name = None
+
+    def _commands(self) -> Dict[str, Dict]:
+        commands = self._by_name
+        if commands is not None and time.monotonic() - self._loaded_at < self.cache_ttl:
+            return commands
+        with self._lock:
+            commands = self._by_name
+            if commands is None or time.monotonic() - self._loaded_at >= self.cache_ttl:
+                commands = {c['name']: c for c in self.get_all()}
+                self._by_name = commands
+                self._loaded_at = time.monotonic()
+            return commands
+
+
+class SettingsDao(BaseDao):
+    """
+    Runtime settings shared by all bot processes through the database. Values are cached
+    for `cache_ttl` seconds, so other processes see a change with that delay.
+    """
+    entity_clazz = Setting
+
+    def __init__(
+            self,
+            connector: Optional[DataBaseConnector] = None,
+            cache_ttl: float = 1.0
+    ) -> None:
+        super().__init__(connector)
+        self._cache = LRUCache(maxsize=64, ttl=cache_ttl)
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        cached = self._cache.get(name)
+        if cached is None:
+            setting = self.get_by_id(name)  # type: ignore
+            cached = (setting['value'] if setting else None,)
+            self._cache.set(name, cached)
+        return default if cached[0] is None else cached[0]
+
+    def set(self, name: str, value: str) -> None:
         with self.conn.session_scope() as session:
-            obj = session.query(self.entity_clazz) \
-                .filter(self.entity_clazz.name == name) \
-                .first()
-            if obj:
-                return self._asdict(obj)
-        return None
+            session.merge(Setting(name=name, value=value))
+        self._invalidate(name)
+
+    def cache_info(self) -> Dict[str, int]:
+        return self._cache.info()
+
+    def _invalidate(self, name: str) -> None:  # type: ignore
+        self._cache.invalidate(name)
 
 
 class StatisticsDao(BaseDao):
+    """
+    Besides per-user per-command counters, totals per user and per command are maintained
+    in the same transactions, so reports read a page of pre-aggregated rows instead of
+    joining the whole statistics table. `version` changes on every write of any process
+    and can be used to invalidate rendered reports.
+    """
+
+    @property
+    def version(self) -> int:
+        """ Total number of usages, read from the few rows of command totals """
+        # counters only grow, so the sum changes with every write, whichever process made it
+        with self.conn.session_scope() as session:
+            return int(session.query(func.sum(CommandTotals.c.count)).scalar() or 0)
 
     @property
     def entity_clazz(self):
         return self.conn.base.classes.statistics
 
     def get_all(self) -> List[Dict[str, Any]]:
+        return list(self.iter_all())
+
+    def iter_all(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """ Streams statistics grouped by user, in the format of `get_all` """
+        for (user_id, username), rows in groupby(
+                self._iter_usages(batch_size), key=itemgetter(0, 1)
+        ):
+            yield {
+                'id': user_id,
+                'username': username,
+                'statistics': [{'cmd': name, 'count': count} for _, _, name, count in rows],
+            }
+
+    def iter_rows(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """ Streams one flat row per user and command, e.g. for CSV export """
+        for user_id, username, name, count in self._iter_usages(batch_size):
+            yield {'user_id': user_id, 'username': username, 'command': name, 'count': count}
+
+    def _iter_usages(self, batch_size: int) -> Iterator[Any]:
+        """ (user id, username, command, count) rows ordered by user """
+        # table columns instead of mapped attributes, so rows skip ORM result processing
+        users, commands = User.__table__, Command.__table__
+        query = select(users.c.id, users.c.username, commands.c.name, Statistics.c.count) \
+            .join_from(Statistics, users, Statistics.c.user_id == users.c.id) \
+            .join(commands, Statistics.c.command_id == commands.c.id) \
+            .order_by(users.c.id) \
+            .execution_options(yield_per=batch_size)
         with self.conn.session_scope() as session:
-            statistics = session.query(UserDao.entity_clazz.id,
-                                       UserDao.entity_clazz.username,
-                                       CommandDao.entity_clazz.name,
-                                       self.entity_clazz.count) \
-                .join(UserDao.entity_clazz) \
-                .join(CommandDao.entity_clazz) \
-                .order_by(UserDao.entity_clazz.id) \
-                .all()
+            yield from session.execute(query)
 
-            users: Dict = {}
-            for stat in statistics:
-                if stat[0] not in users:
-                    users[stat[0]] = {
-                        'id': stat[0],
-                        'username': stat[1],
-                        'statistics': [
-                            {'cmd': stat[2], 'count': stat[3]}
-                        ]
-                    }
-                else:
-                    users[stat[0]]['statistics'].append({'cmd': stat[2], 'count': stat[3]})
+    def summary(self) -> Dict[str, Any]:
+        """ Number of active users, total usages and per-command totals, most used first """
+        with self.conn.session_scope() as session:
+            commands = session.query(Command.name, CommandTotals.c.count) \
+                .join(CommandTotals, CommandTotals.c.command_id == Command.id) \
+                .order_by(CommandTotals.c.count.desc(), Command.name) \
+                .all()
+            users = session.query(func.count()).select_from(UserTotals).scalar()
+            return {
+                'users': users,
+                'total': sum(count for _, count in commands),
+                'commands': [{'cmd': name, 'count': count} for name, count in commands],
+            }
 
-            return list(users.values())
+    def top_users(self, limit: int = 10, offset: int = 0) -> List[Dict[str, Any]]:
+        """ Page of users ordered by total usages, read from `user_totals` index """
+        with self.conn.session_scope() as session:
+            rows = session.query(User.id, User.username, UserTotals.c.count) \
+                .join(UserTotals, UserTotals.c.user_id == User.id) \
+                .order_by(UserTotals.c.count.desc(), UserTotals.c.user_id.desc()) \
+                .limit(limit) \
+                .offset(offset) \
+                .all()
+            return [{'id': id, 'username': username, 'count': count}
+                    for id, username, count in rows]
 
-    def increment(self, user_id: int, command_id: int) -> None:
+    def get_user(
+            self,
+            user_id: Optional[int] = None,
+            username: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """ Statistics of a single user found by id or username """
+        assert user_id is not None or username, "User id or username must be not empty!"
         with self.conn.session_scope() as session:
-            obj = session.query(self.entity_clazz) \
-                .filter_by(command_id=command_id) \
-                .filter_by(user_id=user_id) \
-                .first()
-            if obj:
-                obj.count += 1
+            query = session.query(User.id, User.username)
+            if user_id is not None:
+                query = query.filter(User.id == user_id)
             else:
-                session.add(self.entity_clazz(user_id=user_id, command_id=command_id, count=1))
+                query = query.filter(User.username == username)
+            user = query.first()
+            if user is None:
+                return None
+
+            stats = session.query(Command.name, Statistics.c.count) \
+                .join(Statistics, Statistics.c.command_id == Command.id) \
+                .filter(Statistics.c.user_id == user.id) \
+                .order_by(Statistics.c.count.desc(), Command.name) \
+                .all()
+            return {
+                'id': user.id,
+                'username': user.username,
+                'total': sum(count for _, count in stats),
+                'statistics': [{'cmd': name, 'count': count} for name, count in stats],
+            }
+
+    def rebuild_totals(self) -> None:
+        """ Recomputes totals from statistics, e.g. for databases created before totals """
+        with self.conn.session_scope() as session:
+            for totals, key in ((UserTotals, 'user_id'), (CommandTotals, 'command_id')):
+                session.execute(totals.delete())
+                session.execute(totals.insert().from_select(
+                    [key, 'count'],
+                    select(Statistics.c[key], func.sum(Statistics.c.count))
+                    .group_by(Statistics.c[key])
+                ))
+
+    def ensure_totals(self) -> None:
+        """ Rebuilds totals once if they are empty while statistics are not """
+        with self.conn.session_scope() as session:
+            has_totals = session.query(UserTotals.c.user_id).first() is not None
+            has_statistics = session.query(Statistics.c.user_id).first() is not None
+        if has_statistics and not has_totals:
+            self.rebuild_totals()
+
+    def journal_position(self, name: str) -> int:
+        """ Sequence number of the last usage from journal `name` stored by `record` """
+        with self.conn.session_scope() as session:
+            value = session.query(Setting.value) \
+                .filter(Setting.name == JOURNAL_SETTING.format(name)) \
+                .scalar()
+        return int(value or 0)
+
+    def increment(self, user_id: int, command_id: int, count: int = 1) -> None:
+        with self.conn.session_scope() as session:
+            self._upsert(session, {(user_id, command_id): count})
+
+    def increment_many(self, increments: Iterable[Tuple[int, int, int]]) -> None:
+        """ Applies list of (user id, command id, count) increments in one transaction """
+        deltas: Counter = Counter()
+        for user_id, command_id, count in increments:
+            deltas[(user_id, command_id)] += count
+        if not deltas:
+            return
+        with self.conn.session_scope() as session:
+            self._upsert(session, deltas)
+
+    def record(
+            self,
+            users: Dict[int, Dict[str, Optional[str]]],
+            usages: Dict[Tuple[int, str], int],
+            position: Optional[Tuple[str, int]] = None
+    ) -> None:
+        """
+        Stores a batch of command usages in one transaction.
+
+        `users` maps user id to its profile fields, `usages` maps (user id, command name) to
+        the number of calls. Usages of unknown commands are skipped, missing users are created.
+        `position` is (journal name, sequence number) of the last journaled usage in the batch,
+        it is stored in the same transaction, see `journal_position`.
+        """
+        with self.conn.session_scope() as session:
+            if position is not None:
+                name, sequence = position
+                session.merge(Setting(name=JOURNAL_SETTING.format(name), value=str(sequence)))
+            names = {name for _, name in usages}
+            commands = dict(
+                session.query(CommandDao.entity_clazz.name, CommandDao.entity_clazz.id)
+                .filter(CommandDao.entity_clazz.name.in_(names))
+                .all()
+            )
+            deltas: Dict[Tuple[int, int], int] = {}
+            for (user_id, name), count in usages.items():
+                if name in commands:
+                    deltas[(user_id, commands[name])] = count
+            if not deltas:
+                return
+
+            user_ids = {user_id for user_id, _ in deltas}
+            known_users = {
+                row[0] for row in session.query(UserDao.entity_clazz.id)
+                .filter(UserDao.entity_clazz.id.in_(user_ids))
+            }
+            self._add_users(session, [
+                {
+                    'id': user_id,
+                    'username': users.get(user_id, {}).get('username'),
+                    'first_name': users.get(user_id, {}).get('first_name'),
+                    'last_name': users.get(user_id, {}).get('last_name'),
+                }
+                for user_id in sorted(user_ids - known_users)
+            ])
+
+            self._upsert(session, deltas)
+
+    def _add_users(self, session, users: List[Dict[str, Any]]) -> None:
+        """ Worker processes may add the same new user concurrently, so conflicts are ignored """
+        if not users:
+            return
+        insert = UPSERT_INSERTS.get(session.get_bind().dialect.name)
+        if insert is None:
+            session.add_all(User(**user) for user in users)
+            session.flush()
+            return
+        session.execute(insert(User.__table__).on_conflict_do_nothing(index_elements=['id']), users)
+
+    def _upsert(self, session, deltas: Mapping[Tuple[int, int], int]) -> None:
+        """ Adds `deltas` to statistics counters and to per-user and per-command totals """
+        by_user: Counter = Counter()
+        by_command: Counter = Counter()
+        for (user_id, command_id), count in deltas.items():
+            by_user[(user_id,)] += count
+            by_command[(command_id,)] += count
+
+        self._add(session, Statistics, ('user_id', 'command_id'), deltas)
+        self._add(session, UserTotals, ('user_id',), by_user)
+        self._add(session, CommandTotals, ('command_id',), by_command)
+
+    def _add(
+            self,
+            session,
+            table: Table,
+            keys: Sequence[str],
+            deltas: Mapping[Tuple, int]
+    ) -> None:
+        """
+        Adds `deltas` to `count` column of `table` rows with a single statement per batch.
+
+        SQLite and PostgreSQL use `INSERT ... ON CONFLICT DO UPDATE`, other dialects fall back
+        to `UPDATE` followed by `INSERT` for missing rows.
+        """
+        rows = [dict(zip(keys, key), count=count) for key, count in sorted(deltas.items())]
+        dialect = session.get_bind().dialect.name
+        insert = UPSERT_INSERTS.get(dialect)
+        if insert is None:
+            self._update_or_insert(session, table, keys, rows)
+            return
+
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[key] for key in keys],
+            set_={'count': table.c.count + stmt.excluded.count},
+        )
+        session.execute(stmt, rows)
+
+    def _update_or_insert(
+            self,
+            session,
+            table: Table,
+            keys: Sequence[str],
+            rows: List[Dict[str, int]]
+    ) -> None:
+        for row in rows:
+            update = table.update().values(count=table.c.count + row['count'])
+            for key in keys:
+                update = update.where(table.c[key] == row[key])
+            if session.execute(update).rowcount:
+                continue
+            try:
+                with session.begin_nested():
+                    session.execute(table.insert().values(**row))
+            except IntegrityError:
+                # concurrent first usage inserted the row, so it can be updated now
+                session.execute(update)
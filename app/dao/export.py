@@ -0,0 +1,80 @@
+"""
+Streaming export of tables into CSV or JSON Lines, with constant memory use.
+
+    $ python -m dao.export users users.csv
+    $ python -m dao.export statistics statistics.jsonl --db-url sqlite:///bot.db
+"""
+import argparse
+import csv
+import io
+import json
+import os
+
+from typing import Any, BinaryIO, Dict, Iterable, Iterator
+
+from .db import DataBaseConnector, StatisticsDao, UserDao
+
+FORMATS = ('csv', 'jsonl')
+TABLES = ('users', 'statistics')
+
+
+def table_rows(connector: DataBaseConnector, table: str, fmt: str,
+               batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """ Rows of `table`, statistics are flat for CSV and grouped by user for JSON Lines """
+    assert table in TABLES, f"Unknown table {table}!"
+    if table == 'users':
+        return UserDao(connector).iter_all(batch_size)
+    stat_dao = StatisticsDao(connector)
+    return stat_dao.iter_rows(batch_size) if fmt == 'csv' else stat_dao.iter_all(batch_size)
+
+
+def write(rows: Iterable[Dict[str, Any]], file: BinaryIO, fmt: str) -> int:
+    """ Writes `rows` into binary `file` as UTF-8 `fmt`, returns number of rows """
+    assert fmt in FORMATS, f"Unknown format {fmt}!"
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    count = 0
+    try:
+        if fmt == 'csv':
+            writer = None
+            for row in rows:
+                if writer is None:
+                    writer = csv.DictWriter(text, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                text.write(json.dumps(row, ensure_ascii=False, default=str))
+                text.write('\n')
+                count += 1
+    finally:
+        # file stays open for the caller
+        text.flush()
+        text.detach()
+    return count
+
+
+def export(connector: DataBaseConnector, table: str, fmt: str, file: BinaryIO,
+           batch_size: int = 1000) -> int:
+    return write(table_rows(connector, table, fmt, batch_size), file, fmt)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('table', choices=TABLES)
+    parser.add_argument('path', help='output file, format is taken from extension')
+    parser.add_argument('--db-url', default=os.getenv('DB_URL'))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    fmt = args.path.rsplit('.', 1)[-1]
+    if fmt not in FORMATS:
+        parser.error(f"file extension must be one of: {', '.join(FORMATS)}")
+    with open(args.path, 'wb') as file:
+        count = export(DataBaseConnector(args.db_url), args.table, fmt, file, args.batch_size)
+    print(f'{count} rows written to {args.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class UpdateJournal:
+    """
+    Append-only log of processed updates, kept in a local file.
+
+    Every record is a JSON line with sequence number `n`, update id `u` and optional payload
+    (e.g. statistics delta of the update). Appends only write to the file buffer; records are
+    made durable in batches (group commit) - by a background thread every `sync_interval`
+    seconds or once `sync_size` records are pending, and by `sync` for callers which need
+    everything appended so far on disk. One `fsync` covers the whole batch.
+
+    Ids of the last `window` updates are kept in memory to drop re-delivered updates. Once the
+    file grows over `max_bytes`, `compact` rewrites it without payloads which were already
+    stored elsewhere.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            sync_interval: float = 0.2,
+            sync_size: int = 256,
+            window: int = 10000,
+            max_bytes: int = 1024 * 1024
+    ) -> None:
+        assert path, "Journal path must be not empty!"
+        self.path = path
+        self.sync_interval = sync_interval
+        self.sync_size = sync_size
+        self.window = window
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()  # appends
+        self._sync_lock = threading.Lock()  # single fsync or rewrite at a time
+        self._file: Any = None
+        self._sequence = 0
+        self._synced = 0
+        self._processed: 'OrderedDict[int, None]' = OrderedDict()  # oldest first
+        self._stats = {'syncs': 0, 'sync_seconds': 0.0, 'duplicates': 0, 'compactions': 0}
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def sequence(self) -> int:
+        """ Sequence number of the last appended record """
+        return self._sequence
+
+    @property
+    def offset(self) -> Optional[int]:
+        """ Update id to request updates from, next after the last processed one """
+        with self._lock:
+            return max(self._processed) + 1 if self._processed else None
+
+    def recover(self, sequence: int = 0) -> List[Dict[str, Any]]:
+        """
+        Opens the journal and returns its records, a torn last record (the process died in
+        the middle of a write) is cut off. Numbering continues after `sequence` at least,
+        e.g. the last one stored elsewhere, in case the file was lost.
+        """
+        records: List[Dict[str, Any]] = []
+        valid = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as file:
+                for line in file:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('no line end')
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logging.warning(f'Journal {self.path} is cut at byte {valid}: torn record')
+                        break
+                    valid += len(line)
+        created = not os.path.exists(self.path)
+
+        with self._lock:
+            self._file = open(self.path, 'ab')
+            self._file.truncate(valid)
+            self._file.seek(valid)
+            self._sequence = max([sequence] + [record['n'] for record in records])
+            self._synced = self._sequence
+            for record in records:
+                self._remember(record['u'])
+        if created:
+            _sync_directory(self.path)
+        return records
+
+    def seen(self, update_id: int) -> bool:
+        """ Whether update was already processed, i.e. it is delivered again """
+        with self._lock:
+            duplicate = update_id in self._processed
+            if duplicate:
+                self._stats['duplicates'] += 1
+        return duplicate
+
+    def append(self, update_id: int, **payload: Any) -> int:
+        """ Journals update as processed, returns sequence number of the record """
+        with self._lock:
+            assert self._file is not None, "Journal must be recovered first!"
+            self._sequence += 1
+            record = dict(payload, n=self._sequence, u=update_id)
+            self._file.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            self._remember(update_id)
+            sequence, pending = self._sequence, self._sequence - self._synced
+
+        if pending >= self.sync_size:
+            self._wakeup.set()
+        return sequence
+
+    def mark(self, update_id: int) -> None:
+        """ Journals update as processed, unless it is journaled already (e.g. with payload) """
+        with self._lock:
+            if update_id in self._processed:
+                return
+        self.append(update_id)
+
+    def sync(self) -> int:
+        """ Makes all appended records durable, returns sequence number of the last one """
+        with self._sync_lock:
+            with self._lock:
+                sequence = self._sequence
+                if self._file is None or sequence == self._synced:
+                    return self._synced
+                self._file.flush()
+                fileno = self._file.fileno()
+            # appends go on while the batch is synced, they are picked up by the next sync
+            started = time.perf_counter()
+            os.fsync(fileno)
+            self._stats['syncs'] += 1
+            self._stats['sync_seconds'] += time.perf_counter() - started
+            self._synced = sequence
+            return sequence
+
+    def compact(self, applied: int) -> bool:
+        """
+        Rewrites journal larger than `max_bytes`: payloads of records up to `applied`
+        are dropped, records of older updates than the window are dropped completely.
+        """
+        with self._lock:
+            if self._file is None or self._file.tell() < self.max_bytes:
+                return False
+
+        with self._sync_lock, self._lock:
+            self._file.flush()
+            compacted = f'{self.path}.compact'
+            with open(self.path, 'rb') as source, open(compacted, 'wb') as target:
+                for line in source:
+                    record = json.loads(line)
+                    if record['n'] > applied:
+                        target.write(line)
+                    elif record['u'] in self._processed:
+                        short = {'n': record['n'], 'u': record['u']}
+                        target.write(json.dumps(short, separators=(',', ':')).encode() + b'\n')
+                target.flush()
+                os.fsync(target.fileno())
+            self._file.close()
+            os.replace(compacted, self.path)
+            _sync_directory(self.path)
+            self._file = open(self.path, 'ab')
+            self._synced = self._sequence
+            self._stats['compactions'] += 1
+        return True
+
+    def info(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(
+                self._stats,
+                records=self._sequence,
+                pending=self._sequence - self._synced,
+                bytes=self._file.tell() if self._file is not None else 0,
+            )
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='update-journal', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stops background thread, syncs and closes the file """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.sync_interval)
+            self._wakeup.clear()
+            try:
+                self.sync()
+            except OSError as err:
+                logging.error(f'Failed to sync journal {self.path}: {err}')
+
+    def _remember(self, update_id: int) -> None:
+        self._processed[update_id] = None
+        if len(self._processed) > self.window:
+            self._processed.popitem(last=False)
+
+
+def _sync_directory(path: str) -> None:
+    """ New or replaced file survives a power loss only after its directory is synced """
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
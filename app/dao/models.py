@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, String, Sequence, ForeignKey, Table, Integer
+from sqlalchemy import Column, BigInteger, String, Sequence, ForeignKey, Table, Integer, Index
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.orm import relationship
 from typing import Any
@@ -12,9 +12,24 @@ Statistics = Table(
     Column('count', Integer),
 )
 
+# totals are maintained together with statistics, so reports don't aggregate the whole table
+UserTotals = Table(
+    'user_totals', Base.metadata,
+    Column('user_id', ForeignKey('users.id'), primary_key=True),
+    Column('count', Integer, nullable=False),
+    Index('ix_user_totals_count', 'count'),
+)
+
+CommandTotals = Table(
+    'command_totals', Base.metadata,
+    Column('command_id', ForeignKey('commands.id'), primary_key=True),
+    Column('count', Integer, nullable=False),
+)
+
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (Index('ix_users_username', 'username'),)
 
     id = Column(BigInteger, Sequence('user_id_seq'), primary_key=True)
     username = Column(String(50))
@@ -43,3 +58,10 @@ class Command(Base):
         secondary=Statistics,
         back_populates='commands'
     )
+
+
+class Setting(Base):
+    __tablename__ = 'settings'
+
+    name = Column(String(50), primary_key=True)
+    value = Column(String(255))
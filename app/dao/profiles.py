@@ -0,0 +1,84 @@
+"""
+Engine tuning profiles: `create_engine()` options and per-connection setup for each database.
+"""
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+PROFILES = ('auto', 'default', 'sqlite', 'postgresql')
+
+SQLITE_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def engine_options(
+        url: str,
+        profile: str = 'auto',
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30.0,
+        pool_pre_ping: bool = True,
+        pool_recycle: int = 1800,
+        query_cache_size: int = 500,
+        busy_timeout: float = 5.0,
+        synchronous: str = 'NORMAL',
+        wal: bool = True
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Keyword arguments of `create_engine()` and PRAGMAs run on every new connection.
+
+    `auto` picks profile by dialect of `url`, `default` leaves SQLAlchemy defaults.
+    """
+    assert profile in PROFILES, f"Unknown engine profile {profile}!"
+    parsed = make_url(url)
+    dialect = parsed.get_backend_name()
+    if profile == 'auto':
+        profile = dialect if dialect in PROFILES else 'default'
+    if profile == 'default':
+        return {}, []
+    assert profile == dialect, f"Profile {profile} doesn't fit {dialect} database!"
+
+    if profile == 'sqlite':
+        assert synchronous.upper() in SQLITE_SYNCHRONOUS, f"Unknown synchronous {synchronous}!"
+        pragmas = [f'PRAGMA busy_timeout = {int(busy_timeout * 1000)}',
+                   f'PRAGMA synchronous = {synchronous.upper()}']
+        if parsed.database in (None, '', ':memory:'):
+            # in-memory database lives in its connection, keep SQLAlchemy per-thread pool
+            return {}, pragmas
+        # WAL lets dispatcher threads read while statistics are written,
+        # with WAL synchronous=NORMAL syncs on checkpoints only and still can't corrupt database
+        if wal:
+            pragmas.insert(0, 'PRAGMA journal_mode = WAL')
+        return {
+            'poolclass': QueuePool,
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'connect_args': {'check_same_thread': False, 'timeout': busy_timeout},
+        }, pragmas
+
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_pre_ping': pool_pre_ping,
+        'pool_recycle': pool_recycle,
+        # compiled statements are cached per engine, so repeated queries skip SQL compilation
+        'query_cache_size': query_cache_size,
+    }, []
+
+
+def run_on_connect(engine: Any, statements: List[str]) -> None:
+    """ Executes `statements` on every new DB-API connection of `engine` """
+    if not statements:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
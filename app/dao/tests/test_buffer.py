@@ -0,0 +1,148 @@
+"""
+Unittests for statistics write-behind buffer.
+"""
+import os
+import tempfile
+from unittest import TestCase
+
+from app.dao.buffer import StatisticsBuffer
+from app.dao.db import DataBaseConnector, UserDao, CommandDao, StatisticsDao
+from app.dao.journal import UpdateJournal
+
+
+class TestStatisticsBuffer(TestCase):
+    """ Unit tests for Statistics Buffer"""
+
+    def setUp(self):
+        conn = DataBaseConnector('sqlite:///:memory:')
+        self.user_dao = UserDao(conn)
+        self.command_dao = CommandDao(conn)
+        self.stat_dao = StatisticsDao(conn)
+        self.buffer = StatisticsBuffer(self.stat_dao)
+
+        self.command_dao.add(1, 'help')
+        self.command_dao.add(2, 'say')
+
+    def test_flush(self):
+        """ Tests aggregated usages are written on flush """
+        self.user_dao.add(1, 'hello', 'first', 'second')
+
+        for _ in range(3):
+            self.buffer.add(1, 'help')
+        self.buffer.add(1, 'say')
+
+        self.assertEqual([], self.stat_dao.get_all())
+        self.assertEqual(4, self.buffer.flush())
+        self.assertEqual(0, len(self.buffer))
+
+        stats = self.stat_dao.get_all()[0]['statistics']
+        self.assertEqual({'help': 3, 'say': 1}, {s['cmd']: s['count'] for s in stats})
+
+        self.buffer.add(1, 'help')
+        self.buffer.flush()
+
+        stats = self.stat_dao.get_all()[0]['statistics']
+        self.assertEqual({'help': 4, 'say': 1}, {s['cmd']: s['count'] for s in stats})
+
+    def test_new_user(self):
+        """ Tests unknown users are created on flush """
+        self.buffer.add(5, 'help', 'new', 'first', 'last')
+        self.buffer.flush()
+
+        user = self.user_dao.get_by_id(5)
+        self.assertIsNotNone(user)
+        if user:
+            self.assertEqual('new', user['username'])
+            self.assertEqual('last', user['last_name'])
+
+    def test_unknown_command(self):
+        """ Tests usages of commands missing in database are dropped """
+        self.buffer.add(5, 'unknown')
+        self.buffer.flush()
+
+        self.assertIsNone(self.user_dao.get_by_id(5))
+        self.assertEqual([], self.stat_dao.get_all())
+
+
+class TestStatisticsBufferThread(TestCase):
+    """ Unit tests for Statistics Buffer background flushing"""
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        conn = DataBaseConnector(f'sqlite:///{self.db_path}')
+        CommandDao(conn).add(1, 'help')
+        self.stat_dao = StatisticsDao(conn)
+
+    def tearDown(self):
+        os.unlink(self.db_path)
+
+    def test_stop_flushes(self):
+        """ Tests pending usages are written on stop """
+        buffer = StatisticsBuffer(self.stat_dao, flush_interval=60)
+        buffer.start()
+        buffer.add(1, 'help')
+        buffer.add(1, 'help')
+        buffer.stop()
+
+        self.assertEqual(2, self.stat_dao.get_all()[0]['statistics'][0]['count'])
+
+
+class TestStatisticsBufferJournal(TestCase):
+    """ Unit tests for Statistics Buffer recovery from journal"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'statistics.journal')
+        conn = DataBaseConnector(f"sqlite:///{os.path.join(self.directory.name, 'bot.db')}")
+        CommandDao(conn).add(1, 'help')
+        self.stat_dao = StatisticsDao(conn)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _restart(self):
+        """ Buffer of a new process, with the same journal and database """
+        journal = UpdateJournal(self.path)
+        buffer = StatisticsBuffer(self.stat_dao, journal=journal)
+        return buffer, journal, buffer.recover()
+
+    def _count(self):
+        stats = self.stat_dao.get_all()
+        return stats[0]['statistics'][0]['count'] if stats else 0
+
+    def test_replay_once(self):
+        """ Tests usages lost in a crash are replayed, stored ones are never counted twice """
+        buffer, journal, replayed = self._restart()
+        self.assertEqual(0, replayed)
+        buffer.add(1, 'help', update_id=10)
+        buffer.add(1, 'help', update_id=11)
+        buffer.flush()
+        buffer.add(1, 'help', update_id=12)
+        journal.sync()
+        # process dies before the last usage is flushed
+
+        buffer, journal, replayed = self._restart()
+        self.assertEqual(1, replayed)
+        self.assertTrue(journal.seen(12))
+        self.assertEqual(2, self._count())
+        buffer.flush()
+        self.assertEqual(3, self._count())
+
+        # dies right after the flush, nothing is left to replay
+        buffer, journal, replayed = self._restart()
+        self.assertEqual(0, replayed)
+        self.assertEqual(13, journal.offset)
+        self.assertEqual(0, buffer.flush())
+        self.assertEqual(3, self._count())
+
+    def test_lost_journal(self):
+        """ Tests numbering continues after stored position if journal file is lost """
+        buffer, _, _ = self._restart()
+        buffer.add(1, 'help', update_id=10)
+        buffer.flush()
+        os.remove(self.path)
+
+        buffer, journal, _ = self._restart()
+        buffer.add(1, 'help', update_id=11)
+        self.assertEqual(2, journal.sequence)
@@ -0,0 +1,61 @@
+"""
+Stress tests for concurrent statistics updates.
+"""
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+from app.dao import db
+from app.dao.db import DataBaseConnector, UserDao, CommandDao, StatisticsDao
+
+THREADS = 8
+INCREMENTS = 50
+
+
+class TestConcurrentIncrements(TestCase):
+    """ Concurrent increments must not lose updates """
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        conn = DataBaseConnector(f'sqlite:///{self.db_path}')
+        UserDao(conn).add(1, 'hello')
+        CommandDao(conn).add(1, 'help')
+        CommandDao(conn).add(2, 'say')
+        self.stat_dao = StatisticsDao(conn)
+
+    def tearDown(self):
+        os.unlink(self.db_path)
+
+    def _run(self, target):
+        barrier = threading.Barrier(THREADS)
+
+        def worker():
+            barrier.wait()
+            for _ in range(INCREMENTS):
+                target()
+
+        threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return {s['cmd']: s['count'] for s in self.stat_dao.get_all()[0]['statistics']}
+
+    def test_increment(self):
+        """ Tests first usages and following increments from many threads """
+        counts = self._run(lambda: self.stat_dao.increment(1, 1))
+        self.assertEqual({'help': THREADS * INCREMENTS}, counts)
+
+    def test_increment_many(self):
+        """ Tests bulk increments from many threads """
+        counts = self._run(lambda: self.stat_dao.increment_many([(1, 1, 1), (1, 2, 2)]))
+        self.assertEqual({'help': THREADS * INCREMENTS, 'say': 2 * THREADS * INCREMENTS}, counts)
+
+    def test_increment_generic_dialect(self):
+        """ Tests fallback path from many threads """
+        with mock.patch.dict(db.UPSERT_INSERTS, clear=True):
+            counts = self._run(lambda: self.stat_dao.increment(1, 1))
+        self.assertEqual({'help': THREADS * INCREMENTS}, counts)
@@ -1,9 +1,10 @@
 """
 Unittests for DAO.
 """
-from unittest import TestCase
+from unittest import TestCase, mock
 
-from app.dao.db import DataBaseConnector, UserDao, CommandDao, StatisticsDao
+from app.dao import db
+from app.dao.db import DataBaseConnector, UserDao, CommandDao, SettingsDao, StatisticsDao
 
 
 class BaseDaoTestCase(TestCase):
@@ -35,6 +36,16 @@ class TestUserDao(BaseDaoTestCase):
         self.assertEqual('first', user['first_name'])
         self.assertEqual('second', user['last_name'])
 
+    def test_get_all_rows(self):
+        """ Tests getting users as named tuples """
+        self.user_dao.add(1, 'hello', 'first', 'second')
+
+        user = self.user_dao.get_all_rows()[0]
+
+        self.assertEqual((1, 'hello', 'first', 'second'), tuple(user))
+        self.assertEqual('hello', user.username)
+        self.assertEqual(user._asdict(), self.user_dao.get_all()[0])
+
     def test_update_user(self):
         """ Tests updating user entity """
         user_id = 1
@@ -103,3 +114,150 @@ class TestStatisticsDao(BaseDaoTestCase):
 
         self.assertEqual('help', stats[0]['cmd'])
         self.assertEqual(3, stats[0]['count'])
+
+    def test_increment_many(self):
+        """ Tests bulk increments are summed up per user and command """
+        self.command_dao.add(2, 'say')
+
+        self.stat_dao.increment(self.user_id, self.command_id, 2)
+        self.stat_dao.increment_many([
+            (self.user_id, self.command_id, 3),
+            (self.user_id, 2, 1),
+            (self.user_id, 2, 4),
+        ])
+
+        stats = self.stat_dao.get_all()[0]['statistics']
+        self.assertEqual({'help': 5, 'say': 5}, {s['cmd']: s['count'] for s in stats})
+
+    def test_increment_generic_dialect(self):
+        """ Tests increments on dialects without upsert support """
+        with mock.patch.dict(db.UPSERT_INSERTS, clear=True):
+            self.stat_dao.increment(self.user_id, self.command_id)
+            self.stat_dao.increment_many([(self.user_id, self.command_id, 2)])
+
+        self.assertEqual(3, self.stat_dao.get_all()[0]['statistics'][0]['count'])
+        self.assertEqual(3, self.stat_dao.summary()['total'])
+
+    def test_record_existing_user(self):
+        """ Tests user added concurrently by another process doesn't fail the batch """
+        with self.stat_dao.conn.session_scope() as session:
+            self.stat_dao._add_users(session, [
+                {'id': self.user_id, 'username': 'other', 'first_name': None, 'last_name': None},
+            ])
+        self.stat_dao.record({self.user_id: {'username': 'other'}}, {(self.user_id, 'help'): 2})
+
+        self.assertEqual('hello', (self.user_dao.get_by_id(self.user_id) or {})['username'])
+        self.assertEqual(2, self.stat_dao.summary()['total'])
+
+
+class TestSettingsDao(BaseDaoTestCase):
+    """ Unit tests for Settings Dao"""
+
+    def test_get_set(self):
+        """ Tests settings are shared between DAO instances """
+        other = SettingsDao(self.user_dao.conn, cache_ttl=0)
+        settings = SettingsDao(self.user_dao.conn)
+
+        self.assertEqual('1', settings.get('is_running', '1'))
+        other.set('is_running', '0')
+        self.assertEqual('0', other.get('is_running', '1'))
+
+        settings.set('is_running', '1')
+        self.assertEqual('1', settings.get('is_running'))
+        self.assertEqual('1', other.get('is_running'))
+
+
+class TestStatisticsReport(BaseDaoTestCase):
+    """ Unit tests for aggregated statistics reports"""
+
+    def setUp(self):
+        super().setUp()
+
+        self.command_dao.add(1, 'help')
+        self.command_dao.add(2, 'say')
+        for user_id in range(1, 4):
+            self.user_dao.add(user_id, f'user{user_id}')
+        self.stat_dao.increment_many([(1, 1, 1), (2, 1, 2), (2, 2, 3), (3, 2, 1)])
+        self.stat_dao.increment(3, 2, 4)
+
+    def test_summary(self):
+        """ Tests totals are maintained on increments """
+        self.assertEqual({
+            'users': 3,
+            'total': 11,
+            'commands': [{'cmd': 'say', 'count': 8}, {'cmd': 'help', 'count': 3}],
+        }, self.stat_dao.summary())
+
+    def test_top_users(self):
+        """ Tests users are paginated by total usages """
+        top = self.stat_dao.top_users(limit=2)
+        self.assertEqual([(3, 5), (2, 5)], [(u['id'], u['count']) for u in top])
+        self.assertEqual(
+            [{'id': 1, 'username': 'user1', 'count': 1}],
+            self.stat_dao.top_users(limit=2, offset=2)
+        )
+
+    def test_get_user(self):
+        """ Tests statistics of single user by id and username """
+        user = self.stat_dao.get_user(username='user2')
+        self.assertEqual(self.stat_dao.get_user(user_id=2), user)
+        self.assertEqual(5, (user or {})['total'])
+        self.assertEqual(
+            [{'cmd': 'say', 'count': 3}, {'cmd': 'help', 'count': 2}],
+            (user or {})['statistics']
+        )
+        self.assertIsNone(self.stat_dao.get_user(username='nobody'))
+
+    def test_rebuild_totals(self):
+        """ Tests totals are recomputed from statistics """
+        summary = self.stat_dao.summary()
+        top = self.stat_dao.top_users()
+        with self.stat_dao.conn.session_scope() as session:
+            session.execute(db.UserTotals.delete())
+            session.execute(db.CommandTotals.delete())
+
+        version = self.stat_dao.version
+        self.stat_dao.ensure_totals()
+
+        self.assertEqual(summary, self.stat_dao.summary())
+        self.assertEqual(top, self.stat_dao.top_users())
+        self.assertGreater(self.stat_dao.version, version)
+
+    def test_version_of_other_process(self):
+        """ Tests version changes with writes of another DAO of the same database """
+        other_dao = StatisticsDao(self.stat_dao.conn)
+        version = self.stat_dao.version
+
+        other_dao.increment(1, 1)
+
+        self.assertGreater(self.stat_dao.version, version)
+
+
+class TestDaoCache(BaseDaoTestCase):
+    """ Unit tests for DAO lookup caches"""
+
+    def test_user_cache(self):
+        """ Tests users are cached and invalidated on writes """
+        self.assertIsNone(self.user_dao.get_by_id(1))
+
+        self.user_dao.add(1, 'hello', 'first', 'second')
+        self.assertEqual('hello', (self.user_dao.get_by_id(1) or {})['username'])
+        self.assertEqual('hello', (self.user_dao.get_by_id(1) or {})['username'])
+        self.assertEqual(1, self.user_dao.cache_info()['hits'])
+
+        self.user_dao.update(id=1, username='updated')
+        self.assertEqual('updated', (self.user_dao.get_by_id(1) or {})['username'])
+
+        self.user_dao.delete(1)
+        self.assertIsNone(self.user_dao.get_by_id(1))
+
+    def test_command_cache(self):
+        """ Tests command map is refreshed on writes """
+        self.assertIsNone(self.command_dao.get_by_name('help'))
+
+        self.command_dao.add(1, 'help')
+        self.assertEqual(1, (self.command_dao.get_by_name('help') or {})['id'])
+        self.assertEqual({'hits': 1, 'misses': 1, 'size': 1}, self.command_dao.cache_info())
+
+        self.command_dao.delete(1)
+        self.assertIsNone(self.command_dao.get_by_name('help'))
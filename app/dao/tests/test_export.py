@@ -0,0 +1,54 @@
+"""
+Unittests for streaming export.
+"""
+import json
+from io import BytesIO
+from unittest import TestCase
+
+from app.dao import export
+from app.dao.db import DataBaseConnector, UserDao, CommandDao, StatisticsDao
+
+
+class TestExport(TestCase):
+    """ Unit tests for export of tables"""
+
+    def setUp(self):
+        self.conn = DataBaseConnector('sqlite:///:memory:')
+        self.user_dao = UserDao(self.conn)
+        self.stat_dao = StatisticsDao(self.conn)
+        CommandDao(self.conn).add(1, 'help')
+        CommandDao(self.conn).add(2, 'say')
+        for user_id in (3, 1, 2):
+            self.user_dao.add(user_id, f'user{user_id}', 'Иван')
+        self.stat_dao.increment_many([(1, 1, 2), (2, 1, 1), (2, 2, 3), (3, 2, 1)])
+
+    def test_iter_all(self):
+        """ Tests streamed rows are the same as loaded at once, in small batches """
+        self.assertEqual([1, 2, 3], [user['id'] for user in self.user_dao.iter_all(batch_size=2)])
+        self.assertEqual(
+            sorted(self.user_dao.get_all(), key=lambda user: user['id']),
+            list(self.user_dao.iter_all(batch_size=2))
+        )
+        self.assertEqual(self.stat_dao.get_all(), list(self.stat_dao.iter_all(batch_size=1)))
+        self.assertEqual(4, len(list(self.stat_dao.iter_rows(batch_size=3))))
+
+    def test_csv(self):
+        """ Tests statistics are exported as flat CSV rows """
+        file = BytesIO()
+        self.assertEqual(4, export.export(self.conn, 'statistics', 'csv', file))
+
+        lines = file.getvalue().decode('utf-8').splitlines()
+        self.assertEqual('user_id,username,command,count', lines[0])
+        self.assertEqual(['1,user1,help,2', '3,user3,say,1'], [lines[1], lines[-1]])
+        self.assertFalse(file.closed)
+
+    def test_jsonl(self):
+        """ Tests users are exported as JSON Lines """
+        file = BytesIO()
+        self.assertEqual(3, export.export(self.conn, 'users', 'jsonl', file))
+
+        users = [json.loads(line) for line in file.getvalue().decode('utf-8').splitlines()]
+        self.assertEqual(
+            {'id': 1, 'username': 'user1', 'first_name': 'Иван', 'last_name': None},
+            users[0]
+        )
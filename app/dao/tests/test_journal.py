@@ -0,0 +1,67 @@
+"""
+Unittests for update journal.
+"""
+import os
+import tempfile
+
+from unittest import TestCase
+
+from app.dao.journal import UpdateJournal
+
+
+class TestUpdateJournal(TestCase):
+    """ Unit tests for Update Journal"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'updates.journal')
+        self.journal = UpdateJournal(self.path)
+        self.journal.recover()
+
+    def tearDown(self):
+        self.journal.stop()
+        self.directory.cleanup()
+
+    def _reopen(self, **kwargs):
+        self.journal.stop()
+        self.journal = UpdateJournal(self.path, **kwargs)
+        return self.journal.recover()
+
+    def test_recover(self):
+        """ Tests synced records are recovered and processed updates are recognized """
+        self.assertEqual(1, self.journal.append(7, s=[1, 'help']))
+        self.journal.mark(7)
+        self.journal.mark(8)
+        self.assertEqual(2, self.journal.sync())
+
+        records = self._reopen()
+        self.assertEqual([{'n': 1, 'u': 7, 's': [1, 'help']}, {'n': 2, 'u': 8}], records)
+        self.assertTrue(self.journal.seen(8))
+        self.assertFalse(self.journal.seen(9))
+        self.assertEqual(9, self.journal.offset)
+        self.assertEqual(3, self.journal.append(9))
+
+    def test_torn_record(self):
+        """ Tests partially written last record is cut off """
+        self.journal.mark(1)
+        self.journal.sync()
+        with open(self.path, 'ab') as file:
+            file.write(b'{"n":2,"u"')
+
+        with self.assertLogs(level='WARNING'):
+            records = self._reopen()
+        self.assertEqual([{'n': 1, 'u': 1}], records)
+        self.journal.mark(2)
+        self.assertEqual(2, len(self._reopen()))
+
+    def test_compact(self):
+        """ Tests compaction keeps payloads which are not applied and recent updates only """
+        self._reopen(window=2, max_bytes=1)
+        for update_id in range(1, 5):
+            self.journal.append(update_id, s=[update_id])
+
+        self.assertTrue(self.journal.compact(applied=3))
+        self.assertEqual(1, self.journal.info()['compactions'])
+        records = self._reopen()
+        self.assertEqual([{'n': 3, 'u': 3}, {'n': 4, 'u': 4, 's': [4]}], records)
+        self.assertEqual(5, self.journal.append(5))
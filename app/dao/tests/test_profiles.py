@@ -0,0 +1,41 @@
+"""
+Unittests for engine profiles.
+"""
+import os
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy import text
+
+from app.dao.db import DataBaseConnector
+from app.dao.profiles import engine_options
+
+
+class TestEngineProfiles(TestCase):
+    """ Unit tests for engine profiles"""
+
+    def test_auto(self):
+        """ Tests profile is picked by dialect """
+        options, pragmas = engine_options('postgresql://bot@localhost/bot', pool_size=20)
+        self.assertEqual(20, options['pool_size'])
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual([], pragmas)
+
+        options, pragmas = engine_options('sqlite:///:memory:')
+        self.assertEqual({}, options)
+        self.assertNotIn('PRAGMA journal_mode = WAL', pragmas)
+
+        self.assertEqual(({}, []), engine_options('sqlite:///bot.db', 'default'))
+        with self.assertRaises(AssertionError):
+            engine_options('sqlite:///bot.db', 'postgresql')
+
+    def test_sqlite_file(self):
+        """ Tests WAL and synchronous mode are set on connections of file database """
+        with tempfile.TemporaryDirectory() as directory:
+            conn = DataBaseConnector(f"sqlite:///{os.path.join(directory, 'bot.db')}",
+                                     busy_timeout=2, synchronous='normal')
+            with conn.session_scope() as session:
+                self.assertEqual('wal', session.execute(text('PRAGMA journal_mode')).scalar())
+                self.assertEqual(1, session.execute(text('PRAGMA synchronous')).scalar())
+                self.assertEqual(2000, session.execute(text('PRAGMA busy_timeout')).scalar())
+            conn.engine.dispose()
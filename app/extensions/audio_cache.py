@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Union
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'bot_audio_cache')
+FILE_ID_SUFFIX = '.file_id'
+TMP_SUFFIX = '.tmp'
+
+
+class CachedAudio(NamedTuple):
+    key: str
+    path: str
+    size: int
+    file_id: Optional[str] = None
+
+
+class AudioCache:
+    """
+    Disk-backed cache of synthesized audio, bounded by total size of files (LRU eviction).
+
+    Entries are addressed by hash of synthesis parameters. Besides the file itself, Telegram
+    `file_id` of the first upload is kept in a sidecar file, so repeats don't even re-upload audio.
+    The in-memory index is rebuilt from the directory on startup (oldest modified evicted first).
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 100 * 1024 * 1024) -> None:
+        # empty directory (e.g. `AUDIO_CACHE_DIR=` in .env) means the default one
+        self.directory = directory or DEFAULT_DIRECTORY
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._index: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key(text: str, **params: str) -> str:
+        payload = '\0'.join([text] + [f'{k}={params[k]}' for k in sorted(params)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def info(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._index),
+                'bytes': self._size}
+
+    def get(self, key: str) -> Optional[CachedAudio]:
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or not os.path.exists(entry.path):
+                if entry is not None:
+                    self._forget(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+        os.utime(entry.path)
+        return entry
+
+    def put(
+            self,
+            key: str,
+            data: Union[bytes, memoryview],
+            ext: str = 'ogg',
+            file_id: Optional[str] = None
+    ) -> CachedAudio:
+        path = os.path.join(self.directory, f'{key}.{ext}')
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=TMP_SUFFIX,
+                                         delete=False) as file:
+            file.write(data)
+        os.replace(file.name, path)
+        if file_id:
+            self._write_file_id(key, file_id)
+
+        entry = CachedAudio(key=key, path=path, size=len(data), file_id=file_id)
+        with self._lock:
+            if key in self._index:
+                self._size -= self._index[key].size
+            self._index[key] = entry
+            self._size += entry.size
+            self._evict()
+        return entry
+
+    def set_file_id(self, key: str, file_id: str) -> None:
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return
+            self._index[key] = entry._replace(file_id=file_id)
+        self._write_file_id(key, file_id)
+
+    def _load(self) -> None:
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(TMP_SUFFIX):
+                os.unlink(path)
+                continue
+            if name.endswith(FILE_ID_SUFFIX) or not os.path.isfile(path):
+                continue
+            files.append((os.path.getmtime(path), name.split('.')[0], path))
+
+        for _, key, path in sorted(files):
+            file_id = None
+            if os.path.exists(self._file_id_path(key)):
+                with open(self._file_id_path(key)) as file:
+                    file_id = file.read().strip() or None
+            entry = CachedAudio(key=key, path=path, size=os.path.getsize(path),
+                                file_id=file_id)
+            self._index[key] = entry
+            self._size += entry.size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key = next(iter(self._index))
+            self._forget(key)
+
+    def _forget(self, key: str) -> None:
+        entry = self._index.pop(key)
+        self._size -= entry.size
+        for path in (entry.path, self._file_id_path(key)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as err:
+                logging.error(f'Failed to remove cached audio: {err}')
+
+    def _write_file_id(self, key: str, file_id: str) -> None:
+        with open(self._file_id_path(key), 'w') as file:
+            file.write(file_id)
+
+    def _file_id_path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}{FILE_ID_SUFFIX}')
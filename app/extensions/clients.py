@@ -0,0 +1,90 @@
+"""
+Registry of shared network clients used by extensions.
+
+Sessions keep connections to every upstream host alive between calls, retry transient
+failures with backoff and always apply a timeout. The Polly client is created once, because
+building a boto3 client loads botocore service models and costs much more than the call itself.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 10))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 3))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_polly: Optional[Any] = None
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """ Applies default timeout to requests which don't specify own one """
+
+    def __init__(self, *args, timeout: float = HTTP_TIMEOUT, **kwargs) -> None:
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if timeout is None:
+            timeout = self.timeout
+        return super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                            proxies=proxies)
+
+
+def get_session(url: str) -> requests.Session:
+    """ Returns keep-alive session for scheme and host of `url` """
+    parts = urlsplit(url)
+    key = f'{parts.scheme}://{parts.netloc}'
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _create_session()
+    return session
+
+
+def get_polly_client() -> Any:
+    global _polly
+    if _polly is None:
+        with _lock:
+            if _polly is None:
+                import boto3
+                _polly = boto3.client(
+                    'polly',
+                    region_name=os.getenv("AWS_DEFAULT_REGION"),
+                    endpoint_url=os.getenv("POLLY_ENDPOINT_URL") or None,
+                )
+    return _polly
+
+
+def close_all() -> None:
+    global _polly
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _polly = None
+
+
+def _create_session() -> requests.Session:
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+    )
+    adapter = TimeoutHTTPAdapter(
+        max_retries=retry,
+        pool_connections=1,
+        pool_maxsize=HTTP_POOL_SIZE,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
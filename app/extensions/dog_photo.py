@@ -1,24 +1,43 @@
 import os
 import re
-import requests
 
 from typing import Optional
 
-BASE_URL = os.getenv('DOG_PHOTO_URL', 'https://random.dog/woof.json')
+from . import clients
+
+# empty setting (e.g. `DOG_PHOTO_URL=` in .env) means the default source
+BASE_URL = os.getenv('DOG_PHOTO_URL') or 'https://random.dog/woof.json'
 WHITELISTED_FILE_EXTENSIONS = ('jpg', 'png', 'jpeg')
+MAX_RETRIES = int(os.getenv('PHOTO_MAX_RETRIES', 5))
 
 
 def get_url() -> str:
-    response = requests.get(BASE_URL)
+    response = clients.get_session(BASE_URL).get(BASE_URL)
     return response.json()['url']
 
 
-def get_photo_url() -> Optional[str]:
-    extension = None
-    url = None
-    while extension not in WHITELISTED_FILE_EXTENSIONS:
+async def get_url_async(session) -> str:
+    async with session.get(BASE_URL) as response:
+        return (await response.json(content_type=None))['url']
+
+
+def is_photo(url: str) -> bool:
+    match = re.search(r"([^.]*)$", url)
+    return match is not None and match.group(1).lower() in WHITELISTED_FILE_EXTENSIONS
+
+
+def get_photo_url(max_retries: int = MAX_RETRIES) -> Optional[str]:
+    for _ in range(max_retries):
         url = get_url()
-        match = re.search(r"([^.]*)$", url)
-        if match:
-            extension = match.group(1).lower()
-    return url
+        if is_photo(url):
+            return url
+    return None
+
+
+async def get_photo_url_async(session, max_retries: int = MAX_RETRIES) -> Optional[str]:
+    """ Same as `get_photo_url`, but uses shared aiohttp `session` """
+    for _ in range(max_retries):
+        url = await get_url_async(session)
+        if is_photo(url):
+            return url
+    return None
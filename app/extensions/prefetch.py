@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+
+from collections import deque, OrderedDict
+from typing import Callable, Deque, Dict, Optional
+
+
+class PhotoPrefetcher:
+    """
+    Keeps a bounded queue of validated photo urls from a random photo source.
+
+    Background thread refills the queue once its depth drops below `low_water`, so handlers
+    usually get an url without any network call. Urls which were served recently are skipped.
+    """
+
+    def __init__(
+            self,
+            fetch: Callable[[], str],
+            validate: Callable[[str], bool],
+            size: int = 10,
+            low_water: int = 3,
+            max_retries: int = 5,
+            recent_size: int = 100
+    ) -> None:
+        assert 0 <= low_water < size, "Low-water mark must be less than queue size!"
+        self._fetch = fetch
+        self._validate = validate
+        self.size = size
+        self.low_water = low_water
+        self.max_retries = max_retries
+        self.recent_size = recent_size
+
+        self._lock = threading.Lock()
+        self._queue: Deque[str] = deque()
+        self._recent: OrderedDict = OrderedDict()
+
+        self._refill = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.served = 0
+        self.fallbacks = 0
+        self.rejected = 0
+        self.refills = 0
+        self.last_refill_ms = 0.0
+        self.total_refill_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._refill.set()
+        self._thread = threading.Thread(target=self._run, name='photo-prefetcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._refill.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_nowait(self) -> Optional[str]:
+        """ Pops prefetched url, returns None if queue is empty """
+        with self._lock:
+            url = self._queue.popleft() if self._queue else None
+            if url:
+                self.served += 1
+                self._remember(url)
+            depth = len(self._queue)
+        if depth < self.low_water:
+            self._refill.set()
+        return url
+
+    def get(self) -> Optional[str]:
+        """ Pops prefetched url or fetches it synchronously if queue is empty """
+        url = self.get_nowait()
+        if url is None:
+            self.fallbacks += 1
+            url = self._fetch_valid(self._remember)
+        return url
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            'depth': len(self._queue),
+            'served': self.served,
+            'fallbacks': self.fallbacks,
+            'rejected': self.rejected,
+            'refills': self.refills,
+            'last_refill_ms': self.last_refill_ms,
+            'avg_refill_ms': self.total_refill_ms / self.refills if self.refills else 0.0,
+        }
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._refill.wait()
+            self._refill.clear()
+            while not self._stopped.is_set() and len(self._queue) < self.size:
+                started = time.perf_counter()
+                try:
+                    url = self._fetch_valid(self._queue.append)
+                except Exception as err:
+                    logging.error(f'Failed to prefetch photo: {err}')
+                    self._stopped.wait(1)
+                    continue
+                if url is None:
+                    self._stopped.wait(1)
+                    continue
+                self.last_refill_ms = (time.perf_counter() - started) * 1000
+                self.total_refill_ms += self.last_refill_ms
+                self.refills += 1
+
+    def _fetch_valid(self, claim: Callable[[str], None]) -> Optional[str]:
+        """ Fetches urls until a valid one not served or queued yet, `claim` takes it """
+        for _ in range(self.max_retries):
+            url = self._fetch()
+            if self._validate(url):
+                # checked and claimed at once, so handler and refill thread can't take same url
+                with self._lock:
+                    if url not in self._recent and url not in self._queue:
+                        claim(url)
+                        return url
+            self.rejected += 1
+        return None
+
+    def _remember(self, url: str) -> None:
+        self._recent[url] = None
+        if len(self._recent) > self.recent_size:
+            self._recent.popitem(last=False)
@@ -1,22 +1,39 @@
+import asyncio
 import logging
 import os
 
-import requests
 from requests import HTTPError
-from PIL import Image
 from io import BytesIO
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
 
-BASE_URL = 'http://api.screenshotlayer.com/api/capture'
+from . import clients
 
+BASE_URL = os.getenv('SCREENSHOT_URL', 'http://api.screenshotlayer.com/api/capture')
+DEFAULT_VIEWPORT = '1440x900'
+# captures bigger than this are downscaled and re-encoded as JPEG, 0 disables it
+MAX_BYTES = int(os.getenv('SCREENSHOT_MAX_BYTES', 5 * 1024 * 1024))
+MAX_SIDE = int(os.getenv('SCREENSHOT_MAX_SIDE', 2560))
+JPEG_QUALITY = int(os.getenv('SCREENSHOT_JPEG_QUALITY', 85))
+CHUNK_SIZE = 64 * 1024
 
-def take_screenshot(url: str = '', viewport: str = '1440x900'):
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def take_screenshot(url: str = '', viewport: str = DEFAULT_VIEWPORT) -> Optional[BytesIO]:
     assert url, "Requested url can't be empty!"
 
     access_key = os.getenv("SCREENSHOT_API_KEY")
     assert access_key, "Screenshot API Key must be not empty!"
 
     try:
-        response = requests.get(
+        with clients.get_session(BASE_URL).get(
             BASE_URL,
             params={
                 'access_key': access_key,
@@ -24,15 +41,106 @@ def take_screenshot(url: str = '', viewport: str = '1440x900'):
                 'viewport': viewport,
             },
             stream=True,
-        )
-        img = Image.open(response.raw)
-        bio = BytesIO()
-        bio.name = 'screenshot.png'
-        img.save(bio, 'PNG')
-        bio.seek(0)
-        return bio
+        ) as response:
+            response.raise_for_status()
+            data = BytesIO()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                data.write(chunk)
+        return prepare(data)
 
     except HTTPError as http_err:
         logging.error(f'HTTP error occurred: {http_err}')
     except Exception as err:
         logging.error(f'Other error occurred: {err}')
+    return None
+
+
+async def take_screenshot_async(
+        session,
+        url: str = '',
+        viewport: str = DEFAULT_VIEWPORT
+) -> Optional[BytesIO]:
+    """ Same as `take_screenshot`, but uses shared aiohttp `session` """
+    assert url, "Requested url can't be empty!"
+
+    access_key = os.getenv("SCREENSHOT_API_KEY")
+    assert access_key, "Screenshot API Key must be not empty!"
+
+    try:
+        async with session.get(
+            BASE_URL,
+            params={
+                'access_key': access_key,
+                'url': url,
+                'viewport': viewport,
+            },
+        ) as response:
+            response.raise_for_status()
+            data = BytesIO()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                data.write(chunk)
+        if MAX_BYTES and data.tell() > MAX_BYTES:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, prepare, data)
+        return prepare(data)
+
+    except Exception as err:
+        logging.error(f'Error occurred: {err}')
+    return None
+
+
+def prepare(data: BytesIO) -> Optional[BytesIO]:
+    """
+    Passes upstream image through as is, if it's really an image.
+
+    Only oversized captures are decoded, downscaled and re-encoded as JPEG.
+    """
+    with data.getbuffer() as view:
+        image_type = detect_image_type(view[:8].tobytes())
+    if image_type is None:
+        logging.error('Screenshot service returned not an image')
+        return None
+
+    if MAX_BYTES and data.tell() > MAX_BYTES:
+        return _downscale(data)
+
+    data.name = f'screenshot.{image_type}'
+    data.seek(0)
+    return data
+
+
+def detect_image_type(header: bytes) -> Optional[str]:
+    for signature, image_type in SIGNATURES:
+        if header.startswith(signature):
+            return image_type
+    return None
+
+
+def normalize_url(url: str) -> str:
+    """ Canonical form of requested url, so equal pages share cached screenshots """
+    url = url.strip()
+    if '://' not in url:
+        url = f'http://{url}'
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{netloc}:{port}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def _downscale(data: BytesIO) -> BytesIO:
+    from PIL import Image
+
+    data.seek(0)
+    img = Image.open(data)
+    img.thumbnail((MAX_SIDE, MAX_SIDE))
+    bio = BytesIO()
+    bio.name = 'screenshot.jpg'
+    img.convert('RGB').save(bio, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    bio.seek(0)
+    return bio
@@ -0,0 +1,82 @@
+"""
+Unittests for synthesized audio cache.
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.extensions import audio_cache
+from app.extensions.audio_cache import AudioCache
+
+
+class TestAudioCache(TestCase):
+    """ Unit tests for Audio Cache"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = AudioCache(os.path.join(self.directory, 'cache'), max_bytes=25)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_empty_directory(self):
+        """ Tests cache built from empty `AUDIO_CACHE_DIR` uses the default directory """
+        default = os.path.join(self.directory, 'default')
+        with mock.patch.dict(os.environ, {'AUDIO_CACHE_DIR': ''}), \
+                mock.patch.object(audio_cache, 'DEFAULT_DIRECTORY', default):
+            cache = AudioCache(os.getenv('AUDIO_CACHE_DIR'))
+
+        self.assertEqual(default, cache.directory)
+        self.assertTrue(os.path.isdir(default))
+
+    def test_key(self):
+        """ Tests key depends on text and every parameter """
+        key = AudioCache.key('hi', language='ru-RU', voice='Maxim', engine='standard')
+
+        self.assertEqual(key, AudioCache.key('hi', engine='standard', voice='Maxim',
+                                             language='ru-RU'))
+        self.assertNotEqual(key, AudioCache.key('hi', language='ru-RU', voice='Tatyana',
+                                                engine='standard'))
+        self.assertNotEqual(key, AudioCache.key('hello', language='ru-RU', voice='Maxim',
+                                                engine='standard'))
+
+    def test_get_put(self):
+        """ Tests cached audio is served from file """
+        self.assertIsNone(self.cache.get('a'))
+
+        self.cache.put('a', b'x' * 10)
+        audio = self.cache.get('a')
+
+        self.assertIsNotNone(audio)
+        if audio:
+            self.assertEqual('a', audio.key)
+            self.assertEqual(10, audio.size)
+            self.assertIsNone(audio.file_id)
+            with open(audio.path, 'rb') as file:
+                self.assertEqual(b'x' * 10, file.read())
+
+    def test_eviction(self):
+        """ Tests least recently used audio is evicted when size limit is exceeded """
+        self.cache.put('a', b'x' * 10)
+        self.cache.put('b', b'x' * 10)
+        self.cache.get('a')
+        self.cache.put('c', b'x' * 10)
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_rebuild_index(self):
+        """ Tests index and file ids are restored from directory """
+        self.cache.put('a', b'x' * 10)
+        self.cache.put('b', b'x' * 10, file_id='b-file-id')
+        self.cache.set_file_id('a', 'telegram-file-id')
+
+        cache = AudioCache(self.cache.directory)
+        audio = cache.get('a')
+
+        self.assertIsNotNone(audio)
+        if audio:
+            self.assertEqual('telegram-file-id', audio.file_id)
+        self.assertEqual('b-file-id', getattr(cache.get('b'), 'file_id', None))
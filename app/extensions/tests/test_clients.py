@@ -0,0 +1,40 @@
+"""
+Unittests for shared clients registry.
+"""
+from unittest import TestCase, mock
+
+from requests.adapters import HTTPAdapter
+
+from app.extensions import clients
+
+
+class TestClients(TestCase):
+    """ Unit tests for clients registry"""
+
+    def tearDown(self):
+        clients.close_all()
+
+    def test_session_per_host(self):
+        """ Tests sessions are reused per scheme and host """
+        session = clients.get_session('https://random.dog/woof.json')
+
+        self.assertIs(session, clients.get_session('https://random.dog/other'))
+        self.assertIsNot(session, clients.get_session('http://random.dog/woof.json'))
+        self.assertIsNot(session, clients.get_session('https://aws.random.cat/meow'))
+
+    def test_default_timeout(self):
+        """ Tests requests without timeout get default one """
+        adapter = clients.get_session('http://localhost').get_adapter('http://localhost')
+
+        with mock.patch.object(HTTPAdapter, 'send') as send:
+            adapter.send(mock.Mock())
+            self.assertEqual(clients.HTTP_TIMEOUT, send.call_args[1]['timeout'])
+
+            adapter.send(mock.Mock(), timeout=1)
+            self.assertEqual(1, send.call_args[1]['timeout'])
+
+    def test_polly_client(self):
+        """ Tests Polly client is created once """
+        with mock.patch('boto3.client') as client:
+            self.assertIs(clients.get_polly_client(), clients.get_polly_client())
+            self.assertEqual(1, client.call_count)
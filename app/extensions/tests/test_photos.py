@@ -0,0 +1,36 @@
+"""
+Unittests for dog and cat photo sources.
+"""
+import importlib
+import os
+from unittest import TestCase, mock
+
+from app.extensions import cat_photo, dog_photo
+
+
+class TestPhotoSources(TestCase):
+    """ Unit tests for photo sources"""
+
+    def tearDown(self):
+        # module constants are read on import, so modules are reloaded with the real env
+        importlib.reload(dog_photo)
+        importlib.reload(cat_photo)
+
+    def test_empty_url(self):
+        """ Tests empty url settings (as in .env.example) fall back to default sources """
+        with mock.patch.dict(os.environ, {'DOG_PHOTO_URL': '', 'CAT_PHOTO_URL': ''}):
+            importlib.reload(dog_photo)
+            importlib.reload(cat_photo)
+
+        self.assertEqual('https://random.dog/woof.json', dog_photo.BASE_URL)
+        self.assertEqual('http://aws.random.cat/meow', cat_photo.BASE_URL)
+
+    def test_custom_url(self):
+        """ Tests url settings override default sources """
+        with mock.patch.dict(os.environ, {'DOG_PHOTO_URL': 'http://dogs/',
+                                          'CAT_PHOTO_URL': 'http://cats/'}):
+            importlib.reload(dog_photo)
+            importlib.reload(cat_photo)
+
+        self.assertEqual('http://dogs/', dog_photo.BASE_URL)
+        self.assertEqual('http://cats/', cat_photo.BASE_URL)
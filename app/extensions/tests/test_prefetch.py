@@ -0,0 +1,84 @@
+"""
+Unittests for photo prefetcher.
+"""
+import threading
+import time
+from itertools import count
+from unittest import TestCase
+
+from app.extensions.prefetch import PhotoPrefetcher
+
+
+def is_photo(url):
+    return url.endswith('.jpg')
+
+
+class TestPhotoPrefetcher(TestCase):
+    """ Unit tests for Photo Prefetcher"""
+
+    def setUp(self):
+        self.counter = count()
+
+    def fetch(self):
+        n = next(self.counter)
+        return f'http://photo/{n}.mp4' if n % 2 else f'http://photo/{n}.jpg'
+
+    def test_fallback(self):
+        """ Tests photo is fetched synchronously while queue is empty """
+        prefetcher = PhotoPrefetcher(self.fetch, is_photo)
+
+        self.assertEqual('http://photo/0.jpg', prefetcher.get())
+        self.assertEqual('http://photo/2.jpg', prefetcher.get())
+        self.assertEqual(2, prefetcher.metrics()['fallbacks'])
+        self.assertIsNone(prefetcher.get_nowait())
+
+    def test_max_retries(self):
+        """ Tests source returning no photos gives up after max retries """
+        prefetcher = PhotoPrefetcher(lambda: 'http://photo/1.gif', is_photo, max_retries=3)
+
+        self.assertIsNone(prefetcher.get())
+        self.assertEqual(3, prefetcher.metrics()['rejected'])
+
+    def test_recent_urls(self):
+        """ Tests recently served urls are skipped """
+        prefetcher = PhotoPrefetcher(lambda: 'http://photo/1.jpg', is_photo)
+
+        self.assertEqual('http://photo/1.jpg', prefetcher.get())
+        self.assertIsNone(prefetcher.get())
+
+    def test_concurrent_fallbacks(self):
+        """ Tests handlers fetching at the same time never get the same url """
+        def slow_photo(url):
+            time.sleep(0.01)
+            return is_photo(url)
+
+        prefetcher = PhotoPrefetcher(lambda: f'http://photo/{next(self.counter) % 3}.jpg',
+                                     slow_photo, max_retries=10)
+        urls = []
+        threads = [threading.Thread(target=lambda: urls.append(prefetcher.get()))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        served = [url for url in urls if url]
+        self.assertEqual(3, len(served))
+        self.assertEqual(3, len(set(served)))
+
+    def test_refill(self):
+        """ Tests background thread keeps queue filled """
+        prefetcher = PhotoPrefetcher(self.fetch, is_photo, size=5, low_water=2)
+        prefetcher.start()
+        try:
+            deadline = time.monotonic() + 2
+            while len(prefetcher) < 5 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(5, prefetcher.metrics()['depth'])
+
+            urls = [prefetcher.get_nowait() for _ in range(5)]
+            self.assertEqual(5, len(set(urls)))
+            self.assertTrue(all(url and is_photo(url) for url in urls))
+            self.assertEqual(5, prefetcher.metrics()['served'])
+        finally:
+            prefetcher.stop()
@@ -0,0 +1,64 @@
+"""
+Unittests for screenshot extension.
+"""
+from io import BytesIO
+from unittest import TestCase, mock
+
+from PIL import Image
+
+from app.extensions import screenshoter
+
+
+def png(width, height):
+    data = BytesIO()
+    Image.new('RGB', (width, height), 'white').save(data, 'PNG')
+    return data
+
+
+class TestPrepare(TestCase):
+    """ Unit tests for screenshot post-processing"""
+
+    def test_passthrough(self):
+        """ Tests upstream image is sent as is """
+        data = png(20, 10)
+        payload = data.getvalue()
+
+        screen = screenshoter.prepare(data)
+
+        self.assertIs(data, screen)
+        if screen:
+            self.assertEqual('screenshot.png', screen.name)
+            self.assertEqual(payload, screen.read())
+
+    def test_not_image(self):
+        """ Tests error payloads are rejected """
+        data = BytesIO()
+        data.write(b'{"success": false, "error": {"code": 101}}')
+
+        self.assertIsNone(screenshoter.prepare(data))
+
+    def test_downscale(self):
+        """ Tests oversized capture is downscaled to JPEG """
+        data = png(400, 200)
+
+        with mock.patch.object(screenshoter, 'MAX_BYTES', 10), \
+                mock.patch.object(screenshoter, 'MAX_SIDE', 100):
+            screen = screenshoter.prepare(data)
+
+        self.assertIsNotNone(screen)
+        if screen:
+            self.assertEqual('screenshot.jpg', screen.name)
+            img = Image.open(screen)
+            self.assertEqual('JPEG', img.format)
+            self.assertEqual((100, 50), img.size)
+
+
+class TestNormalizeUrl(TestCase):
+    """ Unit tests for url normalization"""
+
+    def test_normalize_url(self):
+        for url in ('example.com', 'HTTP://Example.com:80/', 'http://example.com/#top'):
+            self.assertEqual('http://example.com/', screenshoter.normalize_url(url))
+
+        self.assertEqual('https://example.com:8443/a?b=1',
+                         screenshoter.normalize_url('https://EXAMPLE.com:8443/a?b=1'))
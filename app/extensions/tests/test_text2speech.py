@@ -0,0 +1,46 @@
+"""
+Unittests for text to speech extension.
+"""
+from io import BytesIO
+from unittest import TestCase, mock
+
+from app.extensions import text2speech
+
+
+class TestGenerateAudio(TestCase):
+    """ Unit tests for audio generation with stubbed Polly"""
+
+    def setUp(self):
+        self.polly = mock.Mock()
+        for patcher in (
+                mock.patch('app.extensions.clients.get_polly_client', return_value=self.polly),
+                mock.patch.object(text2speech, 'OUTPUT_FORMAT', 'ogg_opus'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_in_memory_audio(self):
+        """ Tests audio stream is read into in-memory file """
+        payload = b'o' * (text2speech.CHUNK_SIZE * 2 + 10)
+        self.polly.synthesize_speech.return_value = {'AudioStream': BytesIO(payload)}
+
+        audio = text2speech.generate_audio(language='en-US', voice='Joey', text='hi')
+
+        self.assertIsNotNone(audio)
+        if audio:
+            self.assertEqual(payload, audio.read())
+            self.assertEqual('voice.ogg', audio.name)
+        self.polly.synthesize_speech.assert_called_once_with(
+            Engine=text2speech.ENGINE,
+            LanguageCode='en-US',
+            OutputFormat='ogg_opus',
+            Text='hi',
+            TextType='text',
+            VoiceId='Joey',
+        )
+
+    def test_no_audio(self):
+        """ Tests response without audio stream """
+        self.polly.synthesize_speech.return_value = {}
+
+        self.assertIsNone(text2speech.generate_audio(text='hi'))
@@ -1,41 +1,75 @@
 #!/usr/bin/env python
+import asyncio
 import os
 import logging
-import boto3
 
-from typing import Optional, IO
+from typing import Dict, Optional
 from contextlib import closing
-from tempfile import NamedTemporaryFile
+from functools import partial
+from io import BytesIO
+
+from . import clients
+
+ENGINE = os.getenv("T2S_ENGINE", 'standard')
+# ogg_opus is native format of Telegram voice messages, so they are not transcoded by Telegram
+OUTPUT_FORMAT = os.getenv("T2S_OUTPUT_FORMAT", 'ogg_opus')
+FILE_EXTENSIONS = {'ogg_opus': 'ogg', 'ogg_vorbis': 'ogg'}
+CHUNK_SIZE = 64 * 1024
+
+
+def voice_params(language: Optional[str] = None, voice: Optional[str] = None) -> Dict[str, str]:
+    """ Synthesis parameters with defaults applied, together with text they identify the audio """
+    return {
+        'language': language or os.getenv("T2S_LANGUAGE") or 'ru-RU',
+        'voice': voice or os.getenv("T2S_VOICE") or 'Maxim',
+        'engine': ENGINE,
+        'output_format': OUTPUT_FORMAT,
+    }
 
 
 def generate_audio(
         language: Optional[str] = None,
         voice: Optional[str] = None,
         text: str = ''
-) -> Optional[IO[bytes]]:
-    """ Transform text into speech and provides audio file (mp3) as binary array """
-    language = language or os.getenv("T2S_LANGUAGE", 'ru-RU')
-    voice = voice or os.getenv("T2S_VOICE", 'Maxim')
+) -> Optional[BytesIO]:
+    """ Transform text into speech and provides audio (OUTPUT_FORMAT) as in-memory file """
+    params = voice_params(language, voice)
 
-    client = boto3.client('polly', region_name=os.getenv("AWS_DEFAULT_REGION"))
+    client = clients.get_polly_client()
 
     response = client.synthesize_speech(
-        Engine='standard',
-        LanguageCode=language,
-        OutputFormat='mp3',
+        Engine=params['engine'],
+        LanguageCode=params['language'],
+        OutputFormat=params['output_format'],
         Text=text,
         TextType='text',
-        VoiceId=voice,
+        VoiceId=params['voice'],
     )
 
     if "AudioStream" in response:
         with closing(response["AudioStream"]) as stream:
             try:
-                # Open a file for writing the output as a binary stream
-                with NamedTemporaryFile(delete=False) as file:
-                    file.write(stream.read())
-                    return file
+                audio = BytesIO()
+                audio.name = f'voice.{file_extension(params["output_format"])}'
+                for chunk in iter(partial(stream.read, CHUNK_SIZE), b''):
+                    audio.write(chunk)
+                audio.seek(0)
+                return audio
             except IOError as error:
-                # Could not write to file, exit gracefully
+                # Could not read the stream, exit gracefully
                 logging.error(error)
     return None
+
+
+def file_extension(output_format: str) -> str:
+    return FILE_EXTENSIONS.get(output_format, output_format)
+
+
+async def generate_audio_async(
+        language: Optional[str] = None,
+        voice: Optional[str] = None,
+        text: str = ''
+) -> Optional[BytesIO]:
+    """ Same as `generate_audio`, but doesn't block event loop (boto3 has no async API) """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(generate_audio, language, voice, text))
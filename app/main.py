@@ -1,19 +1,47 @@
 #!/usr/bin/env python
+import asyncio
 import os
 import logging
-import random
-import re
-import json
+import signal
+import tempfile
+import threading
 import gettext
 
-from typing import Any, TypeVar, cast
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, cast
 from dotenv import load_dotenv
 from functools import wraps
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters
+from io import BytesIO
+from telegram import Bot, InputFile, Message, TelegramError, Update
+from telegram.ext import DispatcherHandlerStop, Updater, MessageHandler, Filters, TypeHandler
+from telegram.utils.request import Request
 from typing_extensions import Protocol
 
-from dao.db import DataBaseConnector, UserDao, CommandDao, StatisticsDao
-from extensions import dog_photo, cat_photo, text2speech, screenshoter
+from core import instrumentation, startup
+from core.aio import AsyncExecutor
+from core.commands import CommandRegistry
+from core.instrumentation import MetricsServer
+from core.jobs import JobScheduler
+from core.metrics import REGISTRY
+from core.outbox import Outbox
+from core.plugins import Plugin, PluginManager, Resources
+from core.ratelimit import Limit, RateLimiter, SendLimiter, parse_limit
+from core.sharding import ShardRouter, consume
+from core.singleflight import SingleFlight
+from core.webhook import WebhookServer
+from dao.buffer import StatisticsBuffer
+from dao.cache import LRUCache
+from dao.db import DataBaseConnector, UserDao, CommandDao, SettingsDao, StatisticsDao
+from dao.journal import UpdateJournal
+from extensions.audio_cache import AudioCache, CachedAudio
+from extensions.prefetch import PhotoPrefetcher
+
+# imported on first use of their commands (or by warmup), they pull in requests, boto3 and PIL
+dog_photo = startup.lazy_import('extensions.dog_photo')
+cat_photo = startup.lazy_import('extensions.cat_photo')
+text2speech = startup.lazy_import('extensions.text2speech')
+screenshoter = startup.lazy_import('extensions.screenshoter')
+clients = startup.lazy_import('extensions.clients')
+export = startup.lazy_import('dao.export')
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -21,6 +49,7 @@ logging.basicConfig(level=logging.INFO,
 
 class FuncProtocol(Protocol):
     __call__: Any
+    __name__: str
 
 
 F = TypeVar('F', bound=FuncProtocol)
@@ -39,19 +68,65 @@ lang = gettext.translation(
 lang.install()
 _ = lang.gettext
 
+startup.REPORT.mark('imports')
+
+
+# Bot API limit of uploaded files
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+
+class InstrumentedBot(Bot):
+    """ Reports time of every Bot API call to instrumentation, keeps sends within flood limits """
+
+    def __init__(self, *args, outbox: Optional[Outbox] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbox = outbox
+        self._unqueued = threading.local()
+
+    def send_message_now(self, *args, **kwargs) -> Optional[Message]:
+        """ Like `send_message`, but returns None instead of queueing message over limits """
+        self._unqueued.active = True
+        try:
+            return self.send_message(*args, **kwargs)
+        finally:
+            self._unqueued.active = False
+
+    def _post(self, endpoint, data=None, *args, **kwargs):
+        if not (self.outbox and endpoint.startswith('send') and data and 'chat_id' in data):
+            return self._timed_post(endpoint, data, *args, **kwargs)
+        if getattr(self._unqueued, 'active', False):
+            now = self.outbox.send_now(data['chat_id'],
+                                       lambda: self._timed_post(endpoint, data, *args, **kwargs))
+            return now.result() if now is not None else None
+        future = self.outbox.send(data['chat_id'],
+                                  lambda: self._timed_post(endpoint, data, *args, **kwargs))
+        if future.done() or any(isinstance(value, InputFile) for value in data.values()):
+            # callers of uploads need file id, uploads run on job lanes and wait for their chat
+            return future.result()
+        # message is queued behind earlier ones of its chat, caller gets `None` instead of it
+        return None
+
+    def _timed_post(self, endpoint, data=None, *args, **kwargs):
+        with instrumentation.timed('telegram', endpoint):
+            return super()._post(endpoint, data, *args, **kwargs)
+
 
 class TelegramBot:
     def __init__(self, token: str, db_url: str):
         assert token, "Token must be not None"
         assert db_url, "Database url must be not None"
         self._token = token
-        self._updater = Updater(token=token, use_context=True)
+        # same connection pool size as Updater creates for its own bot
+        self.send_limiter = create_send_limiter()
+        self.outbox = Outbox(self.send_limiter,
+                             max_queue=int(os.getenv('SEND_QUEUE_SIZE', 100)))
+        base_url, base_file_url = api_urls()
+        bot = InstrumentedBot(token, request=Request(con_pool_size=8), base_url=base_url,
+                              base_file_url=base_file_url, outbox=self.outbox)
+        self._updater = Updater(bot=bot, use_context=True)
         self._dispatcher = self._updater.dispatcher
 
-        self.is_running = True  # since we use supervisor, we can't just turn off application
-
         self.SAY_CMD = 'say'
-        self.BIBA_CMD = 'biba'
         self.PING_CMD = 'ping'
         self.HELP_CMD = 'help'
         self.WOOF_CMD = 'woof'
@@ -59,66 +134,395 @@ class TelegramBot:
         self.STATISTICS_CMD = os.getenv('STATISTICS_COMMAND', 'stat')
         self.EXIT_CMD = os.getenv('EXIT_COMMAND', 'bye')
         self.SCREENSHOT_CMD = 'shot'
+        self.PERF_CMD = os.getenv('PERF_COMMAND', 'perf')
+        self.EXPORT_CMD = os.getenv('EXPORT_COMMAND', 'export')
+        self.RELOAD_CMD = os.getenv('RELOAD_COMMAND', 'reload')
+        self.admin_ids = {int(id) for id in os.getenv('ADMIN_USER_IDS', '').split(',') if id}
+        self.commands = CommandRegistry()
+        # commands of `plugins` package and entry points, imported on first use
+        self.plugins = PluginManager('plugins', self._plugin_resources)
+        self.plugin_commands: List[str] = []
 
-        self.db = DataBaseConnector(db_url)
+        self.db = create_connector(db_url)
+        instrumentation.instrument_engine(
+            self.db.engine,
+            slow_query_ms=float(os.getenv('SLOW_QUERY_MS', 100)),
+        )
 
-        self.user_dao = UserDao(self.db)
-        self.cmd_dao = CommandDao(self.db)
+        self.user_dao = UserDao(
+            self.db,
+            cache_size=int(os.getenv('USER_CACHE_SIZE', 1024)),
+            cache_ttl=float(os.getenv('USER_CACHE_TTL', 300)),
+        )
+        self.settings_dao = SettingsDao(
+            self.db,
+            cache_ttl=float(os.getenv('SETTINGS_CACHE_TTL', 1)),
+        )
+        self.cmd_dao = CommandDao(self.db, cache_ttl=float(os.getenv('COMMAND_CACHE_TTL', 60)))
         self.statistic_dao = StatisticsDao(self.db)
+        self.statistic_dao.ensure_totals()
+        startup.REPORT.mark('database')
+        self.statistics_page_size = int(os.getenv('STATISTICS_PAGE_SIZE', 10))
+        # rendered reports, checked against statistics version (same for all workers) before use
+        self.statistics_reports = LRUCache(
+            maxsize=64,
+            ttl=float(os.getenv('STATISTICS_REPORT_TTL', 30)),
+        )
+        # processed updates and their statistics survive crashes and restarts
+        journal_path = os.getenv('STATISTICS_JOURNAL')
+        self.journal = UpdateJournal(
+            journal_path,
+            sync_interval=float(os.getenv('JOURNAL_SYNC_INTERVAL', 0.2)),
+            window=int(os.getenv('JOURNAL_WINDOW', 10000)),
+            max_bytes=int(os.getenv('JOURNAL_MAX_BYTES', 1024 * 1024)),
+        ) if journal_path else None
+        self.statistics_buffer = StatisticsBuffer(
+            self.statistic_dao,
+            flush_interval=float(os.getenv('STATISTICS_FLUSH_INTERVAL', 5)),
+            flush_size=int(os.getenv('STATISTICS_FLUSH_SIZE', 500)),
+            journal=self.journal,
+            journal_name=os.path.basename(journal_path or 'statistics'),
+        )
+
+        # lambdas, so extension modules are not imported before prefetch starts
+        self.dog_photos = self._photo_prefetcher(lambda: dog_photo.get_url(),
+                                                 lambda url: dog_photo.is_photo(url))
+        self.cat_photos = self._photo_prefetcher(lambda: cat_photo.get_url(),
+                                                 lambda url: cat_photo.is_photo(url))
+
+        self.audio_cache = AudioCache(
+            os.getenv('AUDIO_CACHE_DIR'),
+            max_bytes=int(os.getenv('AUDIO_CACHE_SIZE_MB', 100)) * 1024 * 1024,
+        )
+
+        self.screenshots = LRUCache(
+            maxsize=int(os.getenv('SCREENSHOT_CACHE_SIZE', 256)),
+            ttl=float(os.getenv('SCREENSHOT_CACHE_TTL', 3600)),
+        )
+
+        # coalesces identical concurrent requests to paid services
+        coalesce_window = float(os.getenv('COALESCE_WINDOW', 1))
+        self.screenshot_flights = SingleFlight('screenshot', window=coalesce_window)
+        self.say_flights = SingleFlight('say', window=coalesce_window)
+
+        self.jobs = JobScheduler(
+            concurrency={
+                'screenshot': int(os.getenv('SCREENSHOT_CONCURRENCY', 2)),
+                'say': int(os.getenv('SAY_CONCURRENCY', 2)),
+                'export': int(os.getenv('EXPORT_CONCURRENCY', 1)),
+            },
+            max_queue=int(os.getenv('JOB_QUEUE_SIZE', 100)),
+            deadline=float(os.getenv('JOB_DEADLINE', 60)),
+        )
+
+        self.executor: Optional[AsyncExecutor] = None
+        if os.getenv('EXECUTION_MODE', 'sync') == 'async':
+            self.executor = AsyncExecutor(
+                concurrency={
+                    'screenshoter': int(os.getenv('SCREENSHOT_CONCURRENCY', 2)),
+                    'text2speech': int(os.getenv('SAY_CONCURRENCY', 2)),
+                },
+                default_concurrency=int(os.getenv('EXTENSION_CONCURRENCY', 4)),
+                default_timeout=float(os.getenv('EXTENSION_TIMEOUT', 15)),
+            )
+
+        self.rate_limiter = RateLimiter(
+            limits={
+                kind: parse_limit(value)
+                for kind, value in (
+                    ('default', os.getenv('RATE_LIMIT', '20/60:10')),
+                    ('expensive', os.getenv('RATE_LIMIT_EXPENSIVE', '5/60:3')),
+                )
+                if value
+            },
+            max_buckets=int(os.getenv('RATE_LIMIT_BUCKETS', 10000)),
+        )
+
+        self.metrics_server: Optional[MetricsServer] = None
+        instrumentation.register_stats('bot_plugins', 'manager', {'plugins': self.plugins.info})
+        instrumentation.register_stats('bot_ratelimit', 'limiter', {
+            'commands': self.rate_limiter.info,
+            'sends': self.send_limiter.info,
+            'outbox': self.outbox.info,
+        })
+        instrumentation.register_stats('bot_cache', 'cache', {
+            'users': self.user_dao.cache_info,
+            'commands': self.cmd_dao.cache_info,
+            'settings': self.settings_dao.cache_info,
+            'statistics_reports': self.statistics_reports.info,
+            'screenshots': self.screenshots.info,
+            'audio': self.audio_cache.info,
+        })
+        instrumentation.register_stats('bot_prefetch', 'source', {
+            'dog_photo': self.dog_photos.metrics,
+            'cat_photo': self.cat_photos.metrics,
+        })
+        REGISTRY.gauge('bot_statistics_pending', 'Statistics events waiting for flush',
+                       callback=lambda: {(): float(len(self.statistics_buffer))})
+        if self.journal:
+            instrumentation.register_stats('bot_journal', 'journal',
+                                           {'statistics': self.journal.info})
+
+        self.warmup = startup.Warmup(delay=float(os.getenv('WARMUP_DELAY', 1)))
+        self.warmup.add('commands', lambda: self.cmd_dao.get_by_name(self.PING_CMD))
+        self.warmup.add('dog_photo', self.dog_photos.start)
+        self.warmup.add('cat_photo', self.cat_photos.start)
+        self.warmup.add('text2speech', lambda: clients.get_polly_client())
+        self.warmup.add('screenshoter', lambda: clients.get_session(screenshoter.BASE_URL))
+        startup.REPORT.mark('components')
 
     def init_handlers(self):
-        for handler in (
-                CommandHandler(self.BIBA_CMD, self.bibametr_cmd),
-                CommandHandler(self.PING_CMD, self.ping_cmd),
-                CommandHandler(self.WOOF_CMD, self.woof_cmd),
-                CommandHandler(self.MEOW_CMD, self.meow_cmd),
-                CommandHandler(self.SAY_CMD, self.say_cmd),
-                CommandHandler(self.HELP_CMD, self.help_cmd),
-                CommandHandler(self.STATISTICS_CMD, self.statistics_cmd),
-                CommandHandler(self.EXIT_CMD, self.secret_exit_cmd),
-                CommandHandler(self.SCREENSHOT_CMD, self.screenshot_cmd),
-                MessageHandler(Filters.command, self.unknown_cmd),
-        ):
-            self._dispatcher.add_handler(handler)
+        # `order` is the position in /help, /biba plugin goes between /say and /help
+        self.commands.add(self.SAY_CMD, self.say_cmd, rate='expensive', order=10)
+        self.commands.add(self.HELP_CMD, self.help_cmd, order=30)
+        self.commands.add(self.STATISTICS_CMD, self.statistics_cmd, order=40)
+        self.commands.add(self.SCREENSHOT_CMD, self.screenshot_cmd, rate='expensive', order=50)
+        self.commands.add(self.MEOW_CMD, self.meow_cmd, order=60)
+        self.commands.add(self.WOOF_CMD, self.woof_cmd, order=70)
+        self.commands.add(self.PING_CMD, self.ping_cmd, order=80)
+        self.commands.add(self.EXIT_CMD, self.secret_exit_cmd, hidden=True, always=True,
+                          rate=None)
+        self.commands.add(self.PERF_CMD, self.perf_cmd, hidden=True, always=True, admin=True,
+                          rate=None)
+        self.commands.add(self.EXPORT_CMD, self.export_cmd, hidden=True, always=True,
+                          admin=True, rate=None)
+        self.commands.add(self.RELOAD_CMD, self.reload_cmd, hidden=True, always=True,
+                          admin=True, rate=None)
+        self.register_plugins()
+        # every command goes through a single handler instead of a linear list of handlers
+        self._dispatcher.add_handler(
+            MessageHandler(Filters.command & Filters.update.message, self.dispatch)
+        )
+        if self.journal:
+            # re-delivered updates are dropped before commands, handled ones are journaled after
+            self._dispatcher.add_handler(TypeHandler(Update, self.skip_processed), group=-1)
+            self._dispatcher.add_handler(TypeHandler(Update, self.journal_update), group=1)
+
+    def register_plugins(self) -> None:
+        """ (Re)discovers plugins, modules of loaded ones are reloaded on their next use """
+        for name in self.plugin_commands:
+            self.commands.remove(name)
+        self.plugin_commands = []
+        for plugin in self.plugins.discover():
+            if plugin.name in self.commands:
+                logging.warning(f'Plugin {plugin.name} is skipped, command already exists')
+                continue
+            self.commands.add(plugin.name, self._plugin_handler(plugin.name), **plugin.options)
+            self.plugin_commands.append(plugin.name)
+
+    def _plugin_handler(self, name: str) -> Callable:
+        def handler(update, context):
+            plugin = self.plugins.load(name)
+            lane = plugin.resources.lane
+            if lane is None:
+                self.plugins.call(name, update, context)
+                return
+
+            def job():
+                with instrumentation.track(handler.__name__, 'job'):
+                    self.plugins.call(name, update, context)
+
+            if not self.jobs.submit(lane, update.message.from_user.id, job):
+                context.bot.send_message(chat_id=update.message.chat_id, text=_("Try again!"))
+
+        handler.__name__ = f'{name}_plugin'
+        return handler
+
+    def _plugin_resources(self, plugin: Plugin, declared: Dict[str, Any]) -> Resources:
+        lane = None
+        if declared.get('concurrency'):
+            lane = f'plugin_{plugin.name}'
+            # lane of a reloaded plugin may be running already, it is resized then
+            self.jobs.set_concurrency(lane, int(declared['concurrency']))
+        cache = declared.get('cache')
+        return Resources(
+            gettext=_,
+            http=clients.get_session(declared['http']) if declared.get('http') else None,
+            cache=LRUCache(**cache) if cache else None,
+            lane=lane,
+        )
+
+    @property
+    def is_running(self) -> bool:
+        # since we use supervisor, we can't just turn off application, state is shared by workers
+        return self.settings_dao.get('is_running', '1') == '1'
+
+    @is_running.setter
+    def is_running(self, value: bool) -> None:
+        self.settings_dao.set('is_running', '1' if value else '0')
 
     def start(self):
-        self._updater.start_polling()
-        self._updater.idle()
-
-    def log_event(fn: F) -> F:
-        @wraps(fn)
-        def wrapped(self, *args, **kwargs):
-            msg_text = args[0].message.text
-            parsed_commands = re.findall(r"/(\w+)[ ]?", msg_text)
-            command = None
-            if len(parsed_commands) == 1:
-                command = self.cmd_dao.get_by_name(parsed_commands[0])
-
-            if command:
-                user_id = args[0].message.from_user.id
-                user = self.user_dao.get_by_id(user_id)
-
-                if user:
-                    self.statistic_dao.increment(user['id'], command['id'])
+        self._start_services()
+        try:
+            if os.getenv('UPDATE_MODE', 'polling') == 'webhook':
+                serve_webhook(create_webhook(self._process_update), self._dispatcher.bot)
+            else:
+                if self.journal and self.journal.offset:
+                    # updates processed before restart are confirmed by the first request
+                    cast(Any, self._updater).last_update_id = self.journal.offset
+                self._updater.start_polling()
+                startup.REPORT.mark('polling')
+                startup.REPORT.report()
+                self._updater.idle()
+        finally:
+            self._stop_services()
+
+    def serve(self, updates) -> None:
+        """ Handles updates routed from ingress process until it sends None """
+        self._start_services()
+        try:
+            consume(updates, self._process_update)
+        finally:
+            self._stop_services()
+
+    def _start_services(self) -> None:
+        self.statistics_buffer.recover()
+        self.statistics_buffer.start()
+        if self.journal:
+            self.journal.start()
+        self.warmup.start()
+        if self.executor:
+            self.executor.start()
+        if os.getenv('METRICS_PORT'):
+            self.metrics_server = MetricsServer(int(os.getenv('METRICS_PORT', 0)))
+            self.metrics_server.start()
+
+    def _stop_services(self) -> None:
+        self.warmup.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.executor:
+            self.executor.stop()
+        self.jobs.stop(timeout=5)
+        self.outbox.stop(timeout=5)
+        self.dog_photos.stop()
+        self.cat_photos.stop()
+        self.statistics_buffer.stop()
+        if self.journal:
+            self.journal.stop()
+
+    def _process_update(self, data: Dict[str, Any]) -> None:
+        self._dispatcher.process_update(Update.de_json(data, self._dispatcher.bot))
+
+    @staticmethod
+    def _photo_prefetcher(fetch, validate) -> PhotoPrefetcher:
+        return PhotoPrefetcher(
+            fetch,
+            validate,
+            size=int(os.getenv('PHOTO_PREFETCH_SIZE', 10)),
+            low_water=int(os.getenv('PHOTO_PREFETCH_LOW_WATER', 3)),
+            max_retries=int(os.getenv('PHOTO_MAX_RETRIES', 5)),
+        )
+
+    def dispatch(self, update, context):
+        """ Routes command message to its handler, applying options of the command """
+        message = update.message
+        parsed = self.commands.parse(message.text, self._dispatcher.bot.username)
+        if parsed is None:
+            return
+        command = parsed.command
+        if command is None:
+            self.unknown_cmd(update, context)
+            return
+        context.args = parsed.args
+
+        with instrumentation.track(command.handler.__name__):
+            if not command.always and not self.is_running:
+                return
+            user_id = message.from_user.id
+            if command.rate and not self.rate_limiter.allow(user_id, command.rate):
+                if self.rate_limiter.should_notify(user_id, command.rate):
+                    # only once, so rejected spam doesn't turn into replies
+                    context.bot.send_message(chat_id=message.chat_id,
+                                             text=_("Too many requests, try later"))
+                return
+            if command.stats and self.cmd_dao.get_by_name(command.name):
+                from_user = message.from_user
+                self.statistics_buffer.add(
+                    from_user.id,
+                    command.name,
+                    username=from_user.username,
+                    first_name=from_user.first_name,
+                    last_name=from_user.last_name,
+                    update_id=update.update_id
+                )
+            if command.admin and user_id not in self.admin_ids:
+                # command is available to users from ADMIN_USER_IDS, unknown to everybody else
+                self.unknown_cmd(update, context)
+                return
+            command.handler(update, context)
+
+    def skip_processed(self, update, context):
+        """ Stops handling of an update delivered again, e.g. after a crash """
+        if self.journal and self.journal.seen(update.update_id):
+            logging.info(f'Update {update.update_id} is already processed')
+            raise DispatcherHandlerStop()
+
+    def journal_update(self, update, context):
+        if self.journal:
+            self.journal.mark(update.update_id)
+
+    def offload(coro_fn: Any) -> Callable[[F], F]:
+        """ In async mode handler is replaced with its coroutine variant `coro_fn` """
+        def decorator(fn: F) -> F:
+            @wraps(fn)
+            def wrapper(self, *args, **kwargs):
+                if self.executor is None:
+                    fn(self, *args, **kwargs)
                 else:
-                    self.user_dao.add(
-                        id=user_id,
-                        username=args[0].message.from_user.username,
-                        first_name=args[0].message.from_user.first_name,
-                        last_name=args[0].message.from_user.last_name
-                    )
+                    self.executor.submit(instrumentation.track_async(
+                        fn.__name__,
+                        'async',
+                        coro_fn(self, self.executor, *args, **kwargs),
+                    ))
+
+            return cast(F, wrapper)
+
+        return decorator
 
-            fn(self, *args, **kwargs)
+    def heavy(lane: str,  # type: ignore
+              answer_now: Optional[Callable[..., bool]] = None) -> Callable[[F], F]:
+        """
+        Handler runs on job scheduler `lane` instead of dispatcher thread, unless `answer_now`
+        (called with the same arguments) has answered the command already, e.g. from a cache
+        """
+        def decorator(fn: F) -> F:
+            @wraps(fn)
+            def wrapper(self, update, context):
+                if answer_now is not None and answer_now(self, update, context):
+                    return
+                chat_id = update.message.chat_id
+                placeholder = None
+                if self.jobs.busy(lane):
+                    # only a job which has to wait in the queue makes user wait for the answer,
+                    # placeholder is skipped if limits would queue it, as it could come too late
+                    placeholder = context.bot.send_message_now(chat_id=chat_id,
+                                                               text=_("Working on it..."))
 
-        return cast(F, wrapped)
+                def job():
+                    try:
+                        with instrumentation.track(fn.__name__, 'job'):
+                            fn(self, update, context)
+                    finally:
+                        # no placeholder if the lane was free or limits didn't allow to send it
+                        if placeholder:
+                            context.bot.delete_message(chat_id=chat_id,
+                                                       message_id=placeholder.message_id)
 
-    def command(fn: F) -> F:
-        @wraps(fn)
-        def wrapper(self, *args, **kwargs):
-            if self.is_running:
-                fn(self, *args, **kwargs)
+                def expired():
+                    if placeholder:
+                        context.bot.edit_message_text(chat_id=chat_id,
+                                                      message_id=placeholder.message_id,
+                                                      text=_("Try again!"))
+                    else:
+                        context.bot.send_message(chat_id=chat_id, text=_("Try again!"))
 
-        return cast(F, wrapper)
+                if not self.jobs.submit(lane, update.message.from_user.id, job, on_expired=expired):
+                    expired()
+
+            return cast(F, wrapper)
+
+        return decorator
 
     def unknown_cmd(self, update, context):
         context.bot.send_message(
@@ -126,110 +530,512 @@ class TelegramBot:
             text=_("I don't recognize the command.")
         )
 
-    @command
-    @log_event
-    def say_cmd(self, update, context):
+    async def say_async(self, executor: AsyncExecutor, update, context):
         ending = _(", master")
         draft_message = ' '.join(context.args).strip()
+        send = executor.run_blocking
         if 0 < len(draft_message) < 250:
             message = f"{draft_message}{ending}"
-            audio = text2speech.generate_audio(text=message)
-            if audio:
-                context.bot.send_voice(chat_id=update.message.chat_id, voice=open(audio.name, 'rb'))
-                os.unlink(audio.name)
-            else:
-                context.bot.send_message(chat_id=update.message.chat_id, text=_("Repeat please!"))
+            key = self.audio_cache.key(message, **text2speech.voice_params())
+            cached = self.audio_cache.get(key)
+            if cached:
+                await send(self._send_cached_voice, context, update.message.chat_id, cached)
+                return
+
+            async def speak():
+                try:
+                    audio = await executor.call(
+                        'text2speech', text2speech.generate_audio_async, text=message
+                    )
+                except asyncio.TimeoutError:
+                    audio = None
+                if audio:
+                    return await send(self._send_voice, context, update.message.chat_id, key,
+                                      audio)
+                await send(context.bot.send_message, chat_id=update.message.chat_id,
+                           text=_("Repeat please!"))
+
+            file_id, shared = await self.say_flights.do_async(key, speak)
+            if shared:
+                await send(self._send_shared, context, update.message.chat_id, file_id,
+                           context.bot.send_voice, 'voice', _("Repeat please!"))
         else:
+            await send(context.bot.send_message, chat_id=update.message.chat_id,
+                       text=_("Try again!"))
+
+    def say_now(self, update, context) -> bool:
+        """ Answers invalid /say, or /say of audio which is uploaded to Telegram already """
+        message = self._say_text(context.args)
+        if message is None:
             context.bot.send_message(chat_id=update.message.chat_id, text=_("Try again!"))
+            return True
+        cached = self.audio_cache.get(self.audio_cache.key(message, **text2speech.voice_params()))
+        if cached and cached.file_id:
+            context.bot.send_voice(chat_id=update.message.chat_id, voice=cached.file_id)
+            return True
+        return False
 
-    @command
-    @log_event
-    def bibametr_cmd(self, update, context):
-        length = random.randrange(3, 26)
-        context.bot.send_message(
-            chat_id=update.message.chat_id,
-            text=_("Your biba is ") + str(length) + _(", cm")
-        )
+    @offload(say_async)
+    @heavy('say', say_now)
+    def say_cmd(self, update, context):
+        message = self._say_text(context.args)
+        if message is None:
+            context.bot.send_message(chat_id=update.message.chat_id, text=_("Try again!"))
+            return
+        key = self.audio_cache.key(message, **text2speech.voice_params())
+        cached = self.audio_cache.get(key)
+        if cached:
+            # audio file is cached, but wasn't uploaded yet
+            self._send_cached_voice(context, update.message.chat_id, cached)
+            return
+
+        def speak():
+            with instrumentation.timed('external', 'text2speech'):
+                audio = text2speech.generate_audio(text=message)
+            if audio:
+                return self._send_voice(context, update.message.chat_id, key, audio)
+            context.bot.send_message(chat_id=update.message.chat_id, text=_("Repeat please!"))
+
+        # identical concurrent requests are voiced once, the others re-use uploaded file
+        file_id, shared = self.say_flights.do(key, speak)
+        if shared:
+            self._send_shared(context, update.message.chat_id, file_id,
+                              context.bot.send_voice, 'voice', _("Repeat please!"))
+
+    @staticmethod
+    def _say_text(args: List[str]) -> Optional[str]:
+        """ Text to voice, None if it is empty or too long """
+        ending = _(", master")
+        draft_message = ' '.join(args).strip()
+        if 0 < len(draft_message) < 250:
+            return f"{draft_message}{ending}"
+        return None
+
+    def _send_voice(self, context, chat_id: int, key: str, audio: BytesIO) -> Optional[str]:
+        """ Uploads generated audio straight from memory and then puts it into the cache """
+        message = context.bot.send_voice(chat_id=chat_id, voice=audio)
+        file_id = message.voice.file_id if message and message.voice else None
+        self.audio_cache.put(key, audio.getbuffer(), ext=audio.name.split('.')[-1],
+                             file_id=file_id)
+        return file_id
+
+    @staticmethod
+    def _send_shared(context, chat_id: int, file_id: Optional[str], send: Callable, field: str,
+                     error: str) -> None:
+        """ Sends file uploaded by the leader of coalesced requests, or `error` if it failed """
+        if file_id:
+            send(chat_id=chat_id, **{field: file_id})
+        else:
+            context.bot.send_message(chat_id=chat_id, text=error)
+
+    def _send_cached_voice(self, context, chat_id: int, audio: CachedAudio) -> None:
+        """ Re-uses Telegram file id of cached audio if it was uploaded before """
+        if audio.file_id:
+            context.bot.send_voice(chat_id=chat_id, voice=audio.file_id)
+            return
+        with open(audio.path, 'rb') as voice:
+            message = context.bot.send_voice(chat_id=chat_id, voice=voice)
+        if message and message.voice:
+            self.audio_cache.set_file_id(audio.key, message.voice.file_id)
 
-    @command
-    @log_event
     def help_cmd(self, update, context):
-        commands = (
-            self.SAY_CMD,
-            self.BIBA_CMD,
-            self.HELP_CMD,
-            self.STATISTICS_CMD,
-            self.SCREENSHOT_CMD,
-            self.MEOW_CMD,
-            self.WOOF_CMD,
-            self.PING_CMD,
-        )
         context.bot.send_message(
             chat_id=update.message.chat_id,
-            text=_("I can do following: ") + ",".join(commands)
+            text=_("I can do following: ") + ",".join(self.commands.visible())
         )
 
-    @command
-    @log_event
     def statistics_cmd(self, update, context):
-        statistics = (json.dumps(self.statistic_dao.get_all(), indent=4, sort_keys=True))
-        context.bot.send_message(
-            chat_id=update.message.chat_id,
-            text=_("Statistics:\n") + statistics
-        )
+        key = tuple(context.args)
+        version = self.statistic_dao.version
+        cached = self.statistics_reports.get(key)
+        if cached and cached[0] == version:
+            text = cached[1]
+        else:
+            text = self._statistics_report(context.args)
+            self.statistics_reports.set(key, (version, text))
+        context.bot.send_message(chat_id=update.message.chat_id, text=text)
 
-    @command
-    @log_event
-    def screenshot_cmd(self, update, context):
-        if len(context.args) == 1:
-            url = context.args[0]
-            screen = screenshoter.take_screenshot(url)
-            if screen:
-                context.bot.send_photo(
-                    chat_id=update.message.chat_id,
-                    photo=screen
-                )
-            else:
+    def _statistics_report(self, args: List[str]) -> str:
+        """ `/stat`, `/stat top <N> [page]` or `/stat @username` (user id works as well) """
+        if not args:
+            summary = self.statistic_dao.summary()
+            lines = [_("Users: ") + str(summary['users']), _("Usages: ") + str(summary['total'])]
+            lines.extend(f"/{stat['cmd']}: {stat['count']}" for stat in summary['commands'])
+            lines.append(_("Top users:"))
+            lines.extend(self._top_users_lines(self.statistics_page_size, 0))
+            return _("Statistics:\n") + '\n'.join(lines)
+
+        if args[0] == 'top' and len(args) <= 3 and all(arg.isdigit() for arg in args[1:]):
+            # page is limited, so report always fits into a single message
+            limit = min(int(args[1]) if len(args) > 1 else self.statistics_page_size, 50)
+            page = max(int(args[2]) if len(args) > 2 else 1, 1)
+            lines = self._top_users_lines(limit, (page - 1) * limit)
+            return _("Top users:") + '\n' + '\n'.join(lines)
+
+        name = args[0].lstrip('@')
+        if len(args) == 1 and name:
+            user = self.statistic_dao.get_user(
+                user_id=int(name) if name.isdigit() else None,
+                username=name,
+            )
+            if user is None:
+                return _("User not found")
+            lines = [f"{self._user_name(user)}: {user['total']}"]
+            lines.extend(f"/{stat['cmd']}: {stat['count']}" for stat in user['statistics'])
+            return _("Statistics:\n") + '\n'.join(lines)
+
+        return _("Repeat please!")
+
+    def _top_users_lines(self, limit: int, offset: int) -> List[str]:
+        return [
+            f"{offset + position}. {self._user_name(user)}: {user['count']}"
+            for position, user in enumerate(self.statistic_dao.top_users(limit, offset), 1)
+        ]
+
+    @staticmethod
+    def _user_name(user: Dict[str, Any]) -> str:
+        return f"@{user['username']}" if user['username'] else str(user['id'])
+
+    def reload_cmd(self, update, context):
+        """ Picks up added, removed and changed plugins without restart """
+        self.register_plugins()
+        context.bot.send_message(chat_id=update.message.chat_id,
+                                 text=_("Plugins: ") + ", ".join(self.plugin_commands))
+
+    def perf_cmd(self, update, context):
+        """ Latency breakdown per command """
+        lines = [
+            f"{row['command']} {row['stage']}: {row['calls']} calls, "
+            f"p50 {row['p50_ms']:.0f} ms, p99 {row['p99_ms']:.0f} ms, "
+            f"db {row['db_ms']:.0f} ms, external {row['external_ms']:.0f} ms, "
+            f"telegram {row['telegram_ms']:.0f} ms"
+            for row in instrumentation.summary()
+        ]
+        lines.append(f"Slow queries: {instrumentation.SLOW_QUERIES.value():.0f}")
+        context.bot.send_message(chat_id=update.message.chat_id, text='\n'.join(lines))
+
+    def export_cmd(self, update, context):
+        """ `/export users|statistics [csv|jsonl]`, table is sent as a document """
+        table, fmt = self._export_args(context.args)
+        if len(context.args) <= 2 and table in export.TABLES and fmt in export.FORMATS:
+            self._send_export(update, context)
+        else:
+            context.bot.send_message(chat_id=update.message.chat_id, text=_("Repeat please!"))
+
+    @heavy('export')
+    def _send_export(self, update, context):
+        table, fmt = self._export_args(context.args)
+        # rows are streamed into temporary file, so writing it doesn't depend on table size;
+        # the upload (InputFile) reads the whole file into memory, hence the size cap
+        with tempfile.TemporaryFile() as file:
+            count = export.export(self.db, table, fmt, file)
+            if file.tell() > MAX_DOCUMENT_SIZE:
                 context.bot.send_message(
                     chat_id=update.message.chat_id,
-                    text=_("I can't take a screenshot")
+                    text=_("Export is too big for Telegram, use ")
+                    + f"`python -m dao.export {table}`"
                 )
+                return
+            file.seek(0)
+            context.bot.send_document(chat_id=update.message.chat_id, document=file,
+                                      filename=f'{table}.{fmt}', caption=_("Rows: ") + str(count))
+
+    @staticmethod
+    def _export_args(args: List[str]) -> Tuple[Optional[str], str]:
+        """ Table and format (CSV by default) """
+        return (args[0] if args else None), (args[1] if len(args) > 1 else export.FORMATS[0])
+
+    async def screenshot_async(self, executor: AsyncExecutor, update, context):
+        send = executor.run_blocking
+        if len(context.args) == 1:
+            url = context.args[0]
+            key = (screenshoter.normalize_url(url), screenshoter.DEFAULT_VIEWPORT)
+            file_id = self.screenshots.get(key)
+            if file_id:
+                await send(context.bot.send_photo, chat_id=update.message.chat_id, photo=file_id)
+                return
+
+            async def shoot():
+                session = await executor.session()
+                try:
+                    screen = await executor.call(
+                        'screenshoter', screenshoter.take_screenshot_async, session, url
+                    )
+                except asyncio.TimeoutError:
+                    screen = None
+                if screen:
+                    return await send(self._send_screenshot, context, update.message.chat_id,
+                                      key, screen)
+                await send(context.bot.send_message, chat_id=update.message.chat_id,
+                           text=_("I can't take a screenshot"))
+
+            file_id, shared = await self.screenshot_flights.do_async(key, shoot)
+            if shared:
+                await send(self._send_shared, context, update.message.chat_id, file_id,
+                           context.bot.send_photo, 'photo', _("I can't take a screenshot"))
         else:
+            await send(context.bot.send_message, chat_id=update.message.chat_id,
+                       text=_("Repeat please!"))
+
+    def screenshot_now(self, update, context) -> bool:
+        """ Answers invalid /shot, or /shot of a page with cached screenshot """
+        if len(context.args) != 1:
             context.bot.send_message(
                 chat_id=update.message.chat_id,
                 text=_("Repeat please!")
             )
+            return True
+        key = (screenshoter.normalize_url(context.args[0]), screenshoter.DEFAULT_VIEWPORT)
+        file_id = self.screenshots.get(key)
+        if file_id:
+            context.bot.send_photo(chat_id=update.message.chat_id, photo=file_id)
+            return True
+        return False
+
+    @offload(screenshot_async)
+    @heavy('screenshot', screenshot_now)
+    def screenshot_cmd(self, update, context):
+        if len(context.args) != 1:
+            context.bot.send_message(
+                chat_id=update.message.chat_id,
+                text=_("Repeat please!")
+            )
+            return
+        url = context.args[0]
+        key = (screenshoter.normalize_url(url), screenshoter.DEFAULT_VIEWPORT)
+        # cache was checked before queueing, but the page could be shot while job was waiting
+        file_id = self.screenshots.get(key)
+        if file_id:
+            context.bot.send_photo(chat_id=update.message.chat_id, photo=file_id)
+            return
+
+        def shoot():
+            with instrumentation.timed('external', 'screenshoter'):
+                screen = screenshoter.take_screenshot(url)
+            if screen:
+                return self._send_screenshot(context, update.message.chat_id, key, screen)
+            context.bot.send_message(
+                chat_id=update.message.chat_id,
+                text=_("I can't take a screenshot")
+            )
+
+        # identical concurrent requests share one screenshot and its Telegram file id
+        file_id, shared = self.screenshot_flights.do(key, shoot)
+        if shared:
+            self._send_shared(context, update.message.chat_id, file_id,
+                              context.bot.send_photo, 'photo', _("I can't take a screenshot"))
+
+    def _send_screenshot(self, context, chat_id: int, key: Tuple[str, str],
+                         screen) -> Optional[str]:
+        """ Uploads screenshot and remembers Telegram file id of the biggest photo size """
+        message = context.bot.send_photo(chat_id=chat_id, photo=screen)
+        if message and message.photo:
+            self.screenshots.set(key, message.photo[-1].file_id)
+            return message.photo[-1].file_id
+        return None
 
-    @log_event
     def secret_exit_cmd(self, update, context):
         self.is_running = not self.is_running
         text = _("Bye") if not self.is_running else _("Hi there!")
         context.bot.send_message(chat_id=update.message.chat_id, text=text)
 
-    @command
-    @log_event
     def ping_cmd(self, update, context):
         context.bot.send_message(chat_id=update.message.chat_id, text="pong")
 
-    @command
-    @log_event
+    async def woof_async(self, executor: AsyncExecutor, update, context):
+        url = self.dog_photos.get_nowait()
+        if url is None:
+            session = await executor.session()
+            # no url on timeout or error of the source, so user is asked to repeat
+            url = await executor.try_call('dog_photo', dog_photo.get_photo_url_async, session)
+        await executor.run_blocking(self._send_photo, context, update.message.chat_id, url)
+
+    @offload(woof_async)
     def woof_cmd(self, update, context):
-        context.bot.send_photo(chat_id=update.message.chat_id, photo=dog_photo.get_photo_url())
+        with instrumentation.timed('external', 'dog_photo'):
+            url = self.dog_photos.get()
+        self._send_photo(context, update.message.chat_id, url)
+
+    async def meow_async(self, executor: AsyncExecutor, update, context):
+        url = self.cat_photos.get_nowait()
+        if url is None:
+            session = await executor.session()
+            url = await executor.try_call('cat_photo', cat_photo.get_photo_url_async, session)
+        await executor.run_blocking(self._send_photo, context, update.message.chat_id, url)
 
-    @command
-    @log_event
+    @offload(meow_async)
     def meow_cmd(self, update, context):
-        context.bot.send_photo(chat_id=update.message.chat_id, photo=cat_photo.get_photo_url())
+        with instrumentation.timed('external', 'cat_photo'):
+            url = self.cat_photos.get()
+        self._send_photo(context, update.message.chat_id, url)
 
+    def _send_photo(self, context, chat_id: int, url: Optional[str]) -> None:
+        if url:
+            context.bot.send_photo(chat_id=chat_id, photo=url)
+        else:
+            context.bot.send_message(chat_id=chat_id, text=_("Repeat please!"))
+
+
+def create_connector(db_url: str) -> DataBaseConnector:
+    return DataBaseConnector(
+        db_url,
+        echo=os.getenv('DB_ECHO') == '1',
+        profile=os.getenv('DB_PROFILE', 'auto'),
+        pool_size=int(os.getenv('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        pool_pre_ping=os.getenv('DB_POOL_PRE_PING', '1') == '1',
+        pool_recycle=int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        query_cache_size=int(os.getenv('DB_QUERY_CACHE_SIZE', 500)),
+        busy_timeout=float(os.getenv('DB_BUSY_TIMEOUT', 5)),
+        synchronous=os.getenv('DB_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    )
 
-def main():
-    load_dotenv()
 
-    bot = TelegramBot(
+def api_urls() -> Tuple[str, str]:
+    """ Bot API and file urls, TELEGRAM_API_URL points the bot to another server (e.g. a fake) """
+    api_url = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+    return f'{api_url}/bot', f'{api_url}/file/bot'
+
+
+def create_send_limiter() -> SendLimiter:
+    # global limit is per bot, every worker process gets its share
+    total = parse_limit(os.getenv('SEND_LIMIT_TOTAL', '30/1'))
+    workers = int(os.getenv('BOT_WORKERS', 1))
+    return SendLimiter(
+        chat=parse_limit(os.getenv('SEND_LIMIT_CHAT', '1/1:3')),
+        group=parse_limit(os.getenv('SEND_LIMIT_GROUP', '20/60:5')),
+        total=Limit(total.rate / workers, max(total.burst / workers, 1)),
+        max_chats=int(os.getenv('RATE_LIMIT_BUCKETS', 10000)),
+    )
+
+
+def create_bot() -> TelegramBot:
+    return TelegramBot(
         token=os.getenv("TELEGRAM_BOT_TOKEN", ''),
         db_url=os.getenv("DB_URL", 'sqlite:///:memory:')
     )
+
+
+def create_webhook(handle: Callable[[Dict[str, Any]], Any]) -> WebhookServer:
+    webhook = WebhookServer(
+        handle,
+        host=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+        port=int(os.getenv('WEBHOOK_PORT', 8443)),
+        path=os.getenv('WEBHOOK_PATH', '/telegram'),
+        secret_token=os.getenv('WEBHOOK_SECRET'),
+        max_queue=int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000)),
+        workers=int(os.getenv('WEBHOOK_WORKERS', 1)),
+    )
+    assert webhook.secret_token, "Webhook secret token must be not empty!"
+    return webhook
+
+
+def serve_webhook(webhook: WebhookServer, bot: Bot) -> None:
+    """ Receives updates with embedded server until termination signal """
+    webhook.start()
+    startup.REPORT.mark('webhook')
+    startup.REPORT.report()
+    try:
+        webhook_url = os.getenv('WEBHOOK_URL')
+        if webhook_url:
+            bot.set_webhook(
+                url=webhook_url,
+                secret_token=webhook.secret_token,
+                max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40)),
+            )
+        wait_for_signal()
+    finally:
+        webhook.stop(timeout=5)
+
+
+def wait_for_signal() -> None:
+    """ Unlike `Updater.idle` doesn't exit process, if updater isn't polling """
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        signal.signal(sig, lambda signum, frame: stopped.set())
+    while not stopped.wait(1):
+        pass
+
+
+def poll_updates(bot: Bot, handle: Callable[[Dict[str, Any]], Any], stopped: threading.Event):
+    bot.delete_webhook()
+    offset = None
+    while not stopped.is_set():
+        try:
+            updates = bot.get_updates(offset=offset, timeout=10)
+        except TelegramError as err:
+            logging.error(f'Failed to get updates: {err}')
+            stopped.wait(1)
+            continue
+        for update in updates:
+            handle(update.to_dict())
+            offset = update.update_id + 1
+
+
+def run_worker(index: int, updates) -> None:
+    """ Worker process, exits once ingress process sends None """
+    # ingress process decides when to stop, so queued updates are not lost
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    load_dotenv()
+    if os.getenv('METRICS_PORT'):
+        # ingress serves the base port, every worker its own next one
+        os.environ['METRICS_PORT'] = str(int(os.getenv('METRICS_PORT', 0)) + 1 + index)
+    if os.getenv('STATISTICS_JOURNAL'):
+        # chats are always routed to the same worker, so every worker keeps its own journal
+        os.environ['STATISTICS_JOURNAL'] = f"{os.getenv('STATISTICS_JOURNAL')}.{index}"
+
+    bot = create_bot()
+    bot.init_handlers()
+    startup.REPORT.mark('handlers')
+    startup.REPORT.report()
+    logging.info(f'Worker {index} started')
+    bot.serve(updates)
+
+
+def run_ingress(workers: int) -> None:
+    """ Receives updates and shards them by chat id between worker processes """
+    # schema and totals are prepared once, before workers race for it
+    StatisticsDao(create_connector(os.getenv("DB_URL", 'sqlite:///:memory:'))).ensure_totals()
+
+    router = ShardRouter(run_worker, workers, max_queue=int(os.getenv('WORKER_QUEUE_SIZE', 1000)))
+    router.start()
+    base_url, base_file_url = api_urls()
+    bot = Bot(os.getenv("TELEGRAM_BOT_TOKEN", ''), base_url=base_url, base_file_url=base_file_url)
+    metrics_server = None
+    if os.getenv('METRICS_PORT'):
+        metrics_server = MetricsServer(int(os.getenv('METRICS_PORT', 0)))
+        metrics_server.start()
+    try:
+        if os.getenv('UPDATE_MODE', 'polling') == 'webhook':
+            serve_webhook(create_webhook(router.put), bot)
+        else:
+            stopped = threading.Event()
+            poller = threading.Thread(target=poll_updates, args=(bot, router.put, stopped),
+                                      name='updates-poller', daemon=True)
+            poller.start()
+            try:
+                wait_for_signal()
+            finally:
+                stopped.set()
+                poller.join(15)
+    finally:
+        router.stop(timeout=30)
+        if metrics_server:
+            metrics_server.stop()
+
+
+def main():
+    load_dotenv()
+
+    workers = int(os.getenv('BOT_WORKERS', 1))
+    if workers > 1:
+        run_ingress(workers)
+        return
+
+    bot = create_bot()
     bot.init_handlers()
+    startup.REPORT.mark('handlers')
     bot.start()
 
 
@@ -0,0 +1,3 @@
+"""
+Command plugins, every module is a command (see `core.plugins`).
+"""
@@ -0,0 +1,16 @@
+"""
+/biba, predicts size of your biba.
+"""
+import random
+
+OPTIONS = {'order': 20}
+
+
+def handle(update, context, resources):
+    _ = resources.gettext
+    # using last decisions in machine learning and neural networks area
+    length = random.randrange(3, 26)
+    context.bot.send_message(
+        chat_id=update.message.chat_id,
+        text=_("Your biba is ") + str(length) + _(", cm")
+    )
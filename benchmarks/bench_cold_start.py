@@ -0,0 +1,105 @@
+"""
+Time from starting the bot process until it replied to the first /ping.
+
+    $ python -m benchmarks.bench_cold_start --runs 5
+
+Every run starts a fresh interpreter with the bot in polling mode. Bot API is replaced by a stub
+in the child process: the first `getUpdates` returns a /ping and `sendMessage` with "pong"
+reports that the reply was sent, so the measurement covers interpreter start, imports,
+initialization and handling of the first update.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from tempfile import TemporaryDirectory
+from typing import List
+
+from benchmarks.utils import report, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PONG = 'PONG'
+
+
+def child() -> None:
+    """ Runs the bot with stubbed Bot API, prints PONG once /ping was answered """
+    sys.path.insert(0, os.path.join(ROOT, 'app'))
+    from unittest import mock
+    from telegram.utils.request import Request
+
+    updates = [{
+        'update_id': 1,
+        'message': {
+            'message_id': 1, 'date': 0, 'text': '/ping',
+            'chat': {'id': 1, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'user'},
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+        },
+    }]
+
+    def post(url, data=None, timeout=None):
+        method = url.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'}
+        if method == 'getUpdates':
+            if updates:
+                return [updates.pop()]
+            time.sleep(0.1)
+            return []
+        if method == 'sendMessage' and data and data.get('text') == 'pong':
+            print(PONG, flush=True)
+        if method in ('deleteWebhook', 'setWebhook', 'deleteMessage'):
+            return True
+        return {'message_id': 2, 'date': 0, 'chat': {'id': 1, 'type': 'private'}}
+
+    with mock.patch.object(Request, 'post', side_effect=post):
+        import main
+        main.main()
+
+
+def first_ping(env: dict) -> float:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_cold_start', '--child'],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    try:
+        for line in process.stdout:  # type: ignore
+            if line.strip() == PONG:
+                return time.perf_counter() - started
+        raise RuntimeError(f'Bot exited with code {process.wait()} before answering /ping')
+    finally:
+        process.terminate()
+        process.wait(30)
+
+
+def main(runs: int = 5) -> None:
+    timings: List[float] = []
+    with TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            TELEGRAM_BOT_TOKEN='123:benchmark',
+            DB_URL=f"sqlite:///{os.path.join(directory, 'bot.db')}",
+            UPDATE_MODE='polling',
+            BOT_WORKERS='1',
+            EXECUTION_MODE='sync',
+        )
+        env.pop('METRICS_PORT', None)
+        for _ in range(runs):
+            timings.append(first_ping(env) * 1000)
+    report(f'Time to first /ping, {runs} cold starts',
+           {'process start to pong': summarize(timings)})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+    else:
+        main(args.runs)
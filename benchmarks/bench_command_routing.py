@@ -0,0 +1,75 @@
+"""
+Per-update routing overhead with many registered commands: python-telegram-bot list of
+`CommandHandler`s against a single handler routing by `CommandRegistry` dictionary.
+
+    $ python -m benchmarks.bench_command_routing [--quick]
+
+Handlers do nothing, so only routing is measured. The routed command is registered last,
+which is the worst case of the linear handler list.
+"""
+import os
+import sys
+
+from queue import Queue
+from typing import Dict
+from unittest import mock
+
+from telegram import Bot, Update
+from telegram.ext import CommandHandler, Dispatcher, Filters, MessageHandler
+from telegram.utils.request import Request
+
+from benchmarks.bench_dispatch import BOT_USER, update_data
+from benchmarks.utils import measure, report
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+from core.commands import CommandRegistry  # noqa: E402
+
+
+def handle(update, context) -> None:
+    pass
+
+
+def handler_list(bot: Bot, names: list) -> Dispatcher:
+    dispatcher = Dispatcher(bot, Queue(), workers=0, use_context=True)
+    for name in names:
+        dispatcher.add_handler(CommandHandler(name, handle))
+    dispatcher.add_handler(MessageHandler(Filters.command, handle))
+    return dispatcher
+
+
+def registry(bot: Bot, names: list) -> Dispatcher:
+    commands = CommandRegistry()
+    for name in names:
+        commands.add(name, handle)
+
+    def dispatch(update, context) -> None:
+        parsed = commands.parse(update.message.text, bot.username)
+        if parsed is not None and parsed.command is not None:
+            context.args = parsed.args
+            parsed.command.handler(update, context)
+
+    dispatcher = Dispatcher(bot, Queue(), workers=0, use_context=True)
+    dispatcher.add_handler(MessageHandler(Filters.command & Filters.update.message, dispatch))
+    return dispatcher
+
+
+def run(quick: bool = False) -> Dict[str, Dict[str, float]]:
+    repeat = 500 if quick else 5000
+    results = {}
+    with mock.patch.object(Request, 'post', return_value=BOT_USER):
+        bot = Bot('123:benchmark')
+        bot.get_me()
+        for count in (10, 100, 1000):
+            names = [f'command{i}' for i in range(count)]
+            update = Update.de_json(update_data(1, f'/{names[-1]}@bot some args'), bot)
+            for kind, build in (('CommandHandler list', handler_list), ('registry', registry)):
+                dispatcher = build(bot, names)
+                results[f'{count} commands, {kind}'] = measure(
+                    lambda: dispatcher.process_update(update), repeat
+                )
+    return results
+
+
+if __name__ == '__main__':
+    report('Routing of one update', run(quick='--quick' in sys.argv))
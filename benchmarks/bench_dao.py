@@ -0,0 +1,81 @@
+"""
+DAO hot paths on SQLite, in memory and in a file database.
+
+    $ python -m benchmarks.bench_dao [--quick]
+"""
+import os
+import random
+import sys
+
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+from app.dao.db import DataBaseConnector, CommandDao, StatisticsDao, UserDao
+from app.dao.models import User
+from benchmarks.utils import measure, report
+
+USERS = 10_000
+COMMANDS = 10
+
+
+def populate(conn: DataBaseConnector, users: int, commands: int) -> StatisticsDao:
+    command_dao = CommandDao(conn)
+    for command_id in range(1, commands + 1):
+        command_dao.add(command_id, f'cmd{command_id}')
+    with conn.session_scope() as session:
+        session.bulk_insert_mappings(User, [
+            {'id': user_id, 'username': f'user{user_id}'} for user_id in range(1, users + 1)
+        ])
+    stat_dao = StatisticsDao(conn)
+    stat_dao.increment_many(
+        (user_id, command_id, random.randint(1, 100))
+        for user_id in range(1, users + 1)
+        for command_id in range(1, commands + 1)
+    )
+    return stat_dao
+
+
+def run_database(url: str, users: int, quick: bool) -> Dict[str, Dict[str, float]]:
+    conn = DataBaseConnector(url)
+    user_dao = UserDao(conn, cache_ttl=0)
+    stat_dao = populate(conn, users, COMMANDS)
+    repeat = 20 if quick else 200
+
+    def increment() -> None:
+        stat_dao.increment(random.randint(1, users), random.randint(1, COMMANDS))
+
+    return {
+        'StatisticsDao.increment': measure(increment, repeat),
+        'StatisticsDao.increment_many(100)': measure(
+            lambda: stat_dao.increment_many(
+                (random.randint(1, users), random.randint(1, COMMANDS), 1)
+                for _ in range(100)
+            ), repeat
+        ),
+        'StatisticsDao.get_all': measure(stat_dao.get_all, repeat=3 if quick else 10),
+        'StatisticsDao.summary': measure(stat_dao.summary, repeat),
+        'UserDao.get_by_id (uncached)': measure(
+            lambda: user_dao.get_by_id(random.randint(1, users)), repeat
+        ),
+        'UserDao.get_all': measure(user_dao.get_all, repeat=3 if quick else 10),
+        'UserDao.get_all_rows': measure(user_dao.get_all_rows, repeat=3 if quick else 10),
+    }
+
+
+def run(quick: bool = False) -> Dict[str, Dict[str, float]]:
+    users = USERS // 10 if quick else USERS
+    results = {
+        f'memory, {users} users: {name}': result
+        for name, result in run_database('sqlite:///:memory:', users, quick).items()
+    }
+    with TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        results.update({
+            f'file, {users} users: {name}': result
+            for name, result in run_database(url, users, quick).items()
+        })
+    return results
+
+
+if __name__ == '__main__':
+    report('DAO on SQLite', run(quick='--quick' in sys.argv))
@@ -0,0 +1,96 @@
+"""
+Handler dispatch end to end: command registry routing, statistics buffer and dispatcher,
+with Bot API replaced by a stub. Rate and send limits are lifted, so every call takes the real
+handler path instead of the rejection of a synthetic user over its limit.
+
+    $ python -m benchmarks.bench_dispatch [--quick]
+"""
+import os
+import sys
+
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from unittest import mock
+
+from telegram import Update
+from telegram.utils.request import Request
+
+from benchmarks.utils import measure, report
+
+# bot is started from `app/` directory and imports its packages as top-level ones
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+
+import main  # noqa: E402
+from core.ratelimit import RateLimiter  # noqa: E402
+
+CHAT_ID = 1
+MESSAGE = {'message_id': 1, 'date': 0, 'chat': {'id': CHAT_ID, 'type': 'private'}, 'text': 'ok'}
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'}
+
+
+def api_response(url: str, data: Any = None, timeout: Any = None) -> Dict[str, Any]:
+    """ Stub of Bot API: every method returns the same message """
+    return BOT_USER if url.endswith('/getMe') else MESSAGE
+
+
+def update_data(update_id: int, text: str) -> Dict[str, Any]:
+    command = text.split()[0]
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': CHAT_ID, 'type': 'private'},
+            'from': {'id': update_id % 100 + 1, 'is_bot': False, 'first_name': 'user',
+                     'username': f'user{update_id % 100 + 1}'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+        },
+    }
+
+
+class StubBot:
+    def __init__(self) -> None:
+        self.sent: List[str] = []
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        self.sent.append(text)
+
+
+def run(quick: bool = False) -> Dict[str, Dict[str, float]]:
+    repeat = 200 if quick else 2000
+    with TemporaryDirectory() as directory, \
+            mock.patch.object(Request, 'post', side_effect=api_response):
+        bot = main.TelegramBot('123:benchmark', f"sqlite:///{os.path.join(directory, 'bot.db')}")
+        bot.rate_limiter = RateLimiter({})
+        bot._dispatcher.bot.outbox = None
+        bot.init_handlers()
+        for command_id, name in enumerate(('ping', 'stat'), 1):
+            bot.cmd_dao.add(command_id, name)
+        bot.statistics_buffer.start()
+
+        counter = iter(range(10 ** 9))
+        context = SimpleNamespace(bot=StubBot(), args=[])
+
+        def handler(fn, text: str):
+            def call() -> None:
+                update = Update.de_json(update_data(next(counter), text), bot._dispatcher.bot)
+                fn(update, context)
+            return call
+
+        try:
+            return {
+                'dispatch /ping': measure(handler(bot.dispatch, '/ping'), repeat),
+                'dispatch /stat (cached report)': measure(handler(bot.dispatch, '/stat'), repeat),
+                'dispatch unknown command': measure(handler(bot.dispatch, '/nope'), repeat),
+                'Dispatcher.process_update /ping': measure(
+                    lambda: bot._process_update(update_data(next(counter), '/ping')), repeat
+                ),
+            }
+        finally:
+            bot.statistics_buffer.stop()
+
+
+if __name__ == '__main__':
+    report('Handler dispatch', run(quick='--quick' in sys.argv))
@@ -0,0 +1,92 @@
+"""
+Statistics increments per second from dispatcher-like threads, for each engine profile.
+
+    $ python -m benchmarks.bench_engine_profiles --threads 8 --seconds 5
+    $ python -m benchmarks.bench_engine_profiles --postgres-url postgresql://bot@localhost/bench
+
+Every thread increments random user/command counters and reads the summary after every
+10th increment, like dispatcher threads handling commands and /stat.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from app.dao.db import DataBaseConnector
+from app.dao.models import Base
+from benchmarks.bench_dao import populate
+
+USERS = 1000
+COMMANDS = 10
+
+
+def increments_per_second(conn: DataBaseConnector, threads: int, seconds: float) -> Dict[str, Any]:
+    stat_dao = populate(conn, USERS, COMMANDS)
+    counts: List[int] = [0] * threads
+    errors: List[int] = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def work(index: int) -> None:
+        while time.perf_counter() < stop:
+            try:
+                stat_dao.increment(random.randint(1, USERS), random.randint(1, COMMANDS))
+                counts[index] += 1
+                if counts[index] % 10 == 0:
+                    stat_dao.summary()
+            except OperationalError:
+                # e.g. "database is locked" when busy timeout is exceeded
+                errors[index] += 1
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    conn.engine.dispose()
+    return {'rate': sum(counts) / elapsed, 'errors': sum(errors)}
+
+
+def main(threads: int = 8, seconds: float = 5.0, postgres_url: Optional[str] = None) -> None:
+    profiles: Dict[str, Dict[str, Any]] = {
+        'sqlite, default engine': {'profile': 'default'},
+        'sqlite, profile (WAL, synchronous=NORMAL)': {'profile': 'sqlite'},
+        'sqlite, profile, synchronous=FULL': {'profile': 'sqlite', 'synchronous': 'FULL'},
+        'sqlite, profile without WAL': {'profile': 'sqlite', 'wal': False},
+    }
+    print(f'Increments/sec from {threads} threads, {seconds:.0f} s per profile')
+    for name, settings in profiles.items():
+        with TemporaryDirectory() as directory:
+            conn = DataBaseConnector(f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                                     **settings)
+            result = increments_per_second(conn, threads, seconds)
+        print(f"  {name:<48} {result['rate']:8.0f}/s   errors {result['errors']}")
+
+    if postgres_url:
+        postgres_profiles: Dict[str, Dict[str, Any]] = {
+            'postgresql, default engine': {'profile': 'default'},
+            'postgresql, profile': {'profile': 'postgresql', 'pool_size': threads},
+        }
+        for name, settings in postgres_profiles.items():
+            conn = DataBaseConnector(postgres_url, **settings)
+            Base.metadata.drop_all(conn.engine)
+            Base.metadata.create_all(conn.engine)
+            result = increments_per_second(conn, threads, seconds)
+            print(f"  {name:<48} {result['rate']:8.0f}/s   errors {result['errors']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--postgres-url', help='empty database, its tables are recreated')
+    args = parser.parse_args()
+    main(args.threads, args.seconds, args.postgres_url)
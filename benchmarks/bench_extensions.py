@@ -0,0 +1,63 @@
+"""
+Extension calls against local stub upstreams (random.dog, random.cat, screenshotlayer, Polly).
+
+    $ python -m benchmarks.bench_extensions [--quick]
+"""
+import os
+import sys
+
+from io import BytesIO
+from typing import Dict
+from unittest import mock
+
+from PIL import Image
+
+from app.extensions import cat_photo, clients, dog_photo, screenshoter, text2speech
+from benchmarks.stubs import StubServer, json_route
+from benchmarks.utils import measure, report
+
+AUDIO_SIZE = 64 * 1024
+
+
+def png(width: int = 1280, height: int = 800) -> bytes:
+    data = BytesIO()
+    Image.new('RGB', (width, height), (200, 100, 50)).save(data, format='PNG')
+    return data.getvalue()
+
+
+class StubPolly:
+    def synthesize_speech(self, **kwargs):
+        return {'AudioStream': BytesIO(b'a' * AUDIO_SIZE)}
+
+
+def run(quick: bool = False) -> Dict[str, Dict[str, float]]:
+    repeat = 50 if quick else 500
+    screenshot = png()
+    routes = {
+        '/woof.json': json_route({'url': 'https://random.dog/a.jpg'}),
+        '/meow': json_route({'file': 'https://purr.objects-us-east-1.dream.io/i/a.jpg'}),
+        '/capture': lambda request: (200, 'image/png', screenshot),
+    }
+    with StubServer(routes) as server, \
+            mock.patch.object(dog_photo, 'BASE_URL', f'{server.url}/woof.json'), \
+            mock.patch.object(cat_photo, 'BASE_URL', f'{server.url}/meow'), \
+            mock.patch.object(screenshoter, 'BASE_URL', f'{server.url}/capture'), \
+            mock.patch.dict(os.environ, {'SCREENSHOT_API_KEY': 'benchmark'}), \
+            mock.patch.object(clients, 'get_polly_client', return_value=StubPolly()):
+        try:
+            return {
+                'dog_photo.get_photo_url': measure(dog_photo.get_photo_url, repeat),
+                'cat_photo.get_photo_url': measure(cat_photo.get_photo_url, repeat),
+                'screenshoter.take_screenshot': measure(
+                    lambda: screenshoter.take_screenshot('https://example.com'), repeat // 5
+                ),
+                f'text2speech.generate_audio ({AUDIO_SIZE // 1024} KiB)': measure(
+                    lambda: text2speech.generate_audio(text='hello'), repeat
+                ),
+            }
+        finally:
+            clients.close_all()
+
+
+if __name__ == '__main__':
+    report('Extensions against local stubs', run(quick='--quick' in sys.argv))
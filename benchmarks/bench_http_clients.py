@@ -0,0 +1,46 @@
+"""
+Compares per-call cost of fresh connections against pooled clients from `extensions.clients`.
+
+    $ python -m benchmarks.bench_http_clients
+
+Both Polly clients are created for the same region and the default endpoint, whatever the
+AWS settings of the environment are.
+"""
+import os
+
+from unittest import mock
+
+import boto3
+import requests
+
+from app.extensions import clients
+from benchmarks.stubs import StubServer, json_route
+from benchmarks.utils import measure, report
+
+REGION = 'us-east-1'
+
+
+def main(repeat: int = 500) -> None:
+    with StubServer({'/woof.json': json_route({'url': 'https://random.dog/a.jpg'})}) as server:
+        url = f'{server.url}/woof.json'
+        report(f'HTTP GET against local stub ({repeat} calls)', {
+            'requests.get (new connection)': measure(lambda: requests.get(url).json(), repeat),
+            'clients.get_session(url).get': measure(
+                lambda: clients.get_session(url).get(url).json(), repeat
+            ),
+        })
+
+    # pooled client reads region and endpoint from the environment
+    with mock.patch.dict(os.environ, {'AWS_DEFAULT_REGION': REGION, 'POLLY_ENDPOINT_URL': ''}):
+        clients.close_all()
+        report('Polly client (20 calls)', {
+            'boto3.client per call': measure(
+                lambda: boto3.client('polly', region_name=REGION), 20
+            ),
+            'clients.get_polly_client': measure(clients.get_polly_client, 20),
+        })
+        clients.close_all()
+
+
+if __name__ == '__main__':
+    main()
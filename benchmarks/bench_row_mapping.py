@@ -0,0 +1,82 @@
+"""
+Compares previous ORM read path (objects converted by `inspect()`) with Core selects of
+row mappings and named tuples, by time and peak memory.
+
+    $ python -m benchmarks.bench_row_mapping [users] [commands]
+
+Defaults to 100k users x 10 commands in a temporary SQLite database.
+"""
+import os
+import sys
+import tracemalloc
+
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import inspect
+
+from app.dao.db import DataBaseConnector, StatisticsDao, UserDao
+from app.dao.models import Command, User
+from benchmarks.bench_dao import populate
+from benchmarks.utils import measure, report
+
+
+def orm_get_all(dao: UserDao) -> List[Dict[str, Any]]:
+    """ Previous implementation: whole ORM objects, columns inspected for every row """
+    with dao.conn.session_scope() as session:
+        return [
+            {c.key: getattr(obj, c.key) for c in inspect(obj).mapper.column_attrs}
+            for obj in session.query(User).all()
+        ]
+
+
+def orm_statistics(dao: StatisticsDao) -> List[Dict[str, Any]]:
+    """ Previous implementation: ORM query, grouped by tuple indexes """
+    with dao.conn.session_scope() as session:
+        statistics = session.query(User.id, User.username, Command.name, dao.entity_clazz.count) \
+            .join(User) \
+            .join(Command) \
+            .order_by(User.id) \
+            .all()
+        users: Dict = {}
+        for stat in statistics:
+            if stat[0] not in users:
+                users[stat[0]] = {'id': stat[0], 'username': stat[1],
+                                  'statistics': [{'cmd': stat[2], 'count': stat[3]}]}
+            else:
+                users[stat[0]]['statistics'].append({'cmd': stat[2], 'count': stat[3]})
+        return list(users.values())
+
+
+def peak_memory(fn: Callable[[], object]) -> float:
+    """ Peak of memory allocated while result of `fn` is built, in MiB """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main(users: int = 100_000, commands: int = 10) -> None:
+    with TemporaryDirectory() as directory:
+        conn = DataBaseConnector(f"sqlite:///{os.path.join(directory, 'rows.db')}")
+        user_dao = UserDao(conn)
+        stat_dao = populate(conn, users, commands)
+
+        paths = {
+            'users: ORM + inspect (old)': lambda: orm_get_all(user_dao),
+            'users: Core mappings': user_dao.get_all,
+            'users: Core named tuples': user_dao.get_all_rows,
+            'statistics: ORM query (old)': lambda: orm_statistics(stat_dao),
+            'statistics: Core + groupby': stat_dao.get_all,
+        }
+        report(f'get_all over {users} users x {commands} commands',
+               {name: measure(fn, repeat=5) for name, fn in paths.items()})
+        print('Peak memory:')
+        for name, fn in paths.items():
+            print(f'  {name:<32} {peak_memory(fn):8.1f} MiB')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,79 @@
+"""
+Compares /say audio path through a temporary file with the in-memory one, using stubbed Polly.
+
+    $ python -m benchmarks.bench_say_audio
+
+Latency of both paths is about the same, as the temporary file stays in the page cache. The
+in-memory path copies audio twice instead of three times and leaves no file behind; it isn't
+faster.
+"""
+import os
+
+from contextlib import closing
+from io import BytesIO
+from tempfile import NamedTemporaryFile
+from unittest import mock
+
+from app.extensions import text2speech
+from benchmarks.utils import measure, report
+
+AUDIO_SIZE = 256 * 1024
+
+
+class CountingStream(BytesIO):
+    """ Polly AudioStream stub which counts bytes read from it """
+    copied = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        CountingStream.copied += len(data)
+        return data
+
+
+class StubPolly:
+    def synthesize_speech(self, **kwargs):
+        return {'AudioStream': CountingStream(b'a' * AUDIO_SIZE)}
+
+
+def send_voice(voice) -> None:
+    """ Telegram upload reads the whole file """
+    CountingStream.copied += len(voice.read())
+
+
+def temp_file_path() -> None:
+    """ Previous implementation: whole stream into temp file, re-opened by name for upload """
+    response = StubPolly().synthesize_speech()
+    with closing(response['AudioStream']) as stream:
+        with NamedTemporaryFile(delete=False) as file:
+            data = stream.read()
+            file.write(data)
+            CountingStream.copied += len(data)
+    with open(file.name, 'rb') as voice:
+        send_voice(voice)
+    os.unlink(file.name)
+
+
+def in_memory_path() -> None:
+    audio = text2speech.generate_audio(text='hello')
+    send_voice(audio)
+
+
+def copied_per_call(fn) -> float:
+    CountingStream.copied = 0
+    fn()
+    return CountingStream.copied / AUDIO_SIZE
+
+
+def main(repeat: int = 200) -> None:
+    with mock.patch('app.extensions.clients.get_polly_client', return_value=StubPolly()):
+        report(f'/say audio path, {AUDIO_SIZE // 1024} KiB ({repeat} calls)', {
+            'temp file': measure(temp_file_path, repeat),
+            'in-memory': measure(in_memory_path, repeat),
+        })
+        print('Bytes copied per call, in audio sizes:')
+        print(f'  temp file  {copied_per_call(temp_file_path):.0f}')
+        print(f'  in-memory  {copied_per_call(in_memory_path):.0f}')
+
+
+if __name__ == '__main__':
+    main()
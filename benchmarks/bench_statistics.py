@@ -0,0 +1,76 @@
+"""
+Compares the old whole-table `/stat` report with the paginated reports over maintained totals.
+
+    $ python -m benchmarks.bench_statistics [users] [commands]
+
+Defaults to 100k users x 20 commands (2M statistics rows) in a temporary SQLite database.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+from tempfile import TemporaryDirectory
+from typing import List
+
+from app.dao.db import DataBaseConnector, CommandDao, StatisticsDao, UserDao
+from app.dao.models import User
+from benchmarks.utils import measure, report
+
+BATCH_SIZE = 50_000
+
+
+def populate(conn: DataBaseConnector, stat_dao: StatisticsDao, users: int, commands: int) -> None:
+    command_dao = CommandDao(conn)
+    for command_id in range(1, commands + 1):
+        command_dao.add(command_id, f'cmd{command_id}')
+
+    with conn.session_scope() as session:
+        session.bulk_insert_mappings(User, [
+            {'id': user_id, 'username': f'user{user_id}'} for user_id in range(1, users + 1)
+        ])
+
+    batch = []
+    for user_id in range(1, users + 1):
+        for command_id in range(1, commands + 1):
+            batch.append((user_id, command_id, random.randint(1, 100)))
+        if len(batch) >= BATCH_SIZE:
+            stat_dao.increment_many(batch)
+            batch = []
+    stat_dao.increment_many(batch)
+
+
+def main(users: int = 100_000, commands: int = 20) -> None:
+    with TemporaryDirectory() as directory:
+        conn = DataBaseConnector(f"sqlite:///{os.path.join(directory, 'stat.db')}")
+        UserDao(conn)
+        stat_dao = StatisticsDao(conn)
+
+        started = time.perf_counter()
+        populate(conn, stat_dao, users, commands)
+        print(f'Populated {users * commands} rows with totals in '
+              f'{time.perf_counter() - started:.1f} s')
+
+        sizes: List[int] = []
+
+        def full_report() -> None:
+            sizes.append(len(json.dumps(stat_dao.get_all(), indent=4, sort_keys=True)))
+
+        def summary() -> None:
+            stat_dao.summary()
+            stat_dao.top_users(10)
+
+        report(f'/stat over {users} users x {commands} commands', {
+            'whole table (old)': measure(full_report, repeat=3, warmup=0),
+            'summary + top 10': measure(summary, repeat=50),
+            'top 50, page 100': measure(lambda: stat_dao.top_users(50, 50 * 99), repeat=50),
+            '@user': measure(lambda: stat_dao.get_user(username=f'user{users // 2}'),
+                             repeat=50),
+        })
+        print(f'Old report size: {sizes[-1] // 1024} KiB '
+              f'(Telegram message limit is 4096 characters)')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,127 @@
+"""
+Load generator for the webhook endpoint, posts synthetic Telegram updates.
+
+Without `--url` it starts an embedded webhook server with a stub handler, so it runs fully
+offline and also reports latency from sending an update until its handler finished:
+
+    $ python -m benchmarks.bench_webhook --updates 20000 --concurrency 64 --handler-ms 1
+
+With `--url` (and `--secret`) it targets a running bot started with `UPDATE_MODE=webhook`.
+"""
+import argparse
+import asyncio
+import time
+
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from app.core.webhook import SECRET_HEADER, WebhookServer
+from benchmarks.utils import report, summarize
+
+SECRET = 'benchmark-secret'
+
+
+def synthetic_update(update_id: int, users: int = 1000, command: str = '/ping') -> Dict[str, Any]:
+    user_id = update_id % users + 1
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'text': command,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+        },
+    }
+
+
+async def post_updates(
+        url: str,
+        secret: str,
+        updates: int,
+        concurrency: int,
+        sent_at: Dict[int, float]
+) -> Dict[str, Any]:
+    statuses: Counter = Counter()
+    timings: List[float] = []
+    ids = iter(range(updates))
+
+    async def sender(session) -> None:
+        for update_id in ids:
+            body = synthetic_update(update_id)
+            started = time.perf_counter()
+            sent_at[update_id] = started
+            async with session.post(url, json=body, headers={SECRET_HEADER: secret}) as response:
+                await response.read()
+                statuses[response.status] += 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {'elapsed': elapsed, 'statuses': statuses, 'timings': timings}
+
+
+def main(
+        url: Optional[str] = None,
+        secret: str = SECRET,
+        updates: int = 10000,
+        concurrency: int = 32,
+        handler_ms: float = 0.0,
+        workers: int = 1,
+        queue_size: int = 1000
+) -> None:
+    sent_at: Dict[int, float] = {}
+    handled_at: Dict[int, float] = {}
+
+    def handle(update: Dict[str, Any]) -> None:
+        if handler_ms:
+            time.sleep(handler_ms / 1000)
+        handled_at[update['update_id']] = time.perf_counter()
+
+    server = None
+    if url is None:
+        server = WebhookServer(handle, port=0, secret_token=secret, max_queue=queue_size,
+                               workers=workers)
+        server.start()
+        url = f'http://127.0.0.1:{server.port}{server.path}'
+
+    result = asyncio.run(post_updates(url, secret, updates, concurrency, sent_at))
+    if server is not None:
+        server.stop()
+
+    statuses = ', '.join(
+        f'{status}: {count}' for status, count in sorted(result['statuses'].items())
+    )
+    accepted = result['statuses'][200]
+    print(f'{updates} updates to {url} with concurrency {concurrency} in '
+          f"{result['elapsed']:.2f} s, {accepted / result['elapsed']:.0f} accepted updates/sec "
+          f'({statuses})')
+
+    results = {'HTTP response': summarize(result['timings'])}
+    if handled_at:
+        results['sent to handled'] = summarize([
+            (handled - sent_at[update_id]) * 1000 for update_id, handled in handled_at.items()
+        ])
+    report(f'Webhook latency, {workers} worker(s), handler {handler_ms} ms', results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='webhook url of a running bot')
+    parser.add_argument('--secret', default=SECRET, help='webhook secret token')
+    parser.add_argument('--updates', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--handler-ms', type=float, default=0.0,
+                        help='time the embedded stub handler spends per update')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--queue-size', type=int, default=1000)
+    args = parser.parse_args()
+    main(args.url, args.secret, args.updates, args.concurrency, args.handler_ms,
+         args.workers, args.queue_size)
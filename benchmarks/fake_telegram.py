@@ -0,0 +1,123 @@
+"""
+Local fake of Telegram Bot API for offline load tests.
+
+Updates queued by `push` are returned by `getUpdates` (long polling like the real API),
+`send*` methods answer with plausible messages and are recorded per chat. Every method but
+`getUpdates` can be slowed down by `latency` and fail with `error_rate` probability.
+
+Bot is pointed to the fake with `TELEGRAM_API_URL=<fake.url>`.
+"""
+import json
+import random
+import re
+import threading
+import time
+
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.stubs import StubServer, read_body
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'}
+MULTIPART_CHAT_ID = re.compile(rb'name="chat_id"\r\n\r\n([^\r]+)')
+
+
+class FakeBotApi(StubServer):
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0) -> None:
+        super().__init__({'*': self._handle})
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = 0
+        self.polled = threading.Event()  # bot asked for updates at least once
+        # chat id -> (time, method) of every successful send
+        self.sent: Dict[Any, List[Tuple[float, str]]] = defaultdict(list)
+        self._updates: List[Dict[str, Any]] = []
+        self._message_ids = iter(range(1, 10 ** 12))
+        self._condition = threading.Condition()
+
+    def push(self, update: Dict[str, Any]) -> None:
+        with self._condition:
+            self._updates.append(update)
+            self._condition.notify_all()
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> Tuple[int, str, bytes]:
+        method = request.path.split('?')[0].rsplit('/', 1)[-1]
+        data = self._params(request)
+        if method == 'getUpdates':
+            return self._ok(self._get_updates(data))
+        if self.latency:
+            time.sleep(self.latency)
+        if method != 'getMe' and self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            body = {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}
+            return 500, 'application/json', json.dumps(body).encode()
+        return self._ok(self._answer(method, data))
+
+    def _get_updates(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.polled.set()
+        offset = int(data.get('offset') or 0)
+        deadline = time.monotonic() + float(data.get('timeout') or 0)
+        with self._condition:
+            # updates before offset are confirmed by the bot
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            return self._updates[:int(data.get('limit') or 100)]
+
+    def _answer(self, method: str, data: Dict[str, Any]) -> Any:
+        if method == 'getMe':
+            return BOT_USER
+        chat_id = data.get('chat_id')
+        if not method.startswith('send') and method != 'editMessageText':
+            return True
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        self.sent[chat_id].append((time.perf_counter(), method))
+        message: Dict[str, Any] = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        file = {'file_id': f'file{message["message_id"]}', 'file_unique_id': 'unique'}
+        if method == 'sendPhoto':
+            message['photo'] = [dict(file, width=640, height=480)]
+        elif method == 'sendVoice':
+            message['voice'] = dict(file, duration=1)
+        elif method == 'sendDocument':
+            message['document'] = file
+        else:
+            message['text'] = data.get('text', '')
+        return message
+
+    @staticmethod
+    def _params(request: BaseHTTPRequestHandler) -> Dict[str, Any]:
+        body = read_body(request)
+        if request.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            # uploads, only the chat is needed
+            match = MULTIPART_CHAT_ID.search(body)
+            return {'chat_id': match.group(1).decode()} if match else {}
+        return json.loads(body) if body else {}
+
+    @staticmethod
+    def _ok(result: Any) -> Tuple[int, str, bytes]:
+        return 200, 'application/json', json.dumps({'ok': True, 'result': result}).encode()
+
+
+def fake_update(update_id: int, text: str, chat_id: Optional[int] = None) -> Dict[str, Any]:
+    """ Message with bot command from a private chat """
+    chat_id = update_id if chat_id is None else chat_id
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}],
+        },
+    }
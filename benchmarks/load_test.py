@@ -0,0 +1,235 @@
+"""
+Offline load test of the whole bot: fake Bot API, stub upstreams and synthetic traffic.
+
+    $ python -m benchmarks.load_test --mix ping=80,woof=10,say=5,shot=5 --rate 200 --duration 30
+    $ python -m benchmarks.load_test --api-latency-ms 50 --error-rate 0.01 --env BOT_WORKERS=4
+
+The bot runs as a separate process (`app/main.py`) in polling mode against the local fake
+(`TELEGRAM_API_URL`), random.dog, random.cat, screenshotlayer and Polly are replaced by stubs.
+Updates arrive at a constant `--rate` from distinct users, latency of an update is the time
+from queueing it until the last message sent to its chat. Reported: throughput, latency
+percentiles per command, database writes per second and peak memory of the bot.
+
+Bot API flood limits are lifted by default, pass `--env SEND_LIMIT_TOTAL=30/1` to test with them.
+"""
+import argparse
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from collections import defaultdict
+from contextlib import ExitStack
+from typing import Dict, List, Tuple
+
+from app.dao.db import CommandDao, DataBaseConnector
+from benchmarks.bench_extensions import png
+from benchmarks.fake_telegram import FakeBotApi, fake_update
+from benchmarks.stubs import Route, StubServer, json_route, read_body
+from benchmarks.utils import report, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = '123:load-test'
+WRITES = ('insert', 'update', 'delete')
+
+# command -> text of the message, distinct arguments are limited so caches get some hits
+COMMANDS = {
+    'ping': lambda n: '/ping',
+    'woof': lambda n: '/woof',
+    'meow': lambda n: '/meow',
+    'biba': lambda n: '/biba',
+    'stat': lambda n: '/stat',
+    'help': lambda n: '/help',
+    'say': lambda n: f'/say hello {n % 50}',
+    'shot': lambda n: f'/shot https://example.com/{n % 50}',
+}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """ `ping=80,woof=10,...` to command weights """
+    mix = {}
+    for part in value.split(','):
+        command, _, weight = part.partition('=')
+        assert command in COMMANDS, f"Unknown command {command}!"
+        mix[command] = float(weight or 1)
+    return mix
+
+
+def slow(route: Route, latency: float) -> Route:
+    def handle(request):
+        read_body(request)
+        time.sleep(latency)
+        return route(request)
+    return handle
+
+
+def upstreams(latency: float) -> StubServer:
+    """ random.dog, random.cat, screenshotlayer and Polly on one local server """
+    screenshot = png()
+    audio = b'a' * 16 * 1024
+    return StubServer({
+        '/woof.json': slow(json_route({'url': 'https://random.dog/a.jpg'}), latency),
+        '/meow': slow(json_route({'file': 'https://purr.objects-us-east-1.dream.io/i/a.jpg'}),
+                      latency),
+        '/capture': slow(lambda request: (200, 'image/png', screenshot), latency),
+        '/v1/speech': slow(lambda request: (200, 'audio/ogg', audio), latency),
+    })
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def prepare_database(db_url: str) -> None:
+    """ Statistics are collected only for commands present in the database """
+    dao = CommandDao(DataBaseConnector(db_url))
+    for command_id, name in enumerate(COMMANDS, 1):
+        dao.add(command_id, name)
+
+
+def scrape(port: int) -> Dict[str, float]:
+    """ Samples of bot metrics, `name{labels}` -> value """
+    samples = {}
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+        for line in response.read().decode().splitlines():
+            if line and not line.startswith('#'):
+                name, _, value = line.rpartition(' ')
+                samples[name] = float(value)
+    return samples
+
+
+def db_writes(samples: Dict[str, float]) -> float:
+    return sum(samples.get(f'bot_db_query_seconds_count{{kind="{kind}"}}', 0) for kind in WRITES)
+
+
+def generate(api: FakeBotApi, mix: Dict[str, float], rate: float,
+             duration: float) -> Dict[int, Tuple[str, float]]:
+    """ Queues updates at constant rate, returns update id -> (command, queued at) """
+    commands, weights = list(mix), list(mix.values())
+    queued: Dict[int, Tuple[str, float]] = {}
+    started = time.perf_counter()
+    update_id = 1
+    while update_id <= rate * duration:
+        delay = started + update_id / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        command = random.choices(commands, weights)[0]
+        queued[update_id] = (command, time.perf_counter())
+        api.push(fake_update(update_id, COMMANDS[command](update_id)))
+        update_id += 1
+    return queued
+
+
+def main(
+        mix: Dict[str, float],
+        rate: float,
+        duration: float,
+        drain: float,
+        api_latency: float,
+        upstream_latency: float,
+        error_rate: float,
+        env: Dict[str, str]
+) -> None:
+    metrics_port = free_port()
+    with ExitStack() as stack:
+        directory = stack.enter_context(tempfile.TemporaryDirectory())
+        api = stack.enter_context(FakeBotApi(api_latency, error_rate))
+        stubs = stack.enter_context(upstreams(upstream_latency))
+        db_url = f"sqlite:///{os.path.join(directory, 'bot.db')}"
+        prepare_database(db_url)
+
+        bot_env = dict(
+            os.environ,
+            TELEGRAM_BOT_TOKEN=TOKEN,
+            TELEGRAM_API_URL=api.url,
+            DB_URL=db_url,
+            UPDATE_MODE='polling',
+            METRICS_PORT=str(metrics_port),
+            DOG_PHOTO_URL=f'{stubs.url}/woof.json',
+            CAT_PHOTO_URL=f'{stubs.url}/meow',
+            SCREENSHOT_URL=f'{stubs.url}/capture',
+            SCREENSHOT_API_KEY='load-test',
+            POLLY_ENDPOINT_URL=stubs.url,
+            AWS_ACCESS_KEY_ID='load-test',
+            AWS_SECRET_ACCESS_KEY='load-test',
+            AWS_DEFAULT_REGION='us-east-1',
+            SEND_LIMIT_TOTAL='1000000/1',
+            AUDIO_CACHE_DIR=os.path.join(directory, 'audio'),
+        )
+        bot_env.update(env)
+        log = stack.enter_context(open(os.path.join(directory, 'bot.log'), 'w'))
+        bot = subprocess.Popen([sys.executable, 'main.py'], cwd=os.path.join(ROOT, 'app'),
+                               env=bot_env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            if not api.polled.wait(60):
+                raise RuntimeError('Bot did not start polling')
+            # worker processes (if any) start their metrics servers a bit later
+            time.sleep(1)
+            writes_before = db_writes(scrape(metrics_port))
+
+            print(f'Sending {rate:.0f} updates/s for {duration:.0f} s...')
+            started = time.perf_counter()
+            queued = generate(api, mix, rate, duration)
+            deadline = time.perf_counter() + drain
+            while time.perf_counter() < deadline and len(api.sent) < len(queued):
+                time.sleep(0.1)
+            elapsed = time.perf_counter() - started
+            writes = db_writes(scrape(metrics_port)) - writes_before
+        finally:
+            bot.terminate()
+            bot.wait(60)
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    answered_at = []
+    for update_id, (command, queued_at) in queued.items():
+        sent = api.sent.get(update_id)
+        if sent:
+            answered_at.append(sent[-1][0])
+            latencies[command].append((sent[-1][0] - queued_at) * 1000)
+    answered = sum(len(values) for values in latencies.values())
+    busy = (max(answered_at) - started) if answered_at else elapsed
+
+    report('Latency from queued update until the last reply', {
+        f'{command} ({len(latencies[command])} answered)': summarize(latencies[command])
+        for command in mix if latencies[command]
+    })
+    print(f'Updates: {len(queued)} sent, {answered} answered, {api.errors} Bot API errors injected')
+    print(f'Throughput: {answered / busy:.1f} updates/s')
+    print(f'Database writes: {writes / busy:.1f}/s (with BOT_WORKERS > 1 only ingress process)')
+    print(f'Peak memory of bot process: {peak_rss / 1024:.1f} MiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', default='ping=80,woof=10,say=5,shot=5',
+                        help=f"weights of commands: {', '.join(COMMANDS)}")
+    parser.add_argument('--rate', type=float, default=100, help='updates per second')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of sending updates')
+    parser.add_argument('--drain', type=float, default=30,
+                        help='seconds to wait for replies after the last update')
+    parser.add_argument('--api-latency-ms', type=float, default=20)
+    parser.add_argument('--upstream-latency-ms', type=float, default=100)
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of Bot API calls failing with 500')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='bot setting, e.g. EXECUTION_MODE=async or BOT_WORKERS=4')
+    args = parser.parse_args()
+    main(
+        parse_mix(args.mix),
+        rate=args.rate,
+        duration=args.duration,
+        drain=args.drain,
+        api_latency=args.api_latency_ms / 1000,
+        upstream_latency=args.upstream_latency_ms / 1000,
+        error_rate=args.error_rate,
+        env=dict(value.split('=', 1) for value in args.env),
+    )
@@ -0,0 +1,94 @@
+"""
+Runs benchmark suites, writes machine-readable results and compares them with a baseline.
+
+    $ python -m benchmarks.run --output results.json
+    $ python -m benchmarks.run --suite dao --quick
+
+Exits with code 1 when some benchmark got slower than the baseline by more than `--threshold`.
+Baseline is measured on a particular machine, refresh it after intended changes of
+performance (or when comparing on another machine) with `--save-baseline`.
+"""
+import argparse
+import os
+import sys
+
+from typing import Callable, Dict
+
+from benchmarks import bench_dao, bench_dispatch, bench_extensions
+from benchmarks.utils import (
+    Results,
+    compare,
+    environment,
+    load_results,
+    report,
+    report_comparison,
+    save_results,
+)
+
+SUITES: Dict[str, Callable[[bool], Dict[str, Dict[str, float]]]] = {
+    'dao': bench_dao.run,
+    'dispatch': bench_dispatch.run,
+    'extensions': bench_extensions.run,
+}
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def main(
+        suites: list,
+        output: str,
+        baseline: str = BASELINE,
+        threshold: float = 0.5,
+        quick: bool = False,
+        save_baseline: bool = False
+) -> int:
+    results: Results = {}
+    for suite in suites:
+        results[suite] = SUITES[suite](quick)
+        report(suite, results[suite])
+
+    save_results(output, results)
+    print(f'Results written to {output}')
+
+    if save_baseline:
+        if os.path.exists(baseline):
+            # keep suites which were not run this time
+            stored = load_results(baseline)['results']
+            stored.update(results)
+            results = stored
+        save_results(baseline, results)
+        print(f'Baseline written to {baseline}')
+        return 0
+
+    if not os.path.exists(baseline):
+        print(f'No baseline at {baseline}, run with --save-baseline to create it')
+        return 0
+
+    stored = load_results(baseline)
+    if stored['environment'] != environment():
+        print(f"Baseline was measured in another environment: {stored['environment']}")
+    rows = compare(stored['results'], results, threshold)
+    report_comparison(rows)
+    regressions = [row for row in rows if row['regression']]
+    if regressions:
+        print(f'{len(regressions)} benchmark(s) slower than baseline by more than '
+              f'{threshold:.0%}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', action='append', choices=sorted(SUITES),
+                        help='suite to run, all by default (can be repeated)')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='allowed slowdown of p50 latency, 0.5 means 50%%')
+    parser.add_argument('--quick', action='store_true', help='smaller datasets and fewer calls')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store results as the new baseline instead of comparing')
+    args = parser.parse_args()
+    sys.exit(main(args.suite or sorted(SUITES), args.output, args.baseline, args.threshold,
+                  args.quick, args.save_baseline))
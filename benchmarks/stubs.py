@@ -0,0 +1,65 @@
+"""
+Local stub servers for upstreams used by extensions.
+"""
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+Route = Callable[[BaseHTTPRequestHandler], Tuple[int, str, bytes]]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like real upstreams
+    disable_nagle_algorithm = True
+    routes: Dict[str, Route] = {}
+
+    def do_GET(self):
+        # `*` route handles every path without own route
+        route = self.routes.get(self.path.split('?')[0]) or self.routes.get('*')
+        status, content_type, body = route(self) if route else (404, 'text/plain', b'')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+def read_body(request: BaseHTTPRequestHandler) -> bytes:
+    """ Body of POST request, routes must read it to keep the connection usable """
+    return request.rfile.read(int(request.headers.get('Content-Length') or 0))
+
+
+def json_route(payload: Dict) -> Route:
+    body = json.dumps(payload).encode()
+    return lambda request: (200, 'application/json', body)
+
+
+class StubServer:
+    """ Serves `routes` on a random local port in a background thread """
+
+    def __init__(self, routes: Dict[str, Route]) -> None:
+        handler = type('Handler', (StubHandler,), {'routes': routes})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self) -> 'StubServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._server.shutdown()
+        self._server.server_close()
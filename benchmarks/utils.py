@@ -0,0 +1,104 @@
+"""
+Helpers shared by benchmarks.
+"""
+import json
+import platform
+import statistics
+import sys
+import time
+
+from typing import Any, Callable, Dict, List
+
+Results = Dict[str, Dict[str, Dict[str, float]]]
+
+
+def measure(fn: Callable[[], object], repeat: int = 100, warmup: int = 1) -> Dict[str, float]:
+    """ Calls `fn` `repeat` times and returns timing summary in milliseconds """
+    for _ in range(warmup):
+        fn()
+    timings: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return summarize(timings)
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """ Timing summary of measurements in milliseconds """
+    timings = sorted(timings)
+    return {
+        'calls': len(timings),
+        'mean_ms': statistics.mean(timings),
+        'p50_ms': timings[len(timings) // 2],
+        'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def report(title: str, results: Dict[str, Dict[str, float]]) -> None:
+    print(title)
+    for name, result in results.items():
+        print(f"  {name:<56} mean {result['mean_ms']:8.3f} ms   p50 {result['p50_ms']:8.3f} ms"
+              f"   p99 {result['p99_ms']:8.3f} ms")
+
+
+def save_results(path: str, results: Results) -> None:
+    """ Writes results of suites with the environment they were measured in """
+    with open(path, 'w') as file:
+        json.dump({
+            'environment': environment(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, file, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path) as file:
+        return json.load(file)
+
+
+def environment() -> Dict[str, str]:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'implementation': sys.implementation.name,
+    }
+
+
+def compare(
+        baseline: Results,
+        results: Results,
+        threshold: float = 0.5,
+        metric: str = 'p50_ms'
+) -> List[Dict[str, Any]]:
+    """
+    Compares `metric` of benchmarks present in both results.
+
+    Benchmark is a regression when it got slower than baseline by more than `threshold`.
+    """
+    rows = []
+    for suite, cases in results.items():
+        for name, result in cases.items():
+            base = baseline.get(suite, {}).get(name)
+            if base is None:
+                continue
+            ratio = result[metric] / base[metric] if base[metric] else 1.0
+            rows.append({
+                'suite': suite,
+                'name': name,
+                'baseline_ms': base[metric],
+                'current_ms': result[metric],
+                'ratio': ratio,
+                'regression': ratio > 1 + threshold,
+                'improvement': ratio < 1 / (1 + threshold),
+            })
+    return rows
+
+
+def report_comparison(rows: List[Dict[str, Any]], metric: str = 'p50_ms') -> None:
+    print(f'Comparison with baseline ({metric})')
+    for row in rows:
+        mark = 'REGRESSION' if row['regression'] else 'improved' if row['improvement'] else ''
+        print(f"  {row['suite'] + ': ' + row['name']:<60} {row['baseline_ms']:9.3f} ms -> "
+              f"{row['current_ms']:9.3f} ms  x{row['ratio']:5.2f}  {mark}")